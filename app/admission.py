@@ -0,0 +1,226 @@
+import asyncio
+import json
+import time
+from collections import deque
+from fnmatch import fnmatchcase
+from typing import Deque, Dict, Optional
+
+from prometheus_client import Counter, Gauge
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import logger, settings
+from app.database import pool_wait_listeners
+
+# Приоритеты от высшего к низшему: освободившееся место получает самый приоритетный из ждущих
+PRIORITIES = ("high", "normal", "low")
+# Период полураспада среднего ожидания пула без новых замеров, секунды
+POOL_WAIT_HALF_LIFE = 1.0
+# Вес нового замера в среднем ожидании пула
+POOL_WAIT_ALPHA = 0.2
+
+admission_in_flight = Gauge("admission_in_flight", "Запросы к API, которые обрабатываются сейчас")
+admission_queue_depth = Gauge("admission_queue_depth", "Запросы к API, ждущие свободного места", ["priority"])
+admission_shed = Counter("admission_shed_total", "Запросы к API, отклоненные ответом 503", ["priority", "reason"])
+admission_pool_wait = Gauge("admission_pool_wait_seconds", "Среднее ожидание соединения из пула БД")
+
+
+def priority_of(method: str, path: str) -> Optional[str]:
+    """
+    Приоритет запроса по шаблонам "МЕТОД путь" из настроек.
+
+    :param method: HTTP-метод.
+    :param path: Путь запроса.
+    :return: high, normal или low; None - запрос не учитывается.
+    """
+    target = f"{method} {path}"
+    if any(fnmatchcase(target, pattern) for pattern in settings.ADMISSION_EXEMPT):
+        return None
+    for priority, patterns in settings.ADMISSION_PRIORITIES.items():
+        if any(fnmatchcase(target, pattern) for pattern in patterns):
+            return priority
+    return "normal"
+
+
+class AdmissionController:
+    """
+    Допуск запросов к обработке с учетом приоритета и загрузки пула БД.
+
+    Одновременно обрабатывается не больше ``max_in_flight`` запросов. Запрос
+    сверх лимита ждет места в очереди своего приоритета не дольше его
+    таймаута, освободившееся место отдается самому приоритетному из ждущих,
+    а кто не дождался - отклоняется. Пока среднее ожидание соединения из пула
+    выше ``pool_wait_limit``, запросы низкого приоритета (дорогие чтения)
+    отклоняются сразу: место в пуле нужнее лайкам и авторизации.
+
+    Attributes:
+        max_in_flight (int): Сколько запросов обрабатывается одновременно.
+        max_queue (int): Сколько запросов может ждать места.
+        queue_timeouts (Dict[str, float]): Сколько секунд ждет запрос каждого приоритета.
+        pool_wait_limit (float): Среднее ожидание пула, выше которого отклоняется низкий приоритет.
+        in_flight (int): Запросы, которые обрабатываются сейчас.
+    """
+
+    def __init__(
+        self, max_in_flight: int, max_queue: int, queue_timeouts: Dict[str, float], pool_wait_limit: float
+    ) -> None:
+        """
+        Создает контроллер без запросов.
+
+        :param max_in_flight: Сколько запросов обрабатывается одновременно.
+        :param max_queue: Сколько запросов может ждать места.
+        :param queue_timeouts: Сколько секунд ждет запрос каждого приоритета.
+        :param pool_wait_limit: Среднее ожидание пула, выше которого отклоняется низкий приоритет.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeouts = queue_timeouts
+        self.pool_wait_limit = pool_wait_limit
+        self.in_flight = 0
+        self._queues: Dict[str, Deque[asyncio.Future[None]]] = {priority: deque() for priority in PRIORITIES}
+        self._pool_wait = 0.0
+        self._pool_wait_at = time.monotonic()
+
+    @property
+    def queued(self) -> int:
+        """Количество ждущих запросов."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def pool_wait(self) -> float:
+        """Среднее ожидание соединения из пула, затухающее, пока замеров нет."""
+        return self._pool_wait * 0.5 ** ((time.monotonic() - self._pool_wait_at) / POOL_WAIT_HALF_LIFE)
+
+    def observe_pool_wait(self, seconds: float) -> None:
+        """
+        Учесть замер ожидания соединения из пула.
+
+        :param seconds: Сколько запрос ждал соединения.
+        """
+        self._pool_wait = self.pool_wait * (1 - POOL_WAIT_ALPHA) + seconds * POOL_WAIT_ALPHA
+        self._pool_wait_at = time.monotonic()
+        admission_pool_wait.set(self._pool_wait)
+
+    def _ahead(self, priority: str) -> bool:
+        """Есть ли ждущие запросы того же или более высокого приоритета."""
+        for other in PRIORITIES:
+            if self._queues[other]:
+                return True
+            if other == priority:
+                return False
+        return False
+
+    async def admit(self, priority: str) -> Optional[str]:
+        """
+        Занять место для запроса, при необходимости подождав в очереди.
+
+        :param priority: Приоритет запроса.
+        :return: None, если запрос допущен (место освобождает release()), иначе причина отказа.
+        """
+        if priority == "low" and self.pool_wait > self.pool_wait_limit:
+            return "pool_wait"
+        if self.in_flight < self.max_in_flight and not self._ahead(priority):
+            self.in_flight += 1
+            admission_in_flight.set(self.in_flight)
+            return None
+        timeout = self.queue_timeouts.get(priority, 0.0)
+        if timeout <= 0 or self.queued >= self.max_queue:
+            return "in_flight"
+        queue = self._queues[priority]
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        admission_queue_depth.labels(priority).set(len(queue))
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return None
+        except asyncio.TimeoutError:
+            # release() мог отдать место в том же шаге цикла, что и сработавший таймаут:
+            # запрос уже допущен, иначе место потеряется навсегда
+            if waiter.done() and not waiter.cancelled():
+                return None
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            # Место могли отдать в момент отмены: возвращаем его следующему
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in queue:
+                queue.remove(waiter)
+            admission_queue_depth.labels(priority).set(len(queue))
+
+    def release(self) -> None:
+        """Освободить место: отдать его самому приоритетному из ждущих или уменьшить счетчик."""
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue:
+                waiter = queue.popleft()
+                admission_queue_depth.labels(priority).set(len(queue))
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.in_flight -= 1
+        admission_in_flight.set(self.in_flight)
+
+
+class AdmissionMiddleware:
+    """
+    ASGI-middleware: запросы к API сверх допустимой нагрузки сразу получают 503 с Retry-After.
+
+    Без контроля допуска uvicorn принимает все запросы, они копятся в очереди
+    пула БД и под перегрузкой заканчиваются таймаутом все разом. Отклоненный
+    сразу запрос ничего не стоит, а допущенные обрабатываются с прежней
+    задержкой. Учитываются только пути /api, кроме ADMISSION_EXEMPT.
+    """
+
+    def __init__(self, app: ASGIApp, controller: Optional[AdmissionController] = None) -> None:
+        """
+        Оборачивает приложение.
+
+        :param app: ASGI-приложение.
+        :param controller: Контроллер допуска, по умолчанию - общий для процесса.
+        """
+        self.app = app
+        self.controller = admission if controller is None else controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Допускает запрос к обработке или отвечает 503."""
+        priority = None
+        if scope["type"] == "http" and settings.ADMISSION_ENABLED and scope["path"].startswith("/api/"):
+            priority = priority_of(scope["method"], scope["path"])
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+        reason = await self.controller.admit(priority)
+        if reason is not None:
+            admission_shed.labels(priority, reason).inc()
+            logger.warning(f"Перегрузка ({reason}), запрос {scope['method']} {scope['path']} отклонен")
+            await self._send_overloaded(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
+
+    @staticmethod
+    async def _send_overloaded(send: Send) -> None:
+        """Отправить ответ 503 в формате ошибок API."""
+        body = json.dumps(
+            {"result": False, "error_type": "Overloaded", "error_message": "Сервер перегружен, повторите позже"},
+            ensure_ascii=False,
+        ).encode()
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(settings.ADMISSION_RETRY_AFTER).encode()),
+        ]
+        await send({"type": "http.response.start", "status": 503, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+admission = AdmissionController(
+    settings.ADMISSION_MAX_IN_FLIGHT,
+    settings.ADMISSION_MAX_QUEUE,
+    settings.ADMISSION_QUEUE_TIMEOUTS,
+    settings.ADMISSION_POOL_WAIT_LIMIT,
+)
+pool_wait_listeners.append(admission.observe_pool_wait)
@@ -1,5 +1,6 @@
 import os
 import sys
+from typing import Dict, List, Literal, Tuple
 
 from loguru import logger
 from pydantic import SecretStr, ValidationError
@@ -49,8 +50,74 @@ class Settings(BaseSettings):
         DB_PORT (int): Порт базы данных.
         DB_NAME (str): Имя основной базы данных.
         DB_TEST (str): Имя тестовой базы данных.
-        UPLOAD_DIRECTORY (str): Директория для загрузки файлов.
+        UPLOAD_DIRECTORY (str): Префикс адреса загруженных файлов в БД, сами файлы лежат в media_path().
         PYTHONPATH (str): Путь к Python.
+        PROFILE_FOLLOWS_PREVIEW (int): Сколько подписчиков и подписок отдавать в профиле пользователя.
+        LIKES_WRITE_BEHIND (bool): Копить лайки в памяти и записывать их в БД пачками.
+        LIKES_FLUSH_INTERVAL_MS (int): Интервал сброса буфера лайков в миллисекундах.
+        LIKES_BUFFER_MAX (int): Размер буфера лайков, при котором он сбрасывается досрочно.
+        DEBUG (bool): Режим отладки FastAPI.
+        DB_MIGRATE_ON_STARTUP (bool): Применять миграции alembic при запуске приложения.
+        DB_SEED_ON_STARTUP (bool): Пересоздавать таблицы и заполнять БД тестовыми данными при запуске.
+        DB_POOL_SIZE (int): Размер пула соединений с БД в каждом процессе.
+        DB_MAX_OVERFLOW (int): Сколько соединений сверх пула можно открыть при нагрузке.
+        SERVER_HOST (str): Адрес, на котором слушает продакшн-сервер.
+        SERVER_PORT (int): Порт продакшн-сервера.
+        SERVER_WORKERS (int): Количество процессов-воркеров, 0 - по числу доступных ядер.
+        SERVER_LOOP (str): Реализация event loop для uvicorn.
+        SERVER_HTTP (str): Реализация HTTP-парсера для uvicorn.
+        SERVER_BACKLOG (int): Длина очереди ожидающих TCP-соединений.
+        SERVER_KEEP_ALIVE (int): Сколько секунд держать простаивающее keep-alive соединение.
+        SERVER_FORWARDED_ALLOW_IPS (str): Адреса и подсети прокси через запятую, чьим X-Forwarded-For доверять.
+        DB_REPLICA_HOSTS (str): Хосты реплик для чтения через запятую (host или host:port), пусто - без реплик.
+        DB_READ_YOUR_WRITES_SECONDS (float): Сколько секунд после записи читать данные пользователя с основной БД.
+        REAPER_ENABLED (bool): Запускать фоновую очистку мягко удаленных пользователей и твитов.
+        REAPER_INTERVAL_SECONDS (float): Пауза фоновой очистки, когда удалять нечего.
+        REAPER_BATCH_SIZE (int): Сколько строк фоновая очистка удаляет за один шаг.
+        MEDIA_GC_ENABLED (bool): Запускать сборщик мусора для медиафайлов без твитов.
+        MEDIA_GC_INTERVAL_SECONDS (float): Пауза между запусками сборщика мусора медиафайлов.
+        MEDIA_GC_GRACE_SECONDS (float): Сколько секунд загруженное медиа ждет твита, прежде чем считаться мусором.
+        MEDIA_GC_BATCH_SIZE (int): Сколько медиафайлов сборщик мусора удаляет за одну пачку.
+        MEDIA_MAX_BYTES (int): Максимальный размер загружаемого файла в байтах.
+        MEDIA_MAX_SIDE (int): Максимальная ширина и высота изображения в пикселях.
+        MEDIA_MAX_PIXELS (int): Максимальное количество пикселей изображения.
+        MEDIA_WORKERS (int): Количество процессов для проверки загружаемых медиафайлов.
+        MEDIA_QUEUE_SIZE (int): Сколько загрузок может ждать проверки, прежде чем сервер ответит 429.
+        MEDIA_URL_SECRET (SecretStr): Ключ подписи URL медиафайлов, пусто - выводится из пароля БД.
+        MEDIA_X_ACCEL_REDIRECT (bool): Отдавать файлы медиа через nginx (X-Accel-Redirect), а не из приложения.
+        MEDIA_X_ACCEL_PREFIX (str): Внутренний (internal) location nginx с загруженными медиафайлами.
+        RATE_LIMIT_ENABLED (bool): Ограничивать частоту запросов по api-key.
+        RATE_LIMIT_BACKEND (str): Хранилище корзин токенов: memory (в процессе) или redis (общее для воркеров).
+        RATE_LIMIT_REDIS_URL (str): Адрес сервера Redis для хранилища redis.
+        RATE_LIMIT_REDIS_TIMEOUT (float): Сколько секунд ждать Redis, прежде чем пропустить запрос без лимита.
+        RATE_LIMITS (Dict[str, Tuple[float, int]]): Лимиты по классам маршрутов: (запросов в секунду, всплеск).
+        RATE_LIMIT_IP_FACTOR (float): Во сколько раз лимит одного IP больше лимита одного api-key.
+        EVENTS_PG_NOTIFY (bool): Рассылать события ленты всем воркерам через Postgres LISTEN/NOTIFY, иначе - только своему.
+        EVENTS_QUEUE_SIZE (int): Сколько событий может ждать медленный клиент потока, прежде чем его отключат.
+        EVENTS_HEARTBEAT_SECONDS (float): Интервал пустых сообщений в потоке событий ленты.
+        INVALIDATION_PG_NOTIFY (bool): Сообщать другим воркерам об изменениях строк через Postgres NOTIFY.
+        TRENDING_K (int): Сколько твитов в топе популярных (общем и у каждого автора).
+        TRENDING_GRAVITY (float): Затухание рейтинга популярности с возрастом твита, 0 - только число лайков.
+        TRENDING_REFRESH_SECONDS (float): Как часто пересчитывать топ при затухании рейтинга.
+        TRENDING_RELOAD_SECONDS (float): Как часто перезагружать доску популярных твитов из БД.
+        USER_DIRECTORY_MAX (int): Сколько имен пользователей держать в кэше процесса.
+        SNAPSHOT_API_KEYS (List[str]): api-key, чьи GET-ответы кэшируются готовыми снимками.
+        SNAPSHOT_PATHS (List[str]): Шаблоны путей (fnmatch), ответы которых кэшируются снимками.
+        SNAPSHOT_MAX_ENTRIES (int): Сколько снимков ответов держать в памяти процесса.
+        SNAPSHOT_MAX_BYTES (int): Ответы длиннее не кэшируются снимками.
+        DB_STATEMENT_TIMEOUT_MS (int): Лимит времени запроса читающих методов DAO на стороне Postgres, 0 - без лимита.
+        DB_STATEMENT_TIMEOUTS_MS (Dict[str, int]): Лимиты отдельных методов DAO ("TweetDAO.find_all") в мс.
+        CANCEL_ON_DISCONNECT (bool): Прерывать GET-запрос и его запрос к БД, если клиент отключился.
+        ADMISSION_ENABLED (bool): Отклонять запросы сверх допустимой нагрузки ответом 503 до обращения к БД.
+        ADMISSION_MAX_IN_FLIGHT (int): Сколько запросов к API воркер обрабатывает одновременно.
+        ADMISSION_MAX_QUEUE (int): Сколько запросов может ждать свободного места, остальные отклоняются сразу.
+        ADMISSION_QUEUE_TIMEOUTS (Dict[str, float]): Сколько секунд запрос каждого приоритета ждет места.
+        ADMISSION_POOL_WAIT_LIMIT (float): Среднее ожидание соединения из пула, при котором отклоняются дорогие чтения.
+        ADMISSION_PRIORITIES (Dict[str, List[str]]): Шаблоны "МЕТОД путь" (fnmatch) высокого и низкого приоритета.
+        ADMISSION_EXEMPT (List[str]): Шаблоны "МЕТОД путь" долгих запросов, которые не учитываются.
+        ADMISSION_RETRY_AFTER (int): Значение Retry-After в ответе 503, секунды.
+        SINGLE_FLIGHT_ENABLED (bool): Объединять одинаковые одновременные чтения DAO в один запрос к БД.
+        SINGLE_FLIGHT_WINDOW_MS (int): Сколько мс отдавать готовый результат объединенного чтения, 0 - не хранить.
     """
 
     DB_USER: str
@@ -61,6 +128,91 @@ class Settings(BaseSettings):
     DB_TEST: str
     UPLOAD_DIRECTORY: str
     PYTHONPATH: str
+    PROFILE_FOLLOWS_PREVIEW: int = 100
+    LIKES_WRITE_BEHIND: bool = False
+    LIKES_FLUSH_INTERVAL_MS: int = 200
+    LIKES_BUFFER_MAX: int = 10000
+    DEBUG: bool = False
+    DB_MIGRATE_ON_STARTUP: bool = True
+    DB_SEED_ON_STARTUP: bool = True
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 0
+    SERVER_LOOP: Literal["auto", "asyncio", "uvloop"] = "uvloop"
+    SERVER_HTTP: Literal["auto", "h11", "httptools"] = "httptools"
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEP_ALIVE: int = 5
+    SERVER_FORWARDED_ALLOW_IPS: str = "127.0.0.1"
+    DB_REPLICA_HOSTS: str = ""
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0
+    REAPER_ENABLED: bool = True
+    REAPER_INTERVAL_SECONDS: float = 5.0
+    REAPER_BATCH_SIZE: int = 1000
+    MEDIA_GC_ENABLED: bool = True
+    MEDIA_GC_INTERVAL_SECONDS: float = 600.0
+    MEDIA_GC_GRACE_SECONDS: float = 86400.0
+    MEDIA_GC_BATCH_SIZE: int = 500
+    MEDIA_MAX_BYTES: int = 10 * 1024 * 1024
+    MEDIA_MAX_SIDE: int = 8192
+    MEDIA_MAX_PIXELS: int = 40_000_000
+    MEDIA_WORKERS: int = 2
+    MEDIA_QUEUE_SIZE: int = 16
+    MEDIA_URL_SECRET: SecretStr = SecretStr("")
+    MEDIA_X_ACCEL_REDIRECT: bool = False
+    MEDIA_X_ACCEL_PREFIX: str = "/protected/images/"
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: Literal["memory", "redis"] = "memory"
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/0"
+    RATE_LIMIT_REDIS_TIMEOUT: float = 0.5
+    RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+        "read": (50.0, 100),
+        "write": (5.0, 20),
+        "like": (10.0, 50),
+        "media": (2.0, 10),
+    }
+    RATE_LIMIT_IP_FACTOR: float = 4.0
+    EVENTS_PG_NOTIFY: bool = True
+    EVENTS_QUEUE_SIZE: int = 100
+    EVENTS_HEARTBEAT_SECONDS: float = 15.0
+    INVALIDATION_PG_NOTIFY: bool = True
+    TRENDING_K: int = 50
+    TRENDING_GRAVITY: float = 0.0
+    TRENDING_REFRESH_SECONDS: float = 60.0
+    TRENDING_RELOAD_SECONDS: float = 600.0
+    USER_DIRECTORY_MAX: int = 100_000
+    SNAPSHOT_API_KEYS: List[str] = ["test"]
+    SNAPSHOT_PATHS: List[str] = [
+        "/api/tweets",
+        "/api/tweets/trending",
+        "/api/users/me",
+        "/api/users/me/recommendations",
+        "/api/users/[0-9]*",
+    ]
+    SNAPSHOT_MAX_ENTRIES: int = 256
+    SNAPSHOT_MAX_BYTES: int = 4 * 1024 * 1024
+    DB_STATEMENT_TIMEOUT_MS: int = 5000
+    DB_STATEMENT_TIMEOUTS_MS: Dict[str, int] = {
+        "TweetDAO.find_all": 3000,
+        "UserDAO.user_info": 2000,
+        "FollowCandidateDAO.recommendations": 2000,
+        "TweetDAO.popularity": 30000,
+    }
+    CANCEL_ON_DISCONNECT: bool = True
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_IN_FLIGHT: int = 32
+    ADMISSION_MAX_QUEUE: int = 128
+    ADMISSION_QUEUE_TIMEOUTS: Dict[str, float] = {"high": 2.0, "normal": 0.5, "low": 0.1}
+    ADMISSION_POOL_WAIT_LIMIT: float = 0.1
+    ADMISSION_PRIORITIES: Dict[str, List[str]] = {
+        "high": ["* /api/tweets/*/likes", "GET /api/users", "POST /api/users"],
+        "low": ["GET /api/tweets", "GET /api/all_users", "GET /api/users/me/recommendations"],
+    }
+    ADMISSION_EXEMPT: List[str] = ["GET /api/tweets/stream"]
+    ADMISSION_RETRY_AFTER: int = 1
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_WINDOW_MS: int = 100
 
     model_config = SettingsConfigDict(extra="ignore")
 
@@ -86,11 +238,33 @@ class Settings(BaseSettings):
             f"{self.DB_HOST}:{self.DB_PORT}/{self.DB_TEST}"
         )
 
+    def get_replica_db_urls(self) -> List[str]:
+        """
+        Получает URL реплик основной базы данных для чтения.
+
+        Реплики используют те же пользователя, пароль и имя БД, что и основная база.
+
+        :return: Список URL реплик, пустой если реплики не настроены.
+        """
+        urls = []
+        for host in filter(None, (host.strip() for host in self.DB_REPLICA_HOSTS.split(","))):
+            host, _, port = host.partition(":")
+            urls.append(
+                f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD.get_secret_value()}@"
+                f"{host}:{port or self.DB_PORT}/{self.DB_NAME}"
+            )
+        return urls
+
     @classmethod
     def static_path(cls) -> str:
         """Путь к директории для статических файлов."""
         return os.path.join(os.path.dirname(__file__), "static")
 
+    @classmethod
+    def media_path(cls) -> str:
+        """Путь к директории загруженных медиафайлов: вне статических файлов, доступна только по подписанному URL."""
+        return os.path.join(os.path.dirname(__file__), "media")
+
     @classmethod
     def template_path(cls) -> str:
         """Возвращает путь к директории для файлов HTML."""
@@ -1,14 +1,60 @@
-from typing import Any, Generic, List, Sequence, Type, TypeVar
+from functools import wraps
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Generic, List, Optional, Sequence, Type, TypeVar, cast
 
-from sqlalchemy import delete as sqlalchemy_delete, update as sqlalchemy_update
+from sqlalchemy import (
+    ColumnElement,
+    Row,
+    Select,
+    delete as sqlalchemy_delete,
+    func,
+    inspect,
+    tuple_,
+    update as sqlalchemy_update,
+)
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from app.config import settings
 from app.database import Base
+from app.invalidation import ALL, invalidation, row_key
 
 # Определяем тип переменной для модели
 M = TypeVar("M", bound=Base)
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+def statement_timeout(method: F) -> F:
+    """
+    Ограничить время запросов читающего метода DAO на стороне Postgres.
+
+    Перед вызовом метода в транзакции сессии выполняется
+    ``set_config('statement_timeout', ..., true)`` (аналог SET LOCAL): лимит
+    действует до конца транзакции и не переживает возврат соединения в пул.
+    Запрос дольше лимита Postgres прерывает сам (SQLSTATE 57014), и соединение
+    освобождается, даже если клиент давно ушел. Лимит берется из
+    DB_STATEMENT_TIMEOUTS_MS по имени "КлассDAO.метод", иначе
+    DB_STATEMENT_TIMEOUT_MS; 0 - без лимита.
+
+    Подходит только для методов, которые сами не открывают транзакцию
+    (``session.begin()``): транзакция к их вызову уже начата.
+
+    :param method: Метод класса DAO, первый аргумент которого - async_session.
+    :return: Метод с лимитом времени запросов.
+    """
+
+    @wraps(method)
+    async def wrapper(cls: Any, async_session: AsyncSession, *args: Any, **kwargs: Any) -> Any:
+        timeout = settings.DB_STATEMENT_TIMEOUTS_MS.get(
+            f"{cls.__name__}.{method.__name__}", settings.DB_STATEMENT_TIMEOUT_MS
+        )
+        if timeout > 0:
+            await async_session.execute(select(func.set_config("statement_timeout", str(timeout), True)))
+        return await method(cls, async_session, *args, **kwargs)
+
+    return cast(F, wrapper)
 
 
 class BaseDAO(Generic[M]):
@@ -21,6 +67,41 @@ class BaseDAO(Generic[M]):
     model: Type[M]  # Указываем, что model будет типа M
 
     @classmethod
+    def _visible(cls, query: Select[Any]) -> Select[Any]:
+        """
+        Скрывает мягко удаленные строки, если у модели есть колонка deleted_at.
+
+        :param query: Запрос SELECT.
+        :return: Запрос с условием deleted_at IS NULL или исходный запрос.
+        """
+        deleted_at = getattr(cls.model, "deleted_at", None)
+        return query if deleted_at is None else query.where(deleted_at.is_(None))
+
+    @classmethod
+    def _keys(cls, rows: Sequence[Any]) -> List[str]:
+        """
+        Ключи строк для шины инвалидации.
+
+        :param rows: Строки с колонками первичного ключа (результат RETURNING).
+        :return: Ключи вида "5" или "5,3" для составного ключа.
+        """
+        pk = [column.key for column in cls.model.__table__.primary_key.columns]
+        return [row_key([getattr(row, column) for column in pk]) for row in rows]
+
+    @classmethod
+    def _invalidate(cls, keys: Sequence[str]) -> None:
+        """
+        Сбросить локальные кэши измененных строк после COMMIT.
+
+        Другие воркеры получат те же ключи через NOTIFY, отправленный в транзакции записи.
+
+        :param keys: Ключи измененных строк.
+        """
+        if keys:
+            invalidation.dispatch(cls.model.__tablename__, invalidation.compact(keys))
+
+    @classmethod
+    @statement_timeout
     async def find_all(cls, async_session: AsyncSession, **filter_by) -> Sequence[M] | None:
         """
         Получение списка всех строк таблицы.
@@ -30,10 +111,83 @@ class BaseDAO(Generic[M]):
         :return: Список экземпляров модели.
         """
         async with async_session as session:
-            query = select(cls.model).filter_by(**filter_by)
+            query = cls._visible(select(cls.model).filter_by(**filter_by))
             result = await session.execute(query)
             return result.scalars().all()
 
+    @classmethod
+    def _rows_query(cls, columns: Sequence[str], **filter_by) -> Select[Any]:
+        """
+        Запрос выбранных колонок, упорядоченный по первичному ключу.
+
+        :param columns: Имена колонок, которые нужно выбрать.
+        :param filter_by: Фильтры для выборки.
+        :return: Запрос SELECT.
+        """
+        return cls._visible(
+            select(*[getattr(cls.model, column) for column in columns])
+            .filter_by(**filter_by)
+            .order_by(*cls.model.__table__.primary_key.columns)
+        )
+
+    @classmethod
+    @statement_timeout
+    async def find_rows(
+        cls,
+        async_session: AsyncSession,
+        columns: Sequence[str],
+        after_id: Optional[Any] = None,
+        limit: Optional[int] = None,
+        **filter_by,
+    ) -> Sequence[Row[Any]]:
+        """
+        Получение только выбранных колонок таблицы без создания экземпляров модели.
+
+        Строки не попадают в identity map сессии и не инструментируются ORM,
+        поэтому метод подходит для эндпоинтов, которые только читают данные.
+        Возвращаемые строки поддерживают доступ к полям через атрибуты и
+        валидируются схемами с ``from_attributes=True`` напрямую.
+        Для постраничной выборки используется keyset-пагинация по первому
+        столбцу первичного ключа: ``after_id`` — последний ключ предыдущей страницы.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param columns: Имена колонок, которые нужно выбрать.
+        :param after_id: Значение ключа, после которого начинается страница.
+        :param limit: Максимальное количество строк.
+        :param filter_by: Фильтры для выборки.
+        :return: Список легковесных строк в порядке первичного ключа.
+        """
+        async with async_session as session:
+            query = cls._rows_query(columns, **filter_by)
+            if after_id is not None:
+                query = query.where(list(cls.model.__table__.primary_key.columns)[0] > after_id)
+            if limit is not None:
+                query = query.limit(limit)
+            result = await session.execute(query)
+            return result.all()
+
+    @classmethod
+    async def stream_rows(
+        cls, async_session: AsyncSession, columns: Sequence[str], batch_size: int = 1000, **filter_by
+    ) -> AsyncIterator[Row[Any]]:
+        """
+        Потоковое чтение выбранных колонок через серверный курсор.
+
+        Строки забираются из БД пачками по ``batch_size``, поэтому память
+        не растет с размером таблицы.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param columns: Имена колонок, которые нужно выбрать.
+        :param batch_size: Размер пачки, которую курсор забирает за раз.
+        :param filter_by: Фильтры для выборки.
+        :return: Асинхронный итератор строк в порядке первичного ключа.
+        """
+        async with async_session as session:
+            query = cls._rows_query(columns, **filter_by).execution_options(yield_per=batch_size)
+            result = await session.stream(query)
+            async for row in result:
+                yield row
+
     @classmethod
     async def find_one_or_none_by_id(cls, async_session: AsyncSession, data_id: int) -> M | None:
         """
@@ -44,7 +198,7 @@ class BaseDAO(Generic[M]):
         :return: Экземпляр модели.
         """
         async with async_session as session:
-            query = select(cls.model).filter_by(id=data_id)
+            query = cls._visible(select(cls.model).filter_by(id=data_id))
             result = await session.execute(query)
             return result.unique().scalar_one_or_none()
 
@@ -58,7 +212,7 @@ class BaseDAO(Generic[M]):
         :return: Экземпляр модели.
         """
         async with async_session as session:
-            query = select(cls.model).filter_by(**filter_by)
+            query = cls._visible(select(cls.model).filter_by(**filter_by))
             result = await session.execute(query)
             return result.scalar_one_or_none()
 
@@ -76,11 +230,47 @@ class BaseDAO(Generic[M]):
                 new_instance = cls.model(**values)
                 session.add(new_instance)
                 try:
+                    await session.flush()
+                    keys = [row_key(inspect(new_instance).identity or ())]
+                    await invalidation.notify(session, cls.model.__tablename__, keys)
+                    await session.commit()
+                except SQLAlchemyError as e:
+                    await session.rollback()
+                    raise e
+        cls._invalidate(keys)
+        return new_instance
+
+    @classmethod
+    async def add_or_ignore(cls, async_session: AsyncSession, **values) -> bool:
+        """
+        Идемпотентно добавить строку (INSERT ... ON CONFLICT DO NOTHING RETURNING).
+
+        Повторная вставка той же строки не вызывает IntegrityError и откат
+        транзакции, а просто ничего не меняет. Нарушения внешних ключей
+        по-прежнему приводят к IntegrityError.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param values: Значения которые надо добавить в таблицу
+        :return: True, если строка добавлена, False - если она уже существовала.
+        """
+        async with async_session as session:
+            async with session.begin():
+                query = (
+                    insert(cls.model)
+                    .values(**values)
+                    .on_conflict_do_nothing()
+                    .returning(*cls.model.__table__.primary_key.columns)
+                )
+                try:
+                    result = await session.execute(query)
+                    keys = cls._keys(result.all())
+                    await invalidation.notify(session, cls.model.__tablename__, keys)
                     await session.commit()
                 except SQLAlchemyError as e:
                     await session.rollback()
                     raise e
-                return new_instance
+        cls._invalidate(keys)
+        return bool(keys)
 
     @classmethod
     async def update(cls, async_session: AsyncSession, filter_by: dict[Any, Any], **values) -> List[M]:
@@ -92,30 +282,81 @@ class BaseDAO(Generic[M]):
         :param values: Значения которые надо добавить в таблицу
         :return: Экземпляр модели
         """
+        rows = await cls.update_rows(async_session, filter_by, **values)
+        return [cls.model(**row) for row in rows]
+
+    @classmethod
+    async def update_rows(
+        cls,
+        async_session: AsyncSession,
+        filter_by: dict[Any, Any],
+        returning: Optional[Sequence[str]] = None,
+        **values,
+    ) -> List[Dict[str, Any]]:
+        """
+        Обновить строки и вернуть их значения словарями, без создания экземпляров модели.
+
+        Сессия DAO живет только внутри метода и не хранит загруженных объектов,
+        поэтому синхронизировать их с обновленными строками не нужно
+        (synchronize_session=False): UPDATE ... RETURNING выполняется одним запросом.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param filter_by: Параметры для фильтрации
+        :param returning: Имена колонок, которые нужно вернуть, по умолчанию - все.
+        :param values: Новые значения колонок
+        :return: Значения обновленных строк
+        """
+        table = cls.model.__table__
+        columns = [table.c[column] for column in returning] if returning is not None else list(table.c)
+        names = [column.key for column in columns]
+        pk = [column for column in table.primary_key.columns if column.key not in names]
+        query = (
+            sqlalchemy_update(cls.model)
+            .where(*[getattr(cls.model, k) == v for k, v in filter_by.items()])
+            .values(**values)
+            .returning(*columns, *pk)
+            .execution_options(synchronize_session=False)
+        )
         async with async_session as session:
             async with session.begin():
-                query = (
-                    sqlalchemy_update(cls.model)
-                    .where(*[getattr(cls.model, k) == v for k, v in filter_by.items()])
-                    .values(**values)
-                    .execution_options(synchronize_session="fetch")
-                    .returning(
-                        *[getattr(cls.model, column).label(column) for column in cls.model.__table__.columns.keys()]
-                    )
-                )
+                try:
+                    updated_rows = (await session.execute(query)).mappings().all()
+                    keys = cls._keys([SimpleNamespace(**row) for row in updated_rows])
+                    await invalidation.notify(session, cls.model.__tablename__, keys)
+                    await session.commit()
+                except SQLAlchemyError as e:
+                    await session.rollback()
+                    raise e
+        cls._invalidate(keys)
+        return [{name: row[name] for name in names} for row in updated_rows]
+
+    @classmethod
+    async def bulk_update(cls, async_session: AsyncSession, rows: Sequence[Dict[str, Any]]) -> int:
+        """
+        Обновить много строк разными значениями одним executemany.
+
+        Каждый словарь содержит первичный ключ строки и новые значения колонок
+        (ORM bulk UPDATE by primary key): запрос UPDATE ... WHERE id = $1
+        подготавливается один раз и выполняется пачкой для всех строк.
 
-                result = await session.execute(query)
+        :param async_session: Асинхронная сессия базы данных.
+        :param rows: Словари с первичным ключом и новыми значениями.
+        :return: Количество переданных строк.
+        """
+        if not rows:
+            return 0
+        keys = cls._keys([SimpleNamespace(**row) for row in rows])
+        async with async_session as session:
+            async with session.begin():
                 try:
-                    updated_rows = result.fetchall()  # Получаем все измененные строки
+                    await session.execute(sqlalchemy_update(cls.model), list(rows))
+                    await invalidation.notify(session, cls.model.__tablename__, keys)
                     await session.commit()
-                    # return updated_rows
-                    return [
-                        cls.model(**{column: value for column, value in zip(result.keys(), row)})
-                        for row in updated_rows
-                    ]
                 except SQLAlchemyError as e:
                     await session.rollback()
                     raise e
+        cls._invalidate(keys)
+        return len(rows)
 
     @classmethod
     async def delete(cls, async_session: AsyncSession, delete_all: bool = False, **filter_by) -> int:
@@ -133,15 +374,76 @@ class BaseDAO(Generic[M]):
         async with async_session as session:
             async with session.begin():
                 if delete_all:
-                    query = sqlalchemy_delete(cls.model)  # Удаление всех записей
+                    # Очистка сбрасывает весь кэш таблицы: ключи строк не нужны, хватает rowcount
+                    result = await session.execute(sqlalchemy_delete(cls.model))  # Удаление всех записей
+                    deleted, keys = result.rowcount, [ALL]
                 else:
                     query = sqlalchemy_delete(cls.model).filter_by(**filter_by)  # Удаление по фильтрам
+                    rows = (await session.execute(query.returning(*cls.model.__table__.primary_key.columns))).all()
+                    deleted, keys = len(rows), cls._keys(rows)
+                try:
+                    await invalidation.notify(session, cls.model.__tablename__, keys)
+                    await session.commit()
+                except SQLAlchemyError as e:
+                    await session.rollback()
+                    raise e
+        cls._invalidate(keys)
+        return deleted  # Возвращает количество уудаленных строк
+
+    @classmethod
+    async def soft_delete(cls, async_session: AsyncSession, **filter_by) -> int:
+        """
+        Мягкое удаление: строки помечаются deleted_at и сразу пропадают из чтений DAO.
+
+        Зависимые строки удаляет фоновая задача (app.reaper) небольшими пачками,
+        поэтому запрос не держит блокировки на время каскадного удаления.
 
-                result = await session.execute(query)
+        :param async_session: Асинхронная сессия базы данных.
+        :param filter_by: Параметры для фильтрации
+        :return: Количество помеченных строк
+        """
+        if not filter_by:
+            raise ValueError("Необходимо указать хотя бы один параметр для удаления.")
+        async with async_session as session:
+            async with session.begin():
+                query = (
+                    sqlalchemy_update(cls.model)
+                    .filter_by(**filter_by)
+                    .where(getattr(cls.model, "deleted_at").is_(None))
+                    .values(deleted_at=func.now())
+                    .returning(*cls.model.__table__.primary_key.columns)
+                    .execution_options(synchronize_session=False)
+                )
                 try:
+                    keys = cls._keys((await session.execute(query)).all())
+                    await invalidation.notify(session, cls.model.__tablename__, keys)
                     await session.commit()
                 except SQLAlchemyError as e:
                     await session.rollback()
                     raise e
+        cls._invalidate(keys)
+        return len(keys)
 
-                return result.rowcount  # Возвращает количество уудаленных строк
+    @classmethod
+    async def purge_batch(cls, session: AsyncSession, *criteria: ColumnElement[bool], limit: int) -> Sequence[Row[Any]]:
+        """
+        Удалить не больше ``limit`` строк, подходящих под условия.
+
+        В PostgreSQL у DELETE нет LIMIT, поэтому строки выбираются по первичному ключу
+        подзапросом. Выполняется внутри транзакции вызывающего кода.
+
+        :param session: Асинхронная сессия с открытой транзакцией.
+        :param criteria: Условия WHERE.
+        :param limit: Размер пачки.
+        :return: Первичные ключи удаленных строк.
+        """
+        pk = list(cls.model.__table__.primary_key.columns)
+        batch = select(*pk).where(*criteria).limit(limit)
+        query = (
+            sqlalchemy_delete(cls.model)
+            .where(tuple_(*pk).in_(batch))
+            .returning(*pk)
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(query)
+        return result.all()
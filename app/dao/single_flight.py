@@ -0,0 +1,138 @@
+import asyncio
+import time
+from collections import OrderedDict
+from functools import partial, wraps
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar, cast
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.invalidation import invalidation
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+# Сколько готовых результатов держать для окна повторного использования
+MAX_RESULTS = 1024
+
+
+class Flight:
+    """
+    Выполняющийся запрос и число ждущих его вызовов.
+
+    Attributes:
+        task (asyncio.Task[Any]): Задача с запросом к БД.
+        version (int): Версия данных, при которой запрос начат.
+        waiters (int): Сколько вызовов ждут результата.
+    """
+
+    def __init__(self, task: "asyncio.Task[Any]", version: int) -> None:
+        """
+        Создает запрос без ждущих.
+
+        :param task: Задача с запросом к БД.
+        :param version: Версия данных, при которой запрос начат.
+        """
+        self.task = task
+        self.version = version
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных чтений (single-flight).
+
+    Первый вызов с ключом запускает запрос отдельной задачей, остальные вызовы
+    с тем же ключом, пришедшие до его завершения, ждут тот же результат.
+    Присоединиться можно только к запросу, начатому при текущей версии данных
+    (app.invalidation): чтение после записи никогда не получит результат,
+    начатый до нее. Если все ждущие ушли (клиенты отключились), запрос
+    отменяется вместе с запросом к БД.
+
+    Готовый результат можно повторно отдавать еще ``window`` секунд, пока
+    версия данных не изменилась.
+    """
+
+    def __init__(self) -> None:
+        """Создает пустой реестр запросов."""
+        self._flights: Dict[Hashable, Flight] = {}
+        # ключ -> (версия данных, срок годности по time.monotonic(), результат)
+        self._results: OrderedDict[Hashable, Tuple[int, float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Количество выполняющихся запросов."""
+        return len(self._flights)
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]], window: float = 0.0) -> Any:
+        """
+        Выполнить запрос или дождаться такого же, уже выполняющегося.
+
+        :param key: Ключ запроса: метод и аргументы.
+        :param call: Функция, запускающая запрос.
+        :param window: Сколько секунд можно повторно отдавать готовый результат, 0 - не хранить.
+        :return: Результат запроса.
+        """
+        version = invalidation.version
+        cached = self._results.get(key)
+        if cached is not None:
+            if cached[0] == version and cached[1] > time.monotonic():
+                return cached[2]
+            del self._results[key]
+        flight = self._flights.get(key)
+        if flight is None or flight.version != version:
+            flight = self._flights[key] = Flight(asyncio.ensure_future(call()), version)
+            flight.task.add_done_callback(partial(self._land, key, flight, window))
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+
+    def _land(self, key: Hashable, flight: Flight, window: float, task: "asyncio.Task[Any]") -> None:
+        """Убрать завершившийся запрос и сохранить его результат на ``window`` секунд."""
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if window > 0 and flight.version == invalidation.version:
+            self._results[key] = (flight.version, time.monotonic() + window, task.result())
+            self._results.move_to_end(key)
+            while len(self._results) > MAX_RESULTS:
+                self._results.popitem(last=False)
+
+
+def single_flight(method: F) -> F:
+    """
+    Объединять одинаковые одновременные вызовы читающего метода DAO.
+
+    Ключ - класс DAO, метод и аргументы без сессии, а также движок сессии:
+    чтения с реплики и с основной БД не смешиваются. Общий запрос выполняется
+    в собственной сессии на том же движке, поэтому не зависит от того, какой
+    из ждущих запросов завершится или будет отменен первым. Результат общий
+    для всех ждущих и не должен изменяться. Окно повторного использования
+    задает SINGLE_FLIGHT_WINDOW_MS, объединение выключает SINGLE_FLIGHT_ENABLED.
+
+    :param method: Метод класса DAO, первый аргумент которого - async_session.
+    :return: Метод с объединением одинаковых вызовов.
+    """
+
+    @wraps(method)
+    async def wrapper(cls: Any, async_session: AsyncSession, *args: Any, **kwargs: Any) -> Any:
+        if not settings.SINGLE_FLIGHT_ENABLED:
+            return await method(cls, async_session, *args, **kwargs)
+        key = (cls.__name__, method.__name__, id(async_session.bind), args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return await method(cls, async_session, *args, **kwargs)
+
+        async def call() -> Any:
+            async with AsyncSession(bind=async_session.bind, expire_on_commit=False) as session:
+                return await method(cls, session, *args, **kwargs)
+
+        return await flights.do(key, call, settings.SINGLE_FLIGHT_WINDOW_MS / 1000)
+
+    return cast(F, wrapper)
+
+
+flights = SingleFlight()
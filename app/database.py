@@ -1,25 +1,75 @@
+import time
 from datetime import datetime
-from typing import Any
+from typing import Any, Callable, List, Optional
 
 from sqlalchemy import func
 from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, declared_attr, mapped_column
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+from sqlalchemy.util.queue import AsyncAdaptedQueue
 from typing_extensions import Annotated
 
 from app.config import settings
 
 DATABASE_URL = settings.get_db_url()
 TEST_DATABASE_URL = settings.get_test_db_url()
+
+# Обработчики времени ожидания соединения из пула (в секундах), см. TimedQueue
+pool_wait_listeners: List[Callable[[float], None]] = []
+
+
+class TimedQueue(AsyncAdaptedQueue[ConnectionPoolEntry]):
+    """
+    Очередь свободных соединений пула, сообщающая, сколько запрос ждал соединения.
+
+    Меряется только ожидание в очереди, когда пул и overflow исчерпаны.
+    Если свободных соединений нет, но overflow еще позволяет, пул открывает
+    новое соединение: время подключения ожиданием не считается и сообщается как 0.
+    """
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> ConnectionPoolEntry:
+        """Выдать соединение из очереди, замерив время ожидания."""
+        started = time.monotonic()
+        try:
+            return super().get(block, timeout)
+        finally:
+            waited = time.monotonic() - started if block else 0.0
+            for listener in pool_wait_listeners:
+                listener(waited)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, сообщающий в pool_wait_listeners время ожидания свободного соединения."""
+
+    _queue_class = TimedQueue
+
+
 # настройки БД для работы как с боевой так и с тестовой базой данных
-engine = create_async_engine(DATABASE_URL)
-test_engine = create_async_engine(TEST_DATABASE_URL)
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    poolclass=TimedQueuePool,
+)
+test_engine = create_async_engine(TEST_DATABASE_URL, poolclass=TimedQueuePool)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 async_test_session = async_sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+# реплики для чтения, у каждой свой пул соединений
+replica_engines = [
+    create_async_engine(
+        url, pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW, poolclass=TimedQueuePool
+    )
+    for url in settings.get_replica_db_urls()
+]
+replica_sessions = [
+    async_sessionmaker(replica, class_=AsyncSession, expire_on_commit=False) for replica in replica_engines
+]
 
 # настройка аннотаций
 int_pk = Annotated[int, mapped_column(primary_key=True, autoincrement=True)]
 created_at = Annotated[datetime, mapped_column(server_default=func.now())]
 updated_at = Annotated[datetime, mapped_column(server_default=func.now(), onupdate=datetime.now)]
+deleted_at = Annotated[Optional[datetime], mapped_column(nullable=True)]
 str_uniq = Annotated[str, mapped_column(unique=True, nullable=False)]
 str_null_true = Annotated[str, mapped_column(nullable=True)]
 
@@ -1,14 +1,17 @@
 import asyncio
-from typing import AsyncGenerator
+import itertools
+import math
+import time
+from typing import AsyncGenerator, Dict, Optional
 
-from fastapi import Depends, HTTPException
+from fastapi import Cookie, Depends, HTTPException, Request, Response
 from fastapi.security import APIKeyHeader
 
 # from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.config import logger
-from app.database import async_session
+from app.config import logger, settings
+from app.database import async_session, replica_sessions
 from app.users.dao import UserDAO
 
 # from app.tweets.dao import TweetDAO, TweetMediaDAO
@@ -17,22 +20,122 @@ from app.users.dao import UserDAO
 # from app.medias.models import Media
 
 
-async def get_session() -> AsyncGenerator[AsyncSession, None]:
+# API_KEY = "test"  # Замените на ваш реальный ключ
+api_key_header = APIKeyHeader(name="api-key", auto_error=False)
+
+# HTTP-методы, которые не меняют данные
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# api_key -> момент времени (time.monotonic), до которого чтения пользователя идут в основную БД
+primary_pins: Dict[str, float] = {}
+# Cookie с моментом (unix time), до которого чтения клиента идут в основную БД
+PIN_COOKIE = "rw_until"
+replica_counter = itertools.count()
+
+
+def pin_to_primary(api_key: str) -> None:
+    """
+    Закрепляет чтения пользователя за основной БД на время DB_READ_YOUR_WRITES_SECONDS.
+
+    Так пользователь сразу видит свои изменения, даже если реплика еще их не получила.
+    Это закрепление действует в пределах процесса-воркера; между воркерами
+    его переносит cookie PIN_COOKIE (см. pin_cookie).
+
+    :param api_key: Токен пользователя, который только что изменил данные.
+    """
+    now = time.monotonic()
+    if len(primary_pins) >= 10000:
+        for key in [key for key, until in primary_pins.items() if until <= now]:
+            del primary_pins[key]
+    primary_pins[api_key] = now + settings.DB_READ_YOUR_WRITES_SECONDS
+
+
+def pin_cookie(response: Response) -> None:
+    """
+    Закрепляет чтения клиента за основной БД через cookie, которую видят все воркеры.
+
+    Следующий GET может попасть в другой процесс, где закрепления в
+    primary_pins нет; cookie с моментом окончания закрепления приходит
+    с запросом в любой воркер. Клиенты без хранения cookie закрепляются
+    только в воркере, обработавшем запись.
+
+    :param response: Ответ на изменяющий запрос.
+    """
+    seconds = settings.DB_READ_YOUR_WRITES_SECONDS
+    response.set_cookie(
+        PIN_COOKIE,
+        f"{time.time() + seconds:.3f}",
+        max_age=math.ceil(seconds),
+        path="/api",
+        httponly=True,
+        samesite="lax",
+    )
+
+
+def is_pinned_to_primary(api_key: Optional[str], pinned_until: Optional[str] = None) -> bool:
+    """
+    Проверяет, нужно ли читать данные пользователя с основной БД.
+
+    :param api_key: Токен пользователя или None.
+    :param pinned_until: Значение cookie PIN_COOKIE или None.
+    :return: True, если пользователь недавно менял данные.
+    """
+    if pinned_until:
+        try:
+            remaining = float(pinned_until) - time.time()
+        except ValueError:
+            remaining = 0.0
+        # Cookie задает клиент: дольше настроенного времени (с запасом на округление) закрепление не действует
+        if 0 < remaining <= settings.DB_READ_YOUR_WRITES_SECONDS + 1:
+            return True
+    return api_key is not None and primary_pins.get(api_key, 0.0) > time.monotonic()
+
+
+async def get_session(
+    request: Request, response: Response, api_key: Optional[str] = Depends(api_key_header)
+) -> AsyncGenerator[AsyncSession, None]:
     """
     Функция для получения асинхронной сессии базы данных.
 
     Эта функция используется для тестирования и работы с базой данных.
     В тестах происходит обращение к тестовой базе данных,
     а в рабочем приложении — к боевой базе данных.
+    После изменяющего запроса чтения пользователя закрепляются за основной БД.
 
+    :param request: Текущий запрос.
+    :param response: Ответ, в который ставится cookie закрепления.
+    :param api_key: API-ключ из заголовка запроса.
     :yield: Асинхронная сессия базы данных (AsyncSession)
     """
+    if request.method not in SAFE_METHODS:
+        pin_cookie(response)
     async with async_session() as session:
         yield session
+    if api_key and request.method not in SAFE_METHODS:
+        pin_to_primary(api_key)
 
 
-# API_KEY = "test"  # Замените на ваш реальный ключ
-api_key_header = APIKeyHeader(name="api-key", auto_error=False)
+async def get_read_session(
+    primary_session: AsyncSession = Depends(get_session),
+    api_key: Optional[str] = Depends(api_key_header),
+    pinned_until: Optional[str] = Cookie(None, alias=PIN_COOKIE),
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Сессия для запросов, которые только читают данные.
+
+    Если настроены реплики (DB_REPLICA_HOSTS), запрос уходит на одну из них по кругу.
+    Без реплик или если пользователь недавно что-то менял (в этом воркере
+    или, по cookie, в любом другом), используется основная БД.
+
+    :param primary_session: Сессия основной базы данных.
+    :param api_key: API-ключ из заголовка запроса.
+    :param pinned_until: Cookie закрепления за основной БД.
+    :yield: Асинхронная сессия базы данных (AsyncSession)
+    """
+    if not replica_sessions or is_pinned_to_primary(api_key, pinned_until):
+        yield primary_session
+        return
+    async with replica_sessions[next(replica_counter) % len(replica_sessions)]() as session:
+        yield session
 
 
 # Зависимость для проверки API-ключа
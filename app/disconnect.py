@@ -0,0 +1,77 @@
+import asyncio
+from contextlib import suppress
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import logger, settings
+
+
+class CancelOnDisconnectMiddleware:
+    """
+    ASGI-middleware: GET-запрос отменяется, если клиент отключился, не дождавшись ответа.
+
+    Обработчик запускается отдельной задачей, а middleware тем временем ждет
+    от сервера сообщения ``http.disconnect``. Если клиент ушел до того, как
+    ответ отправлен целиком, задача отменяется: asyncpg при отмене ожидания
+    посылает Postgres запрос отмены текущего запроса, и соединение
+    возвращается в пул, а не держится до конца ненужного запроса.
+
+    Отменяются только GET-запросы: прерывать запись на середине нельзя.
+    Потоковые ответы (SSE) получают ``http.disconnect`` как обычно.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        """
+        Оборачивает приложение.
+
+        :param app: ASGI-приложение.
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Выполняет GET-запрос, отменяя его при отключении клиента."""
+        if scope["type"] != "http" or scope["method"] != "GET" or not settings.CANCEL_ON_DISCONNECT:
+            await self.app(scope, receive, send)
+            return
+        # Тело GET-запроса пустое: читаем его сразу, дальше receive ждет только отключения
+        request = await receive()
+        if request["type"] == "http.disconnect":
+            return
+        pending: list[Message] = [request]
+        disconnected = asyncio.Event()
+        response_complete = False
+
+        async def app_receive() -> Message:
+            if pending:
+                return pending.pop()
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def app_send(message: Message) -> None:
+            nonlocal response_complete
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        task = asyncio.ensure_future(self.app(scope, app_receive, app_send))
+
+        async def watch() -> None:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    if not response_complete:
+                        task.cancel()
+                    return
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await task
+        except asyncio.CancelledError:
+            if not disconnected.is_set() or not task.cancelled():
+                raise
+            logger.info(f"Клиент отключился, запрос {scope['path']} отменен")
+        finally:
+            watcher.cancel()
+            with suppress(asyncio.CancelledError):
+                await watcher
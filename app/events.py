@@ -0,0 +1,275 @@
+import asyncio
+import json
+from contextlib import contextmanager, suppress
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Set
+
+import asyncpg  # type: ignore
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import logger, settings
+
+Event = Dict[str, Any]
+
+
+async def notify(engine: AsyncEngine, channel: str, payload: str) -> None:
+    """
+    Отправить сообщение в канал Postgres NOTIFY.
+
+    Сообщение получат все соединения, выполнившие LISTEN на этот канал,
+    в том числе в других воркерах.
+
+    :param engine: Движок базы данных.
+    :param channel: Имя канала.
+    :param payload: Текст сообщения (до 8000 байт).
+    """
+    async with engine.connect() as conn:
+        await conn.execute(select(func.pg_notify(channel, payload)))
+        await conn.commit()
+
+
+class EventBus:
+    """
+    Публикация событий подписчикам внутри процесса.
+
+    У каждого подписчика своя ограниченная очередь. Если подписчик не успевает
+    читать и очередь переполнилась, он получает None и должен переподключиться
+    (клиент SSE после переподключения один раз перечитывает ленту целиком),
+    поэтому медленный клиент не копит память и не тормозит остальных.
+
+    Если задан ``engine``, события рассылаются через Postgres NOTIFY, и каждый
+    воркер получает их через PgListener, в том числе опубликовавший.
+
+    Attributes:
+        channel (str): Имя канала NOTIFY.
+        queue_size (int): Размер очереди каждого подписчика.
+        engine (Optional[AsyncEngine]): Движок для рассылки через NOTIFY, None - только внутри процесса.
+    """
+
+    def __init__(self, channel: str, queue_size: int) -> None:
+        """
+        Создает шину без подписчиков.
+
+        :param channel: Имя канала NOTIFY.
+        :param queue_size: Размер очереди каждого подписчика.
+        """
+        self.channel = channel
+        self.queue_size = queue_size
+        self.engine: Optional[AsyncEngine] = None
+        self._subscribers: Set[asyncio.Queue[Optional[Event]]] = set()
+        self._listeners: List[Callable[[Event], None]] = []
+
+    def __len__(self) -> int:
+        """Количество подписчиков."""
+        return len(self._subscribers)
+
+    @contextmanager
+    def subscribe(self) -> Iterator[asyncio.Queue[Optional[Event]]]:
+        """
+        Подписаться на события на время блока with.
+
+        :return: Очередь событий подписчика, None в очереди означает переполнение.
+        """
+        queue: asyncio.Queue[Optional[Event]] = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+
+    def add_listener(self, listener: Callable[[Event], None]) -> None:
+        """
+        Добавить синхронный обработчик, который вызывается для каждого события до рассылки в очереди.
+
+        :param listener: Функция, получающая событие.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Event], None]) -> None:
+        """
+        Убрать синхронный обработчик.
+
+        :param listener: Ранее добавленная функция.
+        """
+        self._listeners.remove(listener)
+
+    def dispatch(self, event: Event) -> None:
+        """
+        Разослать событие обработчикам и подписчикам этого процесса.
+
+        :param event: Событие.
+        """
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Ошибка обработки события {event.get('type')}: {e!r}")
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def dispatch_payload(self, payload: str) -> None:
+        """
+        Разослать событие, пришедшее через NOTIFY.
+
+        :param payload: Событие в JSON.
+        """
+        self.dispatch(json.loads(payload))
+
+    async def publish(self, event: Event) -> None:
+        """
+        Опубликовать событие: через NOTIFY для всех воркеров или только внутри процесса.
+
+        Если NOTIFY не удался, событие получат хотя бы подписчики этого процесса.
+
+        :param event: Событие.
+        """
+        if self.engine is not None:
+            try:
+                await notify(self.engine, self.channel, json.dumps(event, ensure_ascii=False))
+                return
+            except SQLAlchemyError as e:
+                logger.error(f"Не удалось отправить событие через NOTIFY: {e!r}")
+        self.dispatch(event)
+
+
+class PgListener:
+    """
+    Выделенное соединение asyncpg, слушающее каналы Postgres LISTEN.
+
+    Соединение не берется из пула SQLAlchemy и живет все время работы воркера.
+    При обрыве оно открывается заново, а обработчики ``on_connect`` вызываются
+    после каждого (пере)подключения: уведомления, отправленные во время обрыва,
+    потеряны, и подписчики должны это учесть.
+
+    Attributes:
+        dsn (str): Адрес базы данных для asyncpg.
+        reconnect_delay (float): Пауза перед переподключением в секундах.
+        keepalive (float): Как часто проверять соединение в секундах.
+    """
+
+    def __init__(self, dsn: str, reconnect_delay: float = 1.0, keepalive: float = 30.0) -> None:
+        """
+        Создает слушателя без каналов, соединение открывает run().
+
+        :param dsn: Адрес базы данных для asyncpg.
+        :param reconnect_delay: Пауза перед переподключением в секундах.
+        :param keepalive: Как часто проверять соединение в секундах.
+        """
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self.keepalive = keepalive
+        self.connected = asyncio.Event()
+        self._handlers: Dict[str, Callable[[str], None]] = {}
+        self._on_connect: List[Callable[[], Any]] = []
+
+    @property
+    def channels(self) -> List[str]:
+        """Каналы, на которые подписан слушатель."""
+        return list(self._handlers)
+
+    def listen(self, channel: str, handler: Callable[[str], None]) -> None:
+        """
+        Подписать обработчик на канал, до вызова run().
+
+        :param channel: Имя канала.
+        :param handler: Обработчик текста сообщения.
+        """
+        self._handlers[channel] = handler
+
+    def on_connect(self, callback: Callable[[], Any]) -> None:
+        """
+        Добавить обработчик (пере)подключения.
+
+        :param callback: Функция без аргументов.
+        """
+        self._on_connect.append(callback)
+
+    def _callback(self, handler: Callable[[str], None]) -> Callable[[Any, int, str, str], None]:
+        """Обертка обработчика в сигнатуру слушателя asyncpg."""
+
+        def callback(connection: Any, pid: int, channel: str, payload: str) -> None:
+            try:
+                handler(payload)
+            except Exception as e:
+                logger.error(f"Ошибка обработки уведомления из канала {channel}: {e!r}")
+
+        return callback
+
+    async def _listen_once(self) -> None:
+        """Одно подключение: LISTEN на все каналы и ожидание до обрыва соединения."""
+        conn: asyncpg.Connection = await asyncpg.connect(self.dsn)
+        closed = asyncio.Event()
+        conn.add_termination_listener(lambda _: closed.set())
+        try:
+            for channel, handler in self._handlers.items():
+                await conn.add_listener(channel, self._callback(handler))
+            for callback in self._on_connect:
+                callback()
+            self.connected.set()
+            while not closed.is_set():
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(closed.wait(), self.keepalive)
+                if not closed.is_set():
+                    await conn.execute("SELECT 1")
+        finally:
+            self.connected.clear()
+            with suppress(Exception):
+                await conn.close(timeout=1)
+
+    async def run(self) -> None:
+        """Слушать каналы, переподключаясь при ошибках, до отмены задачи."""
+        while True:
+            try:
+                await self._listen_once()
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.error(f"Соединение LISTEN потеряно: {e!r}")
+            await asyncio.sleep(self.reconnect_delay)
+
+
+def format_sse(event: Event) -> bytes:
+    """
+    Событие в формате Server-Sent Events.
+
+    :param event: Событие с ключом type.
+    :return: Блок text/event-stream.
+    """
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode()
+
+
+async def sse_stream(
+    bus: EventBus, is_disconnected: Callable[[], Awaitable[bool]], heartbeat: float
+) -> AsyncIterator[bytes]:
+    """
+    Поток событий шины в формате Server-Sent Events.
+
+    Пока событий нет, раз в ``heartbeat`` секунд отправляется комментарий,
+    чтобы прокси не закрывали соединение. При переполнении очереди поток
+    завершается, и браузер сам переподключается.
+
+    :param bus: Шина событий.
+    :param is_disconnected: Проверка, что клиент отключился.
+    :param heartbeat: Интервал пустых сообщений в секундах.
+    :return: Блоки text/event-stream.
+    """
+    with bus.subscribe() as queue:
+        yield b"retry: 3000\n\n"
+        while not await is_disconnected():
+            try:
+                event = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            if event is None:
+                break
+            yield format_sse(event)
+
+
+feed_events = EventBus("feed_events", settings.EVENTS_QUEUE_SIZE)
+pg_listener = PgListener(settings.get_db_url().replace("postgresql+asyncpg://", "postgresql://"))
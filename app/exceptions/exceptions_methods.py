@@ -1,10 +1,13 @@
 from fastapi import HTTPException, Request
 from fastapi.responses import JSONResponse
 from pydantic import ValidationError
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import DBAPIError, IntegrityError
 
 from app.config import logger
 
+# SQLSTATE запроса, отмененного по statement_timeout или запросом отмены
+QUERY_CANCELED = "57014"
+
 
 async def http_exception_handler(request: Request, exc: HTTPException) -> JSONResponse:
     """
@@ -18,6 +21,7 @@ async def http_exception_handler(request: Request, exc: HTTPException) -> JSONRe
     return JSONResponse(
         status_code=exc.status_code,
         content={"result": False, "error_type": "HTTPException", "error_message": exc.detail},
+        headers=exc.headers,
     )
 
 
@@ -36,6 +40,31 @@ async def integrity_error_exception_handler(request: Request, exc: IntegrityErro
     )
 
 
+async def db_timeout_exception_handler(request: Request, exc: DBAPIError) -> JSONResponse:
+    """
+    Обработка запросов, прерванных Postgres по statement_timeout.
+
+    Такой запрос не ошибка клиента, а перегрузка БД, поэтому отвечаем 503
+    с Retry-After. Остальные ошибки драйвера пробрасываются дальше как 500.
+
+    :param request: Запрос, вызвавший исключение.
+    :param exc: Исключение DBAPIError.
+    :return: JSONResponse с информацией об ошибке.
+    """
+    if getattr(exc.orig, "sqlstate", None) != QUERY_CANCELED:
+        raise exc
+    logger.error(f"Запрос к БД прерван по таймауту: {request.url.path}")
+    return JSONResponse(
+        status_code=503,
+        content={
+            "result": False,
+            "error_type": "StatementTimeout",
+            "error_message": "Запрос к базе данных выполнялся слишком долго",
+        },
+        headers={"Retry-After": "1"},
+    )
+
+
 async def validation_exception_handler(request: Request, exc: ValidationError) -> JSONResponse:
     """
     Обработка исключений ValidationError.
@@ -0,0 +1,129 @@
+from collections import defaultdict
+from typing import Any, Callable, DefaultDict, Iterable, List, Sequence
+
+from sqlalchemy import Text, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import logger, settings
+
+# Канал NOTIFY для сообщений об изменениях
+CHANNEL = "invalidate"
+# Ключ "вся таблица": при массовых изменениях и после потери соединения LISTEN
+ALL = "*"
+# Больше ключей в одной записи - одно сообщение на всю таблицу
+MAX_KEYS = 100
+
+
+def row_key(values: Sequence[Any]) -> str:
+    """
+    Ключ строки в сообщении: первичный ключ, составной - через запятую.
+
+    :param values: Значения колонок первичного ключа.
+    :return: Ключ строки, например "5" или "5,3".
+    """
+    return ",".join(str(value) for value in values)
+
+
+class InvalidationBus:
+    """
+    Шина инвалидации кэшей между воркерами.
+
+    Запись в DAO отправляет в своей транзакции сообщения ``таблица:ключ`` через
+    pg_notify, поэтому они уходят только после COMMIT. Каждый воркер слушает канал
+    на выделенном соединении (app.events.PgListener) и вызывает обработчики,
+    которые выбрасывают из локальных кэшей устаревшие записи. Записавший воркер
+    вызывает обработчики сразу после COMMIT, не дожидаясь уведомления.
+
+    После переподключения LISTEN часть сообщений могла потеряться, поэтому все
+    обработчики получают ключ ``*`` и очищают кэш целиком.
+
+    Attributes:
+        version (int): Версия данных процесса, растет при каждой инвалидации и записи.
+    """
+
+    def __init__(self) -> None:
+        """Создает шину без обработчиков."""
+        self._handlers: DefaultDict[str, List[Callable[[str], None]]] = defaultdict(list)
+        self.version = 0
+
+    def bump(self) -> None:
+        """Увеличить версию данных: после нее все снимки, построенные раньше, устарели."""
+        self.version += 1
+
+    def subscribe(self, table: str, handler: Callable[[str], None]) -> None:
+        """
+        Подписать обработчик на изменения таблицы.
+
+        :param table: Имя таблицы.
+        :param handler: Функция, получающая ключ строки или ``*`` для всей таблицы.
+        """
+        self._handlers[table].append(handler)
+
+    def unsubscribe(self, table: str, handler: Callable[[str], None]) -> None:
+        """
+        Отписать обработчик.
+
+        :param table: Имя таблицы.
+        :param handler: Ранее подписанная функция.
+        """
+        self._handlers[table].remove(handler)
+
+    def dispatch(self, table: str, keys: Iterable[str]) -> None:
+        """
+        Вызвать обработчики таблицы для измененных строк.
+
+        :param table: Имя таблицы.
+        :param keys: Ключи строк.
+        """
+        self.bump()
+        handlers = self._handlers.get(table)
+        if not handlers:
+            return
+        for key in keys:
+            for handler in handlers:
+                try:
+                    handler(key)
+                except Exception as e:
+                    logger.error(f"Ошибка инвалидации {table}:{key}: {e!r}")
+
+    def dispatch_payload(self, payload: str) -> None:
+        """
+        Обработать сообщение из канала NOTIFY.
+
+        :param payload: Сообщение вида ``таблица:ключ``.
+        """
+        table, _, key = payload.partition(":")
+        self.dispatch(table, [key])
+
+    def flush(self) -> None:
+        """Очистить все кэши целиком (после (пере)подключения LISTEN)."""
+        self.bump()
+        for table in list(self._handlers):
+            self.dispatch(table, [ALL])
+
+    @staticmethod
+    def compact(keys: Sequence[str]) -> List[str]:
+        """
+        Ключи для рассылки: при слишком большом количестве строк - одна инвалидация таблицы.
+
+        :param keys: Ключи измененных строк.
+        :return: Ключи или ``[*]``.
+        """
+        return [ALL] if ALL in keys or len(keys) > MAX_KEYS else list(dict.fromkeys(keys))
+
+    async def notify(self, session: AsyncSession, table: str, keys: Sequence[str]) -> None:
+        """
+        Отправить сообщения об изменениях в транзакции сессии (уйдут при COMMIT).
+
+        :param session: Асинхронная сессия с открытой транзакцией.
+        :param table: Имя таблицы.
+        :param keys: Ключи измененных строк.
+        """
+        if not settings.INVALIDATION_PG_NOTIFY or not keys:
+            return
+        payloads = bindparam("payloads", [f"{table}:{key}" for key in self.compact(keys)], type_=ARRAY(Text))
+        await session.execute(select(func.pg_notify(CHANNEL, func.unnest(payloads))))
+
+
+invalidation = InvalidationBus()
@@ -1,39 +1,40 @@
-import os.path
-from contextlib import asynccontextmanager
-from typing import Any, Dict, List
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List
 
-import uvicorn
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from prometheus_fastapi_instrumentator import Instrumentator
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import DBAPIError, IntegrityError
 from starlette.responses import HTMLResponse
 
-from app.config import logger, settings
-from app.data_generate import (
-    MediaFactory,
-    TweetFactory,
-    generate_follow,
-    generate_likes,
-    generate_tweet_media,
-    generate_users,
-)
-from app.database import Base, engine
-from app.dependencies import get_session
+from app import reaper
+from app.admission import AdmissionMiddleware
+from app.config import settings
+from app.database import async_session, engine, replica_engines
+from app.disconnect import CancelOnDisconnectMiddleware
+from app.events import feed_events, pg_listener
 from app.exceptions.exceptions_methods import (
+    db_timeout_exception_handler,
     http_exception_handler,
     integrity_error_exception_handler,
     validation_exception_handler,
 )
-from app.medias.dao import MediaDAO
-from app.medias.router import router as router_medias
-from app.tweets.dao import LikeDAO, TweetDAO, TweetMediaDAO
+from app.invalidation import CHANNEL as INVALIDATION_CHANNEL, invalidation
+from app.medias import gc as media_gc
+from app.medias.router import media_pool, router as router_medias
+from app.medias.upload_limit import UploadLimitMiddleware
+from app.snapshots import SnapshotMiddleware
+from app.startup import prepare_database
+from app.tweets import trending
+from app.tweets.like_buffer import like_buffer
 from app.tweets.router import router as router_tweets
-from app.users.dao import FollowDAO, UserDAO
 from app.users.router import router as router_users
-from migrations_script import run_alembic_command
+
+if TYPE_CHECKING:
+    from fastapi.templating import Jinja2Templates
 
 # API теги и их описание
 tags_metadata: List[Dict[str, Any]] = [
@@ -61,28 +62,49 @@ async def lifespan(app: FastAPI):
     :param app:
     :return:
     """
-    logger.info("Перед первым запуском необходимо убедиться в актуальности версии миграции")
-    if os.path.split(os.getcwd())[1] == "app":
-        run_alembic_command("cd ..; alembic upgrade head;alembic current")
-    elif os.path.split(os.getcwd())[1] == "kill_twitter":
-        run_alembic_command("alembic upgrade head;alembic current")
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
-
-    async for session in get_session():
-        await UserDAO.add(session, **{"first_name": "Test_name", "last_name": "Test_surname", "api_key": "test"})
-        [await UserDAO.add(session, **user.to_dict()) for user in generate_users(100)]
-        [await FollowDAO.add(session, **follow.to_dict()) for follow in generate_follow(100)]
-        [await MediaDAO.add(session, **MediaFactory().to_dict()) for _ in range(1, 21)]
-        [await TweetDAO.add(session, **TweetFactory().to_dict()) for _ in range(100)]
-        [await LikeDAO.add(session, **like.to_dict()) for like in generate_likes(100)]
-        [await TweetMediaDAO.add(session, **inst.to_dict()) for inst in generate_tweet_media(100)]
+    await prepare_database()
+    background = []
+    if settings.LIKES_WRITE_BEHIND:
+        background.append(asyncio.create_task(like_buffer.run(async_session, settings.LIKES_FLUSH_INTERVAL_MS / 1000)))
+    if settings.REAPER_ENABLED:
+        background.append(
+            asyncio.create_task(reaper.run(async_session, settings.REAPER_INTERVAL_SECONDS, settings.REAPER_BATCH_SIZE))
+        )
+    if settings.MEDIA_GC_ENABLED:
+        background.append(
+            asyncio.create_task(
+                media_gc.run(
+                    async_session,
+                    settings.MEDIA_GC_INTERVAL_SECONDS,
+                    settings.MEDIA_GC_GRACE_SECONDS,
+                    settings.MEDIA_GC_BATCH_SIZE,
+                )
+            )
+        )
+    # Доска популярных твитов загружается из БД и дальше обновляется событиями ленты
+    feed_events.add_listener(trending.board.apply)
+    background.append(asyncio.create_task(trending.run(async_session, settings.TRENDING_RELOAD_SECONDS)))
+    if settings.EVENTS_PG_NOTIFY:
+        feed_events.engine = engine
+        pg_listener.listen(feed_events.channel, feed_events.dispatch_payload)
+    if settings.INVALIDATION_PG_NOTIFY:
+        pg_listener.listen(INVALIDATION_CHANNEL, invalidation.dispatch_payload)
+        pg_listener.on_connect(invalidation.flush)
+    if pg_listener.channels:
+        background.append(asyncio.create_task(pg_listener.run()))
     yield
+    for task in background:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    media_pool.shutdown()
+    await engine.dispose()
+    for replica in replica_engines:
+        await replica.dispose()
 
 
 app = FastAPI(
-    debug=True,
+    debug=settings.DEBUG,
     title="Kill Twitter API",
     summary="Реализовать бэкенд сервиса микроблогов.",
     description="""
@@ -139,24 +161,43 @@ app.include_router(router_users)
 app.include_router(router_tweets)
 app.include_router(router_medias)
 
+# Отмена GET-запросов ушедших клиентов: внутри снимков, отданные снимки задач не создают
+app.add_middleware(CancelOnDisconnectMiddleware)
+# Контроль допуска снаружи отмены и внутри снимков: отдача снимка не занимает места
+app.add_middleware(AdmissionMiddleware)
+# Снимки ответов внутри метрик: отданные из снимка запросы тоже учитываются
+app.add_middleware(SnapshotMiddleware)
+# Слишком большая загрузка медиа отклоняется раньше всего, до разбора тела
+app.add_middleware(UploadLimitMiddleware)
+
 # Mount the Prometheus metrics endpoint
 instrumentator = Instrumentator().instrument(app).expose(app)
 
 # для тестовой разработки подключение статических файлов
 app.mount("/static", StaticFiles(directory=settings.static_path()), name="static")
-templates = Jinja2Templates(directory=settings.template_path())
 
 # Определение обработчиков исключений
 app.add_exception_handler(HTTPException, http_exception_handler)  # type: ignore
 app.add_exception_handler(IntegrityError, integrity_error_exception_handler)  # type: ignore
+app.add_exception_handler(DBAPIError, db_timeout_exception_handler)  # type: ignore
 app.add_exception_handler(RequestValidationError, validation_exception_handler)  # type: ignore
 
 
+@lru_cache(maxsize=1)
+def get_templates() -> "Jinja2Templates":
+    """Шаблоны Jinja2 создаются при первом запросе страницы, а не при импорте приложения."""
+    from fastapi.templating import Jinja2Templates
+
+    return Jinja2Templates(directory=settings.template_path())
+
+
 @app.get("/", response_class=HTMLResponse)
 async def hello_world(request: Request):
     """Роут для загрузки самой страницы."""
-    return templates.TemplateResponse(request=request, name="index.html")
+    return get_templates().TemplateResponse(request=request, name="index.html")
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(app="main:app", host="0.0.0.0", port=8000, reload=True)
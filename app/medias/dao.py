@@ -1,7 +1,12 @@
-from typing import Type
+from datetime import timedelta
+from typing import Iterable, List, Optional, Type
+
+from sqlalchemy import delete as sqlalchemy_delete, exists, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.dao.base import BaseDAO
 from app.medias.models import Media
+from app.tweets.models import TweetMedia
 
 
 class MediaDAO(BaseDAO[Media]):
@@ -12,3 +17,43 @@ class MediaDAO(BaseDAO[Media]):
     """
 
     model: Type[Media] = Media
+
+    @classmethod
+    async def purge_orphans(
+        cls,
+        session: AsyncSession,
+        media_ids: Optional[Iterable[int]] = None,
+        grace_seconds: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Удалить медиафайлы, которые не привязаны ни к одному твиту.
+
+        Поиск идет анти-соединением с tweetmedias по индексу на media_id.
+        Строки, заблокированные другой транзакцией, пропускаются (SKIP LOCKED).
+        Выполняется внутри транзакции вызывающего кода, файлы на диске не трогает.
+
+        :param session: Асинхронная сессия с открытой транзакцией.
+        :param media_ids: Проверять только эти ID, None - все медиафайлы.
+        :param grace_seconds: Удалять только медиафайлы старше стольких секунд по часам БД.
+        :param limit: Размер пачки.
+        :return: Адреса удаленных медиафайлов.
+        """
+        candidates = select(cls.model.id).where(~exists().where(TweetMedia.media_id == cls.model.id))
+        if media_ids is not None:
+            media_ids = list(media_ids)
+            if not media_ids:
+                return []
+            candidates = candidates.where(cls.model.id.in_(media_ids))
+        if grace_seconds is not None:
+            # created_at ставит now() БД: граница считается по тем же часам, а не по часам приложения
+            candidates = candidates.where(cls.model.created_at < func.now() - timedelta(seconds=grace_seconds))
+        candidates = candidates.order_by(cls.model.id).limit(limit).with_for_update(skip_locked=True)
+        query = (
+            sqlalchemy_delete(cls.model)
+            .where(cls.model.id.in_(candidates))
+            .returning(cls.model.media_data)
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(query)
+        return list(result.scalars().all())
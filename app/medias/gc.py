@@ -0,0 +1,86 @@
+import asyncio
+import os
+from typing import Iterable, Tuple
+
+from prometheus_client import Counter
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import logger
+from app.medias.dao import MediaDAO
+from app.medias.models import Media
+
+media_gc_deleted = Counter("media_gc_deleted_total", "Медиафайлы, удаленные сборщиком мусора и фоновой очисткой")
+media_gc_reclaimed_bytes = Counter(
+    "media_gc_reclaimed_bytes_total", "Место на диске, освобожденное удалением медиафайлов, в байтах"
+)
+
+
+def remove_media_files(media_data: Iterable[str]) -> int:
+    """
+    Удаляет с диска файлы удаленных из БД медиафайлов и обновляет метрики.
+
+    :param media_data: Адреса удаленных медиафайлов.
+    :return: Количество освобожденных байт.
+    """
+    reclaimed = deleted = 0
+    for address in media_data:
+        deleted += 1
+        path = Media.file_path(address)
+        if path is None:
+            continue
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        reclaimed += size
+    media_gc_deleted.inc(deleted)
+    media_gc_reclaimed_bytes.inc(reclaimed)
+    return reclaimed
+
+
+async def collect_once(async_session: AsyncSession, grace_seconds: float, batch_size: int) -> Tuple[int, int]:
+    """
+    Одна пачка сборки мусора: медиафайлы старше льготного периода, не привязанные ни к одному твиту.
+
+    Льготный период нужен, потому что медиа загружается до создания твита,
+    который на него ссылается. Файлы удаляются с диска после фиксации транзакции.
+
+    :param async_session: Асинхронная сессия базы данных.
+    :param grace_seconds: Сколько секунд непривязанное медиа ждет своего твита.
+    :param batch_size: Размер пачки.
+    :return: Количество удаленных медиафайлов и освобожденных байт.
+    """
+    async with async_session as session:
+        async with session.begin():
+            try:
+                media_data = await MediaDAO.purge_orphans(session, grace_seconds=grace_seconds, limit=batch_size)
+                await session.commit()
+            except SQLAlchemyError as e:
+                await session.rollback()
+                raise e
+    return len(media_data), remove_media_files(media_data)
+
+
+async def run(
+    session_maker: async_sessionmaker[AsyncSession], interval: float, grace_seconds: float, batch_size: int
+) -> None:
+    """
+    Периодическая сборка мусора: пачки идут подряд, пока есть что удалять, затем пауза ``interval``.
+
+    :param session_maker: Фабрика асинхронных сессий.
+    :param interval: Пауза между запусками в секундах.
+    :param grace_seconds: Сколько секунд непривязанное медиа ждет своего твита.
+    :param batch_size: Размер пачки.
+    """
+    while True:
+        deleted = 0
+        try:
+            async with session_maker() as session:
+                deleted, reclaimed = await collect_once(session, grace_seconds, batch_size)
+            if deleted:
+                logger.info(f"Сборщик мусора удалил медиафайлов: {deleted}, освобождено байт: {reclaimed}")
+        except Exception as e:
+            logger.error(f"Сборка мусора медиафайлов не удалась: {e!r}")
+        await asyncio.sleep(0 if deleted == batch_size else interval)
@@ -1,6 +1,10 @@
+import os.path
+from typing import Optional
+
 from sqlalchemy import String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from app.config import settings
 from app.database import Base, int_pk
 
 
@@ -12,8 +16,25 @@ class Media(Base):
         id (int): Уникальный идентификатор медиафайла (первичный ключ).
         media_data (str): Данные о медиафайле (например, путь к изображению или URL).
         tweets (List[Tweet]): Связь с твитами через промежуточную таблицу `tweetmedias`.
+        content_hash (Optional[str]): SHA-256 содержимого файла, входит в URL медиафайла.
     """
 
     id: Mapped[int_pk]
     media_data: Mapped[str] = mapped_column(String)
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
     tweets = relationship("Tweet", secondary="tweetmedias", back_populates="tweets_media")
+
+    @staticmethod
+    def file_path(media_data: str) -> Optional[str]:
+        """
+        Путь к загруженному файлу медиа на диске по его адресу в БД.
+
+        Файлы тестовых данных (static/images/N.jpg) лежат в репозитории и общие
+        для нескольких БД, поэтому для них путь не возвращается и удалять их нельзя.
+
+        :param media_data: Адрес медиафайла (UPLOAD_DIRECTORY/имя файла).
+        :return: Путь к файлу в директории загрузок или None, если файл не загружался через API.
+        """
+        if os.path.dirname(media_data) != settings.UPLOAD_DIRECTORY:
+            return None
+        return os.path.join(settings.media_path(), os.path.basename(media_data))
@@ -1,44 +1,109 @@
+import mimetypes
 import os.path
-import shutil
 import uuid
+from typing import Union
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Response, UploadFile
+from fastapi.responses import FileResponse
 
 from app.config import settings
-from app.dependencies import get_session, verify_api_key
+from app.dependencies import get_read_session, get_session, verify_api_key
 from app.medias.dao import MediaDAO
 from app.medias.models import Media
 from app.medias.rb import RBMedia
+from app.medias.urls import IMMUTABLE_CACHE_CONTROL, media_name, verify
+from app.medias.validation import (
+    MediaTooLargeError,
+    MediaValidationError,
+    PoolFullError,
+    ValidationPool,
+    prepare_upload,
+)
+from app.rate_limit import rate_limit
 
 router = APIRouter(prefix="/api", tags=["medias"])
+media_pool = ValidationPool(workers=settings.MEDIA_WORKERS, queue_size=settings.MEDIA_QUEUE_SIZE)
 
 
-@router.post("/medias", status_code=201, summary="добавить медиа")
+@router.post("/medias", status_code=201, summary="добавить медиа", dependencies=[Depends(rate_limit("media"))])
 async def upload_image(
     file: UploadFile = File(...), async_session_dep=Depends(get_session), api_key: str = Depends(verify_api_key)
 ) -> RBMedia:
     """
     Загрузка изображения на сервер.
 
+    Формат определяется по содержимому файла, а не по имени. Размер файла и
+    размеры изображения ограничены, метаданные (EXIF) удаляются. Проверка
+    выполняется в ограниченном пуле процессов; если очередь заполнена,
+    возвращается 429.
+
     :param file: Загружаемый файл изображения. Обязательный параметр.
     :param async_session_dep: Зависимость для получения асинхронной сессии базы данных.
     :param api_key: API ключ для проверки доступа. Обязательный параметр.
     :return: Ответ с уникальным идентификатором загруженного медиафайла.
     :raises: Вызывается при ошибках в процессе загрузки или сохранения файла.
     """
-    if file.filename:
-        new_file_name = f"{uuid.uuid4()}_{os.path.splitext(file.filename)[0]}.jpg"
-    else:
+    if not file.filename:
         raise HTTPException(status_code=500, detail="Не нашел файл для загрузки")
+    data = await file.read(settings.MEDIA_MAX_BYTES + 1)
+    if len(data) > settings.MEDIA_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Файл больше {settings.MEDIA_MAX_BYTES} байт")
+    try:
+        kind, clean, content_hash = await media_pool.run(
+            prepare_upload, data, settings.MEDIA_MAX_SIDE, settings.MEDIA_MAX_PIXELS
+        )
+    except PoolFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except MediaTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except MediaValidationError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    new_file_name = f"{uuid.uuid4()}_{os.path.splitext(os.path.basename(file.filename))[0]}.{kind}"
     file_location = os.path.join(settings.UPLOAD_DIRECTORY, new_file_name)
-    file_save_path = os.path.join(settings.static_path(), "images", new_file_name)
+    # Загрузки лежат вне /static: отдаются только через get_media по подписанному URL
+    file_save_path = os.path.join(settings.media_path(), new_file_name)
     try:
+        os.makedirs(settings.media_path(), exist_ok=True)
         with open(file_save_path, "wb") as file_object:
-            shutil.copyfileobj(file.file, file_object)
-        res: Media = await MediaDAO.add(async_session=async_session_dep, **{"media_data": file_location})
+            file_object.write(clean)
+        res: Media = await MediaDAO.add(
+            async_session=async_session_dep, **{"media_data": file_location, "content_hash": content_hash}
+        )
         if res:
             return RBMedia(media_id=res.id)
         else:
             raise HTTPException(status_code=500, detail="Не удалось сохранить медиафайл.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/medias/{id}/{name}", summary="Получить медиафайл по подписанному URL", response_model=None)
+async def get_media(
+    id: int, name: str, sig: str = Query(""), async_session_dep=Depends(get_read_session)
+) -> Union[FileResponse, Response]:
+    """
+    Отдача медиафайла по подписанному URL из ленты.
+
+    URL содержит хеш содержимого, поэтому ответ кэшируется навсегда
+    (Cache-Control: immutable). Приложение только проверяет подпись,
+    а сам файл при MEDIA_X_ACCEL_REDIRECT отдает nginx через sendfile.
+
+    :param id: ID медиафайла.
+    :param name: Имя медиафайла в URL: хеш содержимого и расширение.
+    :param sig: HMAC-подпись пути.
+    :param async_session_dep: Зависимость для получения асинхронной сессии базы данных.
+    :raises HTTPException: 403 при неверной подписи, 404 если медиафайл не найден.
+    :return: Файл или пустой ответ с заголовком X-Accel-Redirect.
+    """
+    if not verify(f"{id}/{name}", sig):
+        raise HTTPException(status_code=403, detail="Неверная подпись URL медиафайла")
+    media = await MediaDAO.find_one_or_none_by_id(async_session=async_session_dep, data_id=id)
+    path = Media.file_path(media.media_data) if media and media.content_hash else None
+    if media is None or path is None or media_name(media) != name:
+        raise HTTPException(status_code=404, detail="Медиафайл не найден")
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": f'"{media.content_hash}"'}
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if settings.MEDIA_X_ACCEL_REDIRECT:
+        headers["X-Accel-Redirect"] = settings.MEDIA_X_ACCEL_PREFIX + os.path.basename(path)
+        return Response(headers=headers, media_type=media_type)
+    return FileResponse(path, headers=headers, media_type=media_type)
@@ -0,0 +1,48 @@
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import logger, settings
+
+# Запас на границы и заголовки частей multipart сверх размера самого файла
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI-middleware: загрузка медиа больше MEDIA_MAX_BYTES отклоняется по Content-Length.
+
+    Starlette разбирает multipart-тело целиком (в память или во временный файл)
+    до вызова обработчика, поэтому проверка размера в upload_image не мешает
+    принять и сохранить огромное тело. Здесь запрос отклоняется с 413 до чтения
+    тела. Тело без Content-Length (chunked) ограничивает client_max_body_size в nginx.
+    """
+
+    def __init__(self, app: ASGIApp, path: str = "/api/medias") -> None:
+        """
+        Оборачивает приложение.
+
+        :param app: ASGI-приложение.
+        :param path: Путь загрузки медиа.
+        """
+        self.app = app
+        self.path = path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Отвечает 413 на загрузку с заведомо слишком большим телом."""
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == self.path:
+            limit = settings.MEDIA_MAX_BYTES + MULTIPART_OVERHEAD
+            length = dict(scope["headers"]).get(b"content-length", b"")
+            if length.isdigit() and int(length) > limit:
+                logger.warning(f"Загрузка медиа {int(length)} байт отклонена до чтения тела")
+                response = JSONResponse(
+                    status_code=413,
+                    content={
+                        "result": False,
+                        "error_type": "HTTPException",
+                        "error_message": f"Файл больше {settings.MEDIA_MAX_BYTES} байт",
+                    },
+                    headers={"Connection": "close"},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,75 @@
+import hashlib
+import hmac
+import os.path
+from functools import lru_cache
+
+from app.config import settings
+from app.medias.models import Media
+
+# Длина подписи в URL (hex-символов HMAC-SHA256)
+SIGNATURE_LENGTH = 32
+# Заголовок для медиа, адрес которых меняется вместе с содержимым
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@lru_cache
+def _key() -> bytes:
+    """
+    Ключ подписи URL медиафайлов.
+
+    Если MEDIA_URL_SECRET не задан, ключ выводится из пароля БД, чтобы
+    все воркеры подписывали одинаково без отдельной настройки.
+    """
+    secret = settings.MEDIA_URL_SECRET.get_secret_value()
+    if secret:
+        return secret.encode()
+    return hmac.new(settings.DB_PASSWORD.get_secret_value().encode(), b"media-urls", hashlib.sha256).digest()
+
+
+def sign(path: str) -> str:
+    """
+    HMAC-подпись пути медиафайла.
+
+    :param path: Путь вида "{id}/{hash}.{ext}".
+    :return: Подпись в hex.
+    """
+    return hmac.new(_key(), path.encode(), hashlib.sha256).hexdigest()[:SIGNATURE_LENGTH]
+
+
+def verify(path: str, signature: str) -> bool:
+    """
+    Проверка подписи пути медиафайла за постоянное время.
+
+    :param path: Путь вида "{id}/{hash}.{ext}".
+    :param signature: Подпись из URL.
+    :return: True, если подпись верна.
+    """
+    return hmac.compare_digest(sign(path), signature)
+
+
+def media_name(media: Media) -> str:
+    """
+    Имя медиафайла в URL: хеш содержимого и расширение.
+
+    :param media: Медиафайл с рассчитанным content_hash.
+    :return: Имя вида "{hash}.{ext}".
+    """
+    return f"{media.content_hash}{os.path.splitext(media.media_data)[1]}"
+
+
+def media_url(media: Media) -> str:
+    """
+    Подписанный URL медиафайла для ленты.
+
+    Адрес содержит хеш содержимого, поэтому ответ можно кэшировать навсегда
+    (Cache-Control: immutable): новое содержимое получит новый адрес. Подпись
+    не дает перебирать чужие медиафайлы по id. У медиафайлов без хеша
+    (тестовые данные из репозитория) возвращается их статический путь.
+
+    :param media: Медиафайл.
+    :return: URL медиафайла.
+    """
+    if not media.content_hash:
+        return media.media_data
+    path = f"{media.id}/{media_name(media)}"
+    return f"/api/medias/{path}?sig={sign(path)}"
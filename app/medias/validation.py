@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import multiprocessing
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Сегменты JPEG с метаданными: APP1 (EXIF, XMP) и APP13 (IPTC)
+JPEG_METADATA_MARKERS = {0xE1, 0xED}
+# Маркеры SOF, в которых лежат размеры кадра (кроме DHT, JPG и DAC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Чанки PNG с метаданными
+PNG_METADATA_CHUNKS = {b"eXIf", b"tEXt", b"zTXt", b"iTXt"}
+# Чанки WebP с метаданными и соответствующие им флаги VP8X
+WEBP_METADATA_CHUNKS = {b"EXIF": 0x08, b"XMP ": 0x04}
+
+
+class MediaValidationError(ValueError):
+    """Файл не является поддерживаемым изображением или превышает лимиты."""
+
+
+class MediaTooLargeError(MediaValidationError):
+    """Размеры изображения превышают лимиты."""
+
+
+class PoolFullError(RuntimeError):
+    """Очередь на проверку медиафайлов заполнена."""
+
+
+def sniff(data: bytes) -> Optional[str]:
+    """
+    Определяет формат изображения по сигнатуре (magic bytes), а не по имени файла.
+
+    :param data: Содержимое файла.
+    :return: Расширение файла (jpg, png, gif, webp) или None, если формат не поддерживается.
+    """
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _unpack(fmt: str, data: bytes, offset: int) -> Tuple[int, ...]:
+    """Читает структуру из заголовка, превращая обрезанный файл в ошибку проверки."""
+    try:
+        return struct.unpack_from(fmt, data, offset)
+    except struct.error:
+        raise MediaValidationError("Файл изображения обрезан или поврежден")
+
+
+def _jpeg(data: bytes) -> Tuple[int, int, bytes]:
+    """Размеры JPEG из сегмента SOF и содержимое без сегментов метаданных."""
+    out: List[bytes] = [data[:2]]
+    size: Optional[Tuple[int, int]] = None
+    pos = 2
+    while pos < len(data):
+        if data[pos] != 0xFF:
+            raise MediaValidationError("Поврежденная структура JPEG")
+        marker = data[pos + 1] if pos + 1 < len(data) else 0
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == 0xD9 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            out.append(data[pos : pos + 2])
+            pos += 2
+            continue
+        (length,) = _unpack(">H", data, pos + 2)
+        if length < 2 or pos + 2 + length > len(data):
+            raise MediaValidationError("Поврежденная структура JPEG")
+        if marker in JPEG_SOF_MARKERS:
+            height, width = _unpack(">HH", data, pos + 5)
+            size = (width, height)
+        if marker == 0xDA:
+            # Дальше идут сжатые данные изображения до конца файла
+            out.append(data[pos:])
+            break
+        if marker not in JPEG_METADATA_MARKERS:
+            out.append(data[pos : pos + 2 + length])
+        pos += 2 + length
+    if size is None:
+        raise MediaValidationError("В JPEG нет заголовка кадра")
+    return size[0], size[1], b"".join(out)
+
+
+def _png(data: bytes) -> Tuple[int, int, bytes]:
+    """Размеры PNG из чанка IHDR и содержимое без чанков метаданных."""
+    width, height = _unpack(">II", data, 16)
+    if data[12:16] != b"IHDR":
+        raise MediaValidationError("В PNG нет заголовка IHDR")
+    out: List[bytes] = [data[:8]]
+    pos = 8
+    while pos < len(data):
+        (length,) = _unpack(">I", data, pos)
+        chunk_type = data[pos + 4 : pos + 8]
+        end = pos + 12 + length
+        if end > len(data):
+            raise MediaValidationError("Поврежденная структура PNG")
+        if chunk_type not in PNG_METADATA_CHUNKS:
+            out.append(data[pos:end])
+        pos = end
+        if chunk_type == b"IEND":
+            break
+    return width, height, b"".join(out)
+
+
+def _gif(data: bytes) -> Tuple[int, int, bytes]:
+    """Размеры GIF из логического экрана, метаданных EXIF в GIF нет."""
+    width, height = _unpack("<HH", data, 6)
+    return width, height, data
+
+
+def _webp(data: bytes) -> Tuple[int, int, bytes]:
+    """Размеры WebP из первого чанка и содержимое без чанков EXIF и XMP."""
+    chunk_type = data[12:16]
+    if chunk_type == b"VP8 ":
+        if data[23:26] != b"\x9d\x01\x2a":
+            raise MediaValidationError("Поврежденный кадр VP8")
+        width, height = (value & 0x3FFF for value in _unpack("<HH", data, 26))
+    elif chunk_type == b"VP8L":
+        if data[20:21] != b"\x2f":
+            raise MediaValidationError("Поврежденный кадр VP8L")
+        (bits,) = _unpack("<I", data, 21)
+        width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    elif chunk_type == b"VP8X":
+        low_w, high_w, low_h, high_h = _unpack("<HBHB", data, 24)
+        width, height = (low_w | high_w << 16) + 1, (low_h | high_h << 16) + 1
+    else:
+        raise MediaValidationError("Неизвестный формат WebP")
+    out: List[bytes] = []
+    cleared_flags = 0
+    pos = 12
+    while pos < len(data):
+        (length,) = _unpack("<I", data, pos + 4)
+        chunk_type = data[pos : pos + 4]
+        end = pos + 8 + length + (length & 1)
+        if pos + 8 + length > len(data):
+            raise MediaValidationError("Поврежденная структура WebP")
+        if chunk_type in WEBP_METADATA_CHUNKS:
+            cleared_flags |= WEBP_METADATA_CHUNKS[chunk_type]
+        else:
+            out.append(data[pos:end])
+        pos = end
+    body = b"".join(out)
+    if cleared_flags and body[:4] == b"VP8X":
+        body = body[:8] + bytes([body[8] & ~cleared_flags & 0xFF]) + body[9:]
+    return width, height, b"RIFF" + struct.pack("<I", len(body) + 4) + b"WEBP" + body
+
+
+PARSERS: dict[str, Callable[[bytes], Tuple[int, int, bytes]]] = {
+    "jpg": _jpeg,
+    "png": _png,
+    "gif": _gif,
+    "webp": _webp,
+}
+
+
+def validate_image(data: bytes, max_side: int, max_pixels: int) -> Tuple[str, bytes]:
+    """
+    Проверяет изображение и удаляет из него метаданные.
+
+    Формат определяется по сигнатуре, размеры читаются из заголовков без
+    декодирования пикселей, поэтому «бомба» с огромными размерами отбрасывается
+    до того, как на нее будет потрачена память. Из файла удаляются EXIF,
+    XMP и текстовые метаданные (в том числе геометки). Функция не зависит
+    от приложения и выполняется в отдельном процессе.
+
+    :param data: Содержимое файла.
+    :param max_side: Максимальная ширина и высота в пикселях.
+    :param max_pixels: Максимальное количество пикселей.
+    :raises MediaValidationError: Если формат не поддерживается или файл поврежден.
+    :raises MediaTooLargeError: Если размеры изображения превышают лимиты.
+    :return: Расширение файла и содержимое без метаданных.
+    """
+    kind = sniff(data)
+    if kind is None:
+        raise MediaValidationError("Поддерживаются только изображения JPEG, PNG, GIF и WebP")
+    width, height, clean = PARSERS[kind](data)
+    if width <= 0 or height <= 0:
+        raise MediaValidationError("Некорректные размеры изображения")
+    if width > max_side or height > max_side or width * height > max_pixels:
+        raise MediaTooLargeError(f"Изображение {width}x{height} превышает допустимые размеры")
+    return kind, clean
+
+
+def prepare_upload(data: bytes, max_side: int, max_pixels: int) -> Tuple[str, bytes, str]:
+    """
+    Проверка изображения и хеш очищенного содержимого для URL медиафайла.
+
+    :param data: Содержимое файла.
+    :param max_side: Максимальная ширина и высота в пикселях.
+    :param max_pixels: Максимальное количество пикселей.
+    :return: Расширение файла, содержимое без метаданных и его SHA-256 в hex.
+    """
+    kind, clean = validate_image(data, max_side, max_pixels)
+    return kind, clean, hashlib.sha256(clean).hexdigest()
+
+
+class ValidationPool:
+    """
+    Ограниченный пул процессов для проверки медиафайлов.
+
+    Проверка выполняется вне event loop и вне процесса воркера, поэтому
+    тяжелые файлы не занимают CPU и память обработчиков запросов. Очередь
+    ограничена: когда в работе уже ``workers + queue_size`` задач, новая
+    задача сразу отклоняется с PoolFullError, и клиент получает 429.
+
+    Attributes:
+        workers (int): Количество процессов.
+        queue_size (int): Сколько задач может ждать свободный процесс.
+    """
+
+    def __init__(self, workers: int, queue_size: int) -> None:
+        """
+        Создает пул, сами процессы запускаются при первой задаче.
+
+        :param workers: Количество процессов.
+        :param queue_size: Сколько задач может ждать свободный процесс.
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Количество задач в работе и в очереди."""
+        return self._pending
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """
+        Выполнить функцию в пуле процессов.
+
+        :param func: Функция уровня модуля (передается в процесс через pickle).
+        :param args: Аргументы функции.
+        :raises PoolFullError: Если очередь заполнена.
+        :return: Результат функции.
+        """
+        if self._pending >= self.workers + self.queue_size:
+            raise PoolFullError("Очередь на проверку медиафайлов заполнена")
+        if self._executor is None:
+            # spawn: дочерние процессы не наследуют event loop и соединения с БД
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args))
+        finally:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        """Остановить процессы пула."""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
@@ -1,4 +1,5 @@
 import asyncio
+import re
 import sys
 from logging.config import fileConfig
 from os.path import abspath, dirname
@@ -41,6 +42,17 @@ if config.config_file_name is not None:
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
+# Секции секционированных таблиц создаются DDL-командами, а не моделями
+partitioned_tables = [
+    table.name for table in target_metadata.tables.values() if table.dialect_options["postgresql"]["partition_by"]
+]
+
+
+def include_object(object, name, type_, reflected, compare_to) -> bool:
+    """Не даем autogenerate удалять секции, которых нет в метаданных моделей."""
+    if type_ == "table" and reflected and compare_to is None:
+        return not any(re.fullmatch(rf"{table}_p\d+", name) for table in partitioned_tables)
+    return True
 
 
 # other values from the config, defined by the needs of env.py,
@@ -65,6 +77,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         compare_type=True,
         dialect_opts={"paramstyle": "named"},
@@ -75,7 +88,7 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
 
     with context.begin_transaction():
         context.run_migrations()
@@ -0,0 +1,62 @@
+import asyncio
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.config import logger
+
+# Количество хеш-секций таблицы лайков. Изменение требует пересоздания таблицы миграцией.
+LIKES_PARTITIONS = 8
+
+
+def hash_partitions_ddl(table: str, partitions: int) -> List[str]:
+    """
+    DDL для создания хеш-секций секционированной таблицы.
+
+    Команды идемпотентны, поэтому их можно выполнять повторно.
+
+    :param table: Имя секционированной таблицы.
+    :param partitions: Количество секций (модуль хеша).
+    :return: Список SQL-команд CREATE TABLE ... PARTITION OF.
+    """
+    return [
+        f"CREATE TABLE IF NOT EXISTS {table}_p{remainder} PARTITION OF {table} "
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        for remainder in range(partitions)
+    ]
+
+
+async def ensure_partitions(conn: AsyncConnection) -> None:
+    """
+    Создает недостающие секции секционированных таблиц.
+
+    У хеш-секционированной таблицы нет секции по умолчанию, поэтому строка,
+    для которой нет секции, не вставится. Команда восстанавливает такие секции.
+
+    :param conn: Асинхронное соединение с БД.
+    """
+    for statement in hash_partitions_ddl("likes", LIKES_PARTITIONS):
+        await conn.execute(text(statement))
+
+
+async def main() -> None:
+    """Обслуживание секций в основной БД: `python -m app.partitions`."""
+    from app.database import engine
+
+    async with engine.begin() as conn:
+        await ensure_partitions(conn)
+        res = await conn.execute(
+            text(
+                "SELECT parent.relname, count(*) FROM pg_inherits "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent WHERE parent.relkind = 'p' "
+                "GROUP BY parent.relname ORDER BY parent.relname"
+            )
+        )
+        for table, count in res.all():
+            logger.info(f"Таблица {table}: секций {count}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
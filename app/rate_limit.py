@@ -0,0 +1,268 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine, List, Optional, Protocol, Tuple
+from urllib.parse import urlparse
+
+from fastapi import Depends, HTTPException, Request
+
+from app.config import logger, settings
+from app.dependencies import api_key_header
+
+
+class RateLimitBackend(Protocol):
+    """Хранилище корзин токенов."""
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Забрать один токен из корзины.
+
+        :param key: Ключ корзины.
+        :param rate: Скорость пополнения, токенов в секунду.
+        :param burst: Емкость корзины.
+        :return: 0, если токен выдан, иначе сколько секунд ждать следующего токена.
+        """
+
+
+def refill(tokens: float, updated_at: float, now: float, rate: float, burst: int) -> Tuple[float, float]:
+    """
+    Пересчитать корзину токенов и попытаться забрать один токен.
+
+    :param tokens: Токенов в корзине на момент updated_at.
+    :param updated_at: Момент последнего пересчета.
+    :param now: Текущий момент.
+    :param rate: Скорость пополнения, токенов в секунду.
+    :param burst: Емкость корзины.
+    :return: Токенов после запроса и сколько секунд ждать (0, если токен выдан).
+    """
+    tokens = min(float(burst), tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryBackend:
+    """
+    Корзины токенов в памяти процесса.
+
+    На ключ хранится только пара (токены, время). Корзина, которая простояла
+    дольше времени полного пополнения, ничем не отличается от новой, поэтому
+    такие ключи вытесняются при следующих обращениях. Общий размер ограничен
+    ``max_keys``: при переполнении вытесняются давно не использованные ключи.
+
+    Attributes:
+        max_keys (int): Максимальное количество корзин в памяти.
+    """
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        """
+        Создает пустое хранилище.
+
+        :param max_keys: Максимальное количество корзин в памяти.
+        """
+        self.max_keys = max_keys
+        # ключ -> (токены, время пересчета, время, после которого корзина полна)
+        self._buckets: OrderedDict[str, Tuple[float, float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Количество корзин в памяти."""
+        return len(self._buckets)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Забрать один токен из корзины.
+
+        :param key: Ключ корзины.
+        :param rate: Скорость пополнения, токенов в секунду.
+        :param burst: Емкость корзины.
+        :return: 0, если токен выдан, иначе сколько секунд ждать следующего токена.
+        """
+        now = time.monotonic()
+        tokens, updated_at, _ = self._buckets.pop(key, (float(burst), now, now))
+        tokens, wait = refill(tokens, updated_at, now, rate, burst)
+        self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        self._evict(now)
+        return wait
+
+    def _evict(self, now: float) -> None:
+        """Вытесняет полные (простаивающие) корзины и корзины сверх лимита из начала очереди."""
+        while self._buckets:
+            key, (_, _, full_at) = next(iter(self._buckets.items()))
+            if full_at > now and len(self._buckets) <= self.max_keys:
+                break
+            del self._buckets[key]
+
+
+class RespClient:
+    """
+    Минимальный асинхронный клиент протокола Redis (RESP2).
+
+    Одно соединение на процесс, команды выполняются по очереди. Если команда
+    не завершилась (ошибка, таймаут или отмена запроса), ответ на нее мог
+    остаться непрочитанным, поэтому соединение закрывается: иначе следующая
+    команда прочитала бы чужой ответ.
+    """
+
+    def __init__(self, url: str, timeout: float = 0.5) -> None:
+        """
+        Создает клиент, соединение открывается при первой команде.
+
+        :param url: Адрес вида redis://[:пароль@]хост:порт/номер_БД.
+        :param timeout: Сколько секунд ждать подключения и ответа на команду.
+        """
+        self.timeout = timeout
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        """Открывает соединение, авторизуется и выбирает БД."""
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._command("AUTH", self.password)
+        if self.db:
+            await self._command("SELECT", self.db)
+
+    async def _command(self, *args: Any) -> Any:
+        """Отправляет команду по открытому соединению и читает ответ."""
+        assert self._reader is not None and self._writer is not None
+        parts = [str(arg).encode() for arg in args]
+        self._writer.write(b"*%d\r\n" % len(parts) + b"".join(b"$%d\r\n%s\r\n" % (len(part), part) for part in parts))
+        await self._writer.drain()
+        return await self._read()
+
+    async def _read(self) -> Any:
+        """Читает один ответ RESP."""
+        assert self._reader is not None
+        line = (await self._reader.readuntil(b"\r\n"))[:-2]
+        kind, payload = line[:1], line[1:]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise ConnectionError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            if int(payload) < 0:
+                return None
+            return (await self._reader.readexactly(int(payload) + 2))[:-2].decode()
+        if kind == b"*":
+            return [await self._read() for _ in range(int(payload))]
+        raise ConnectionError(f"Неизвестный ответ RESP: {line!r}")
+
+    async def execute(self, *args: Any) -> Any:
+        """
+        Выполнить команду, при необходимости переподключившись.
+
+        :param args: Команда и ее аргументы.
+        :return: Ответ сервера.
+        """
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await asyncio.wait_for(self._connect(), self.timeout)
+                return await asyncio.wait_for(self._command(*args), self.timeout)
+            except BaseException:
+                await self.close()
+                raise
+
+    async def close(self) -> None:
+        """Закрыть соединение."""
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+
+
+class RespBackend:
+    """
+    Корзины токенов в Redis (или любом сервере с протоколом RESP), общие для всех воркеров.
+
+    Корзина хранится в одном ключе как "токены:время" и живет (PX) ровно
+    столько, сколько нужно на полное пополнение: простаивающие ключи удаляет сам сервер.
+    Используются только GET и SET, поэтому при одновременных запросах одного
+    клиента с разных воркеров лимит может быть превышен на несколько запросов.
+    """
+
+    def __init__(self, client: RespClient) -> None:
+        """
+        Создает хранилище поверх клиента.
+
+        :param client: Клиент протокола RESP.
+        """
+        self.client = client
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Забрать один токен из корзины.
+
+        :param key: Ключ корзины.
+        :param rate: Скорость пополнения, токенов в секунду.
+        :param burst: Емкость корзины.
+        :return: 0, если токен выдан, иначе сколько секунд ждать следующего токена.
+        """
+        now = time.time()
+        stored = await self.client.execute("GET", f"rate_limit:{key}")
+        tokens, updated_at = (float(value) for value in stored.split(":")) if stored else (float(burst), now)
+        tokens, wait = refill(tokens, updated_at, now, rate, burst)
+        ttl_ms = max(1, math.ceil((burst - tokens) / rate * 1000))
+        await self.client.execute("SET", f"rate_limit:{key}", f"{tokens}:{now}", "PX", ttl_ms)
+        return wait
+
+
+def make_backend() -> RateLimitBackend:
+    """Хранилище корзин по настройке RATE_LIMIT_BACKEND."""
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        return RespBackend(RespClient(settings.RATE_LIMIT_REDIS_URL, settings.RATE_LIMIT_REDIS_TIMEOUT))
+    return MemoryBackend()
+
+
+backend: RateLimitBackend = make_backend()
+
+
+def rate_limit(route_class: str) -> Callable[..., Coroutine[Any, Any, None]]:
+    """
+    Зависимость, ограничивающая частоту запросов по api-key для класса маршрутов.
+
+    Лимиты класса берутся из RATE_LIMITS: (токенов в секунду, емкость корзины).
+    Сначала проверяется корзина IP клиента с лимитом в RATE_LIMIT_IP_FACTOR раз
+    больше, затем корзина api-key. Ключ на этом этапе еще не проверен, поэтому
+    без корзины IP клиент со случайным ключом в каждом запросе получал бы новую
+    корзину и вытеснял настоящие. IP берется из X-Forwarded-For, только если
+    запрос пришел от прокси из SERVER_FORWARDED_ALLOW_IPS. При превышении возвращается 429 с заголовком
+    Retry-After. Если хранилище недоступно, запросы пропускаются.
+
+    :param route_class: Класс маршрутов: read, write, like или media.
+    :return: Зависимость FastAPI.
+    """
+
+    async def limiter(request: Request, api_key: Optional[str] = Depends(api_key_header)) -> None:
+        """Забирает токен из корзины клиента или отвечает 429."""
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        rate, burst = settings.RATE_LIMITS[route_class]
+        factor = settings.RATE_LIMIT_IP_FACTOR
+        host = request.client.host if request.client else "unknown"
+        try:
+            wait = await backend.take(f"{route_class}:ip:{host}", rate * factor, math.ceil(burst * factor))
+            if not wait and api_key:
+                wait = await backend.take(f"{route_class}:{api_key}", rate, burst)
+        except Exception as e:
+            logger.error(f"Хранилище лимитов недоступно, запрос пропущен: {e!r}")
+            return
+        if wait > 0:
+            raise HTTPException(
+                status_code=429,
+                detail="Слишком много запросов, повторите позже",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    return limiter
+
+
+__all__: List[str] = ["MemoryBackend", "RespBackend", "RespClient", "backend", "rate_limit", "refill"]
@@ -0,0 +1,123 @@
+import asyncio
+from typing import Dict
+
+from sqlalchemy import exists, func, or_, select, update as sqlalchemy_update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import logger
+from app.medias.dao import MediaDAO
+from app.medias.gc import remove_media_files
+from app.tweets.dao import LikeDAO, TweetDAO, TweetMediaDAO
+from app.tweets.models import Like, Tweet, TweetMedia
+from app.users.dao import FollowCandidateDAO, FollowDAO, UserDAO
+from app.users.models import Follow, FollowCandidate, User
+
+# Ключ advisory-блокировки: одновременно чистит только один воркер
+REAPER_LOCK_KEY = 1
+
+
+async def reap_once(async_session: AsyncSession, batch_size: int) -> Dict[str, int]:
+    """
+    Одна пачка фоновой очистки мягко удаленных пользователей и твитов.
+
+    Каждый шаг удаляет не больше ``batch_size`` строк, поэтому транзакция короткая
+    и не держит блокировки, как синхронный каскад ON DELETE CASCADE.
+    Сначала вычищаются зависимые строки (лайки, привязки медиа, подписки
+    с вычитанием путей через них из кандидатов для рекомендаций),
+    потом сами твиты и пользователи, у которых зависимых строк не осталось.
+    Медиафайлы, которые больше не привязаны ни к одному твиту, удаляются
+    из БД и с диска.
+
+    :param async_session: Асинхронная сессия базы данных.
+    :param batch_size: Размер пачки для каждого шага.
+    :return: Количество обработанных строк по шагам, пустой словарь, если очисткой занят другой воркер.
+    """
+    deleted_users = select(User.id).where(User.deleted_at.is_not(None))
+    deleted_tweets = select(Tweet.id).where(Tweet.deleted_at.is_not(None))
+    async with async_session as session:
+        async with session.begin():
+            try:
+                if not (await session.execute(select(func.pg_try_advisory_xact_lock(REAPER_LOCK_KEY)))).scalar():
+                    return {}
+                # Твиты удаленных пользователей тоже помечаем удаленными
+                user_tweets = (
+                    select(Tweet.id)
+                    .where(Tweet.user_id.in_(deleted_users), Tweet.deleted_at.is_(None))
+                    .limit(batch_size)
+                )
+                marked = await session.execute(
+                    sqlalchemy_update(Tweet)
+                    .where(Tweet.id.in_(user_tweets))
+                    .values(deleted_at=func.now())
+                    .execution_options(synchronize_session=False)
+                )
+                likes = await LikeDAO.purge_batch(session, Like.tweet_id.in_(deleted_tweets), limit=batch_size)
+                user_likes = await LikeDAO.purge_batch(session, Like.user_id.in_(deleted_users), limit=batch_size)
+                links = await TweetMediaDAO.purge_batch(
+                    session, TweetMedia.tweet_id.in_(deleted_tweets), limit=batch_size
+                )
+                tweets = await TweetDAO.purge_batch(
+                    session,
+                    Tweet.deleted_at.is_not(None),
+                    ~exists().where(Like.tweet_id == Tweet.id),
+                    ~exists().where(TweetMedia.tweet_id == Tweet.id),
+                    limit=batch_size,
+                )
+                follows = await FollowDAO.purge_follows(
+                    session,
+                    or_(Follow.user_id.in_(deleted_users), Follow.follower_id.in_(deleted_users)),
+                    limit=batch_size,
+                )
+                candidates = await FollowCandidateDAO.purge_batch(
+                    session,
+                    or_(FollowCandidate.user_id.in_(deleted_users), FollowCandidate.candidate_id.in_(deleted_users)),
+                    limit=batch_size,
+                )
+                users = await UserDAO.purge_batch(
+                    session,
+                    User.deleted_at.is_not(None),
+                    ~exists().where(Tweet.user_id == User.id),
+                    ~exists().where(Like.user_id == User.id),
+                    ~exists().where(or_(Follow.user_id == User.id, Follow.follower_id == User.id)),
+                    ~exists().where(or_(FollowCandidate.user_id == User.id, FollowCandidate.candidate_id == User.id)),
+                    limit=batch_size,
+                )
+                medias = await MediaDAO.purge_orphans(session, {link.media_id for link in links})
+                await session.commit()
+            except SQLAlchemyError as e:
+                await session.rollback()
+                raise e
+    # Файлы удаляем только после фиксации транзакции
+    remove_media_files(medias)
+    return {
+        "tweets_marked": marked.rowcount,
+        "likes": len(likes) + len(user_likes),
+        "tweet_medias": len(links),
+        "tweets": len(tweets),
+        "follows": len(follows) + len(candidates),
+        "users": len(users),
+        "medias": len(medias),
+    }
+
+
+async def run(session_maker: async_sessionmaker[AsyncSession], interval: float, batch_size: int) -> None:
+    """
+    Фоновая очистка: пачки идут подряд, пока есть что удалять, затем пауза ``interval``.
+
+    :param session_maker: Фабрика асинхронных сессий.
+    :param interval: Пауза между проверками в секундах, когда удалять нечего.
+    :param batch_size: Размер пачки для каждого шага.
+    """
+    while True:
+        try:
+            async with session_maker() as session:
+                stats = await reap_once(session, batch_size)
+        except Exception as e:
+            logger.error(f"Фоновая очистка удаленных данных не удалась: {e!r}")
+            stats = {}
+        if any(stats.values()):
+            logger.info(f"Фоновая очистка удаленных данных: {stats}")
+            await asyncio.sleep(0)
+        else:
+            await asyncio.sleep(interval)
@@ -0,0 +1,82 @@
+import asyncio
+import os
+
+import uvicorn
+
+from app.config import logger, settings
+
+
+def available_cpus() -> int:
+    """
+    Количество ядер, доступных процессу.
+
+    Учитывается привязка процесса к ядрам и квота CPU из cgroup v2,
+    которую выставляет docker (`deploy.resources.limits.cpus`).
+
+    :return: Количество доступных ядер, не меньше одного.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            cpus = min(cpus, -(-int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(cpus, 1)
+
+
+def workers_count() -> int:
+    """
+    Количество воркеров продакшн-сервера.
+
+    :return: SERVER_WORKERS из настроек или число доступных ядер, если он равен 0.
+    """
+    return settings.SERVER_WORKERS or available_cpus()
+
+
+async def _prepare() -> None:
+    """Один раз подготавливает БД в главном процессе и закрывает его соединения перед запуском воркеров."""
+    from app.database import engine
+    from app.startup import prepare_database
+
+    await prepare_database()
+    await engine.dispose()
+
+
+def main() -> None:
+    """
+    Запуск приложения в продакшн-режиме на всех доступных ядрах.
+
+    Миграции и тестовые данные (если включены) готовятся один раз в главном процессе,
+    после чего подготовка отключается для воркеров через окружение. Воркеры uvicorn
+    запускаются как новые процессы (spawn), поэтому каждый импортирует приложение
+    заново и создает собственный движок и пул соединений с БД.
+    """
+    asyncio.run(_prepare())
+    # Воркеры читают настройки из окружения, единственный воркер работает в этом же процессе
+    os.environ["DB_MIGRATE_ON_STARTUP"] = "false"
+    os.environ["DB_SEED_ON_STARTUP"] = "false"
+    settings.DB_MIGRATE_ON_STARTUP = settings.DB_SEED_ON_STARTUP = False
+    workers = workers_count()
+    logger.info(f"Запуск сервера: воркеров {workers}, loop={settings.SERVER_LOOP}, http={settings.SERVER_HTTP}")
+    uvicorn.run(
+        app="app.main:app",
+        host=settings.SERVER_HOST,
+        port=settings.SERVER_PORT,
+        workers=workers,
+        loop=settings.SERVER_LOOP,
+        http=settings.SERVER_HTTP,
+        backlog=settings.SERVER_BACKLOG,
+        timeout_keep_alive=settings.SERVER_KEEP_ALIVE,
+        proxy_headers=True,
+        forwarded_allow_ips=settings.SERVER_FORWARDED_ALLOW_IPS,
+        access_log=settings.DEBUG,
+    )
+
+
+if __name__ == "__main__":
+    main()
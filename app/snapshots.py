@@ -0,0 +1,201 @@
+import gzip
+import math
+import time
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import List, NamedTuple, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.database import replica_sessions
+from app.invalidation import invalidation
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Заголовки ответа, которые пересчитываются при отдаче снимка
+SKIP_HEADERS = {b"content-length", b"content-encoding", b"vary"}
+
+SnapshotKey = Tuple[str, bytes, str]
+
+
+class Snapshot(NamedTuple):
+    """
+    Готовый ответ эндпоинта.
+
+    Attributes:
+        version (int): Версия данных, при которой построен ответ.
+        status (int): HTTP-статус.
+        headers (List[Tuple[bytes, bytes]]): Заголовки ответа без длины и кодировки.
+        body (bytes): Тело ответа.
+        gzipped (bytes): Тело ответа, сжатое gzip.
+        expires (float): Момент по time.monotonic(), после которого снимок устарел.
+    """
+
+    version: int
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    gzipped: bytes
+    expires: float
+
+
+class SnapshotStore:
+    """
+    Снимки ответов по ключу (путь, строка запроса, api-key), LRU с ограничением размера.
+
+    Снимок действителен, пока не изменилась версия данных
+    (app.invalidation.invalidation.version): она растет при каждой записи
+    в этом процессе и при каждом уведомлении об изменении из других воркеров.
+
+    Если чтения идут с реплик, ответ, построенный уже после роста версии,
+    мог прочитать реплику, которая еще не получила запись. Поэтому снимки
+    в этом случае живут не дольше ``ttl`` секунд - больше отставания реплики.
+
+    Attributes:
+        max_entries (int): Максимальное количество снимков.
+        max_bytes (int): Ответы длиннее не сохраняются.
+        ttl (Optional[float]): Время жизни снимка в секундах, None - до изменения данных.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: Optional[float] = None) -> None:
+        """
+        Создает пустое хранилище.
+
+        :param max_entries: Максимальное количество снимков.
+        :param max_bytes: Ответы длиннее не сохраняются.
+        :param ttl: Время жизни снимка в секундах, None - до изменения данных.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._snapshots: OrderedDict[SnapshotKey, Snapshot] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Количество снимков."""
+        return len(self._snapshots)
+
+    def get(self, key: SnapshotKey, version: int) -> Optional[Snapshot]:
+        """
+        Действительный снимок.
+
+        :param key: Ключ снимка.
+        :param version: Текущая версия данных.
+        :return: Снимок или None, если его нет или он устарел.
+        """
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            return None
+        if snapshot.version != version or snapshot.expires <= time.monotonic():
+            del self._snapshots[key]
+            return None
+        self._snapshots.move_to_end(key)
+        return snapshot
+
+    def put(self, key: SnapshotKey, version: int, status: int, headers: List[Tuple[bytes, bytes]], body: bytes) -> None:
+        """
+        Сохранить ответ, сжав его один раз.
+
+        :param key: Ключ снимка.
+        :param version: Версия данных на момент начала запроса.
+        :param status: HTTP-статус.
+        :param headers: Заголовки ответа.
+        :param body: Тело ответа.
+        """
+        if len(body) > self.max_bytes:
+            return
+        headers = [(name, value) for name, value in headers if name.lower() not in SKIP_HEADERS]
+        expires = math.inf if self.ttl is None else time.monotonic() + self.ttl
+        self._snapshots[key] = Snapshot(version, status, headers, body, gzip.compress(body, compresslevel=6), expires)
+        self._snapshots.move_to_end(key)
+        while len(self._snapshots) > self.max_entries:
+            self._snapshots.popitem(last=False)
+
+
+class SnapshotMiddleware:
+    """
+    ASGI-middleware: повторные GET-запросы выбранных api-key отдаются готовыми байтами.
+
+    Для api-key из SNAPSHOT_API_KEYS и путей из SNAPSHOT_PATHS ответ 200
+    сохраняется целиком (тело и его gzip) и при той же версии данных отдается
+    без обращения к роутеру, ORM и Pydantic. Ответ на любой небезопасный запрос
+    (POST, PUT, DELETE) увеличивает версию данных до того, как клиент его получит.
+    """
+
+    def __init__(self, app: ASGIApp, store: Optional[SnapshotStore] = None) -> None:
+        """
+        Оборачивает приложение.
+
+        :param app: ASGI-приложение.
+        :param store: Хранилище снимков, по умолчанию - общее для процесса.
+        """
+        self.app = app
+        self.store = snapshots if store is None else store
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Отдает снимок, строит его или пропускает запрос дальше."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if scope["method"] not in SAFE_METHODS:
+            await self.app(scope, receive, self._bump_on_start(send))
+            return
+        headers = dict(scope["headers"])
+        api_key = headers.get(b"api-key", b"").decode("latin-1")
+        cacheable = scope["method"] == "GET" and api_key in settings.SNAPSHOT_API_KEYS
+        if not cacheable or not any(fnmatchcase(scope["path"], pattern) for pattern in settings.SNAPSHOT_PATHS):
+            await self.app(scope, receive, send)
+            return
+        key: SnapshotKey = (scope["path"], scope["query_string"], api_key)
+        accepts_gzip = b"gzip" in headers.get(b"accept-encoding", b"")
+        version = invalidation.version
+        snapshot = self.store.get(key, version)
+        if snapshot is not None:
+            await self._send_snapshot(snapshot, accepts_gzip, send)
+            return
+        start: Message = {}
+        chunks: List[bytes] = []
+
+        async def capture(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False) and start.get("status") == 200:
+                    self.store.put(key, version, start["status"], list(start.get("headers", [])), b"".join(chunks))
+            await send(message)
+
+        await self.app(scope, receive, capture)
+
+    @staticmethod
+    def _bump_on_start(send: Send) -> Send:
+        """Обертка send, увеличивающая версию данных перед отправкой ответа на запись."""
+
+        async def wrapped(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                invalidation.bump()
+            await send(message)
+
+        return wrapped
+
+    @staticmethod
+    async def _send_snapshot(snapshot: Snapshot, accepts_gzip: bool, send: Send) -> None:
+        """Отправить снимок, сжатый, если клиент принимает gzip."""
+        body = snapshot.gzipped if accepts_gzip else snapshot.body
+        headers = [
+            *snapshot.headers,
+            (b"content-length", str(len(body)).encode()),
+            (b"vary", b"accept-encoding"),
+            (b"x-snapshot", b"hit"),
+        ]
+        if accepts_gzip:
+            headers.append((b"content-encoding", b"gzip"))
+        await send({"type": "http.response.start", "status": snapshot.status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+snapshots = SnapshotStore(
+    settings.SNAPSHOT_MAX_ENTRIES,
+    settings.SNAPSHOT_MAX_BYTES,
+    settings.DB_READ_YOUR_WRITES_SECONDS if replica_sessions else None,
+)
@@ -0,0 +1,57 @@
+import os.path
+
+from app.config import logger, settings
+from app.database import Base, async_session, engine
+from app.medias.dao import MediaDAO
+from app.tweets.dao import LikeDAO, TweetDAO, TweetMediaDAO
+from app.users.dao import FollowCandidateDAO, FollowDAO, UserDAO
+
+
+def run_migrations() -> None:
+    """Применяет миграции alembic к основной БД, если приложение запущено из каталога проекта."""
+    from migrations_script import run_alembic_command
+
+    logger.info("Перед первым запуском необходимо убедиться в актуальности версии миграции")
+    if os.path.split(os.getcwd())[1] == "app":
+        run_alembic_command("cd ..; alembic upgrade head;alembic current")
+    elif os.path.split(os.getcwd())[1] == "kill_twitter":
+        run_alembic_command("alembic upgrade head;alembic current")
+
+
+async def seed_database() -> None:
+    """
+    Пересоздает таблицы основной БД и заполняет их тестовыми данными.
+
+    Фабрики тестовых данных (Faker, factory_boy) импортируются только здесь,
+    чтобы не загружать их в продакшн-процессы с выключенным заполнением.
+    """
+    from app.data_generate import (
+        MediaFactory,
+        TweetFactory,
+        generate_follow,
+        generate_likes,
+        generate_tweet_media,
+        generate_users,
+    )
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with async_session() as session:
+        await UserDAO.add(session, **{"first_name": "Test_name", "last_name": "Test_surname", "api_key": "test"})
+        [await UserDAO.add(session, **user.to_dict()) for user in generate_users(100)]
+        [await FollowDAO.add(session, **follow.to_dict()) for follow in generate_follow(100)]
+        [await MediaDAO.add(session, **MediaFactory().to_dict()) for _ in range(1, 21)]
+        [await TweetDAO.add(session, **TweetFactory().to_dict()) for _ in range(100)]
+        [await LikeDAO.add(session, **like.to_dict()) for like in generate_likes(100)]
+        [await TweetMediaDAO.add(session, **inst.to_dict()) for inst in generate_tweet_media(100)]
+        await FollowCandidateDAO.rebuild(session)
+
+
+async def prepare_database() -> None:
+    """Подготовка БД перед приемом запросов: миграции и тестовые данные, если они включены в настройках."""
+    if settings.DB_MIGRATE_ON_STARTUP:
+        run_migrations()
+    if settings.DB_SEED_ON_STARTUP:
+        await seed_database()
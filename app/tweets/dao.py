@@ -1,11 +1,17 @@
-from typing import Any, Dict, List, Optional, Type
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
 
-from sqlalchemy import select
+from sqlalchemy import Integer, and_, column, delete as sqlalchemy_delete, func, literal, select, true, tuple_, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from app.dao.base import BaseDAO
+from app.dao.base import BaseDAO, statement_timeout
+from app.dao.single_flight import single_flight
+from app.invalidation import invalidation, row_key
+from app.medias.models import Media
 from app.tweets.models import Like, Tweet, TweetMedia
+from app.users.models import User
 
 
 class TweetDAO(BaseDAO[Tweet]):
@@ -18,25 +24,81 @@ class TweetDAO(BaseDAO[Tweet]):
     model: Type[Tweet] = Tweet
 
     @classmethod
+    @single_flight
+    @statement_timeout
     async def find_all(
         cls, async_session: AsyncSession, **filter_by: Optional[Dict[str, Any]]
     ) -> Optional[List[Tweet]]:
         """
         Получить все твиты с возможностью фильтрации.
 
+        Мягко удаленные твиты и твиты удаленных пользователей не возвращаются.
+        Связанные данные (авторы, лайки, медиа) не загружаются: для ленты
+        их пачками подгружает FeedLoader.
+
         :param async_session: Асинхронная сессия SQLAlchemy для выполнения запросов.
         :param filter_by: Дополнительные параметры фильтрации в виде именованных аргументов.
                           Например, можно передать {'user_id': 1} для фильтрации твитов конкретного пользователя.
         :return: Список объектов Tweet, соответствующих запросу.
         """
         async with async_session as session:
-            query = select(cls.model).options(
-                selectinload(cls.model.user), selectinload(cls.model.likes), selectinload(cls.model.tweets_media)
+            query = (
+                cls._visible(select(cls.model))
+                .join(User, User.id == cls.model.user_id)
+                .where(User.deleted_at.is_(None))
             )
             res = await session.execute(query)
-            tweets = res.unique().scalars().all()
+            tweets = res.scalars().all()
             return list(tweets) if tweets else None  # Возвращаем None, если твиты не найдены
 
+    @classmethod
+    @statement_timeout
+    async def find_by_ids(cls, async_session: AsyncSession, tweet_ids: Iterable[int]) -> Dict[int, Tweet]:
+        """
+        Видимые твиты по списку id одним запросом.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param tweet_ids: ID твитов.
+        :return: Твит по id, удаленные твиты и твиты удаленных пользователей пропускаются.
+        """
+        async with async_session as session:
+            query = (
+                cls._visible(select(cls.model))
+                .join(User, User.id == cls.model.user_id)
+                .where(cls.model.id.in_(list(tweet_ids)), User.deleted_at.is_(None))
+            )
+            return {tweet.id: tweet for tweet in (await session.execute(query)).scalars()}
+
+    @classmethod
+    @statement_timeout
+    async def popularity(cls, async_session: AsyncSession) -> List[Tuple[int, int, float, int]]:
+        """
+        Число лайков, автор и возраст всех видимых твитов для доски популярных твитов.
+
+        Возраст считается в БД (now() - created_at), поэтому не зависит от часового пояса.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :return: Строки (id твита, id автора, возраст в секундах, число лайков).
+        """
+        async with async_session as session:
+            likes = select(Like.tweet_id, func.count().label("likes")).group_by(Like.tweet_id).subquery()
+            query = (
+                cls._visible(
+                    select(
+                        cls.model.id,
+                        cls.model.user_id,
+                        func.extract("epoch", func.now() - cls.model.created_at),
+                        func.coalesce(likes.c.likes, 0),
+                    )
+                )
+                .join(User, User.id == cls.model.user_id)
+                .outerjoin(likes, likes.c.tweet_id == cls.model.id)
+                .where(User.deleted_at.is_(None))
+            )
+            return [
+                (tweet_id, user_id, float(age), likes) for tweet_id, user_id, age, likes in await session.execute(query)
+            ]
+
 
 class TweetMediaDAO(BaseDAO[TweetMedia]):
     """
@@ -47,6 +109,28 @@ class TweetMediaDAO(BaseDAO[TweetMedia]):
 
     model: Type[TweetMedia] = TweetMedia
 
+    @classmethod
+    @statement_timeout
+    async def attachments(cls, async_session: AsyncSession, tweet_ids: Iterable[int]) -> Dict[int, List[Media]]:
+        """
+        Медиафайлы нескольких твитов одним запросом с IN.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param tweet_ids: ID твитов.
+        :return: Медиафайлы по ID твита, в порядке ID медиафайла.
+        """
+        out: Dict[int, List[Media]] = defaultdict(list)
+        query = (
+            select(cls.model.tweet_id, Media)
+            .join(Media, Media.id == cls.model.media_id)
+            .where(cls.model.tweet_id.in_(list(tweet_ids)))
+            .order_by(cls.model.tweet_id, Media.id)
+        )
+        async with async_session as session:
+            for tweet_id, media in (await session.execute(query)).all():
+                out[tweet_id].append(media)
+        return out
+
 
 class LikeDAO(BaseDAO[Like]):
     """
@@ -56,3 +140,111 @@ class LikeDAO(BaseDAO[Like]):
     """
 
     model: Type[Like] = Like
+
+    @classmethod
+    async def add_or_ignore(cls, async_session: AsyncSession, **values) -> bool:
+        """
+        Идемпотентно поставить лайк (INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING).
+
+        Строка вставляется, только если твит и пользователь существуют и не удалены
+        мягко: лайк твита, удаленного после проверки в обработчике, не сохраняется.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param values: user_id, tweet_id и like.
+        :return: True, если лайк добавлен, False - если он уже был или твит или пользователь удален.
+        """
+        source = (
+            select(User.id, Tweet.id, literal(values.get("like", True)))
+            .join(User, User.id == values["user_id"])
+            .where(Tweet.id == values["tweet_id"], Tweet.deleted_at.is_(None), User.deleted_at.is_(None))
+        )
+        async with async_session as session:
+            async with session.begin():
+                query = (
+                    insert(cls.model)
+                    .from_select(["user_id", "tweet_id", "like"], source)
+                    .on_conflict_do_nothing()
+                    .returning(cls.model.user_id, cls.model.tweet_id)
+                )
+                try:
+                    result = await session.execute(query)
+                    keys = cls._keys(result.all())
+                    await invalidation.notify(session, cls.model.__tablename__, keys)
+                    await session.commit()
+                except SQLAlchemyError as e:
+                    await session.rollback()
+                    raise e
+        cls._invalidate(keys)
+        return bool(keys)
+
+    @classmethod
+    @statement_timeout
+    async def likers(cls, async_session: AsyncSession, tweet_ids: Iterable[int]) -> Dict[int, List[int]]:
+        """
+        ID лайкнувших пользователей для нескольких твитов одним запросом с IN.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param tweet_ids: ID твитов.
+        :return: ID пользователей по ID твита, в порядке ID пользователя.
+        """
+        out: Dict[int, List[int]] = defaultdict(list)
+        query = (
+            select(cls.model.tweet_id, cls.model.user_id)
+            .where(cls.model.tweet_id.in_(list(tweet_ids)))
+            .order_by(cls.model.tweet_id, cls.model.user_id)
+        )
+        async with async_session as session:
+            for tweet_id, user_id in (await session.execute(query)).all():
+                out[tweet_id].append(user_id)
+        return out
+
+    @classmethod
+    async def apply_batch(
+        cls, async_session: AsyncSession, likes: Sequence[Tuple[int, int]], unlikes: Sequence[Tuple[int, int]]
+    ) -> None:
+        """
+        Применить пачку лайков и отмен лайков двумя многострочными запросами.
+
+        Лайки вставляются одним INSERT ... SELECT FROM (VALUES ...) ON CONFLICT DO NOTHING,
+        пары с несуществующими или мягко удаленными твитом или пользователем отбрасываются
+        соединением с таблицами tweets и users, чтобы одна битая пара не откатывала всю пачку.
+        Отмены удаляются одним DELETE по списку пар; отдельное условие на tweet_id
+        позволяет планировщику читать только нужные секции таблицы лайков.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param likes: Пары (user_id, tweet_id), которые нужно лайкнуть.
+        :param unlikes: Пары (user_id, tweet_id), с которых нужно снять лайк.
+        """
+        keys = [row_key(pair) for pair in [*likes, *unlikes]]
+        async with async_session as session:
+            async with session.begin():
+                try:
+                    if likes:
+                        pending = values(
+                            column("user_id", Integer), column("tweet_id", Integer), name="pending_likes"
+                        ).data(list(likes))
+                        source = (
+                            select(pending.c.user_id, pending.c.tweet_id, true())
+                            .join(Tweet, and_(Tweet.id == pending.c.tweet_id, Tweet.deleted_at.is_(None)))
+                            .join(User, and_(User.id == pending.c.user_id, User.deleted_at.is_(None)))
+                        )
+                        await session.execute(
+                            insert(cls.model)
+                            .from_select(["user_id", "tweet_id", "like"], source)
+                            .on_conflict_do_nothing()
+                        )
+                    if unlikes:
+                        await session.execute(
+                            sqlalchemy_delete(cls.model)
+                            .where(
+                                cls.model.tweet_id.in_({tweet_id for _, tweet_id in unlikes}),
+                                tuple_(cls.model.user_id, cls.model.tweet_id).in_(list(unlikes)),
+                            )
+                            .execution_options(synchronize_session=False)
+                        )
+                    await invalidation.notify(session, cls.model.__tablename__, keys)
+                    await session.commit()
+                except SQLAlchemyError as e:
+                    await session.rollback()
+                    raise e
+        cls._invalidate(keys)
@@ -0,0 +1,171 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import logger, settings
+from app.tweets.dao import LikeDAO
+
+
+class LikeBuffer:
+    """
+    Буфер отложенной записи лайков (write-behind).
+
+    Лайки и отмены лайков копятся в памяти процесса и раз в интервал
+    записываются в БД одной пачкой. Операции сливаются по паре (user_id, tweet_id):
+    в буфере остается только итоговое состояние, поэтому лайк и следующая за ним
+    отмена превращаются в один идемпотентный DELETE, а серия повторных лайков - в одну вставку.
+    Операции хранятся по tweet_id, поэтому наложение буфера на лайки одного
+    твита при рендере ленты не зависит от размера всего буфера.
+
+    Attributes:
+        max_size (int): Размер буфера, при котором сброс запускается не дожидаясь интервала.
+    """
+
+    def __init__(self, max_size: int = 10000) -> None:
+        """
+        Создает пустой буфер.
+
+        :param max_size: Размер буфера, при котором сброс запускается не дожидаясь интервала.
+        """
+        self.max_size = max_size
+        # tweet_id -> {user_id: лайк или отмена}
+        self._pending: Dict[int, Dict[int, bool]] = {}
+        self._size = 0
+        # Пачка, которая сейчас пишется в БД: ее тоже видно при чтении
+        self._inflight: Dict[int, Dict[int, bool]] = {}
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        """Количество пар (user_id, tweet_id), ожидающих записи."""
+        return self._size
+
+    def push(self, user_id: int, tweet_id: int, like: bool) -> None:
+        """
+        Добавить лайк или отмену лайка в буфер.
+
+        :param user_id: ID пользователя.
+        :param tweet_id: ID твита.
+        :param like: True - лайк, False - отмена лайка.
+        """
+        ops = self._pending.setdefault(tweet_id, {})
+        if user_id not in ops:
+            self._size += 1
+        ops[user_id] = like
+        if self._size >= self.max_size:
+            self._full.set()
+
+    async def push_changed(self, async_session: AsyncSession, user_id: int, tweet_id: int, like: bool) -> bool:
+        """
+        Добавить лайк или отмену лайка в буфер и сообщить, меняет ли операция состояние пары.
+
+        Повторный лайк и отмена отсутствующего лайка не должны попадать в события
+        ленты, иначе счетчики популярных твитов завышаются до перезагрузки.
+        Если операций по паре в буфере нет, прежнее состояние читается из БД.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param user_id: ID пользователя.
+        :param tweet_id: ID твита.
+        :param like: True - лайк, False - отмена лайка.
+        :return: True, если состояние пары изменилось.
+        """
+        previous = self.state(user_id, tweet_id)
+        if previous is None:
+            liked = await LikeDAO.find_one_or_none(async_session=async_session, user_id=user_id, tweet_id=tweet_id)
+            # Пока шел запрос, пару мог изменить параллельный запрос
+            previous = self.state(user_id, tweet_id)
+            if previous is None:
+                previous = liked is not None
+        self.push(user_id, tweet_id, like)
+        return previous != like
+
+    def state(self, user_id: int, tweet_id: int) -> Optional[bool]:
+        """
+        Еще не записанное в БД состояние пары.
+
+        :param user_id: ID пользователя.
+        :param tweet_id: ID твита.
+        :return: True - лайк, False - отмена, None - операций в буфере нет.
+        """
+        like = self._pending.get(tweet_id, {}).get(user_id)
+        return self._inflight.get(tweet_id, {}).get(user_id) if like is None else like
+
+    def merge(self, tweet_id: int, user_ids: Iterable[int]) -> List[int]:
+        """
+        Наложить еще не записанные операции на лайки твита из БД (read-your-writes).
+
+        :param tweet_id: ID твита.
+        :param user_ids: ID пользователей, лайкнувших твит по данным БД.
+        :return: ID пользователей с учетом буфера.
+        """
+        state = {**self._inflight.get(tweet_id, {}), **self._pending.get(tweet_id, {})}
+        if not state:
+            return list(user_ids)
+        out = [user_id for user_id in user_ids if state.get(user_id, True)]
+        seen = set(out)
+        out.extend(user_id for user_id, like in state.items() if like and user_id not in seen)
+        return out
+
+    async def flush(self, async_session: AsyncSession) -> int:
+        """
+        Записать накопленные операции в БД.
+
+        При ошибке записи операции возвращаются в буфер, не перетирая
+        более новые операции, пришедшие во время сброса.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :return: Количество записанных операций.
+        """
+        async with self._lock:
+            batch, size = self._pending, self._size
+            self._pending, self._size = {}, 0
+            self._full.clear()
+            if not batch:
+                return 0
+            likes: List[Tuple[int, int]] = []
+            unlikes: List[Tuple[int, int]] = []
+            for tweet_id, ops in batch.items():
+                for user_id, like in ops.items():
+                    (likes if like else unlikes).append((user_id, tweet_id))
+            self._inflight = batch
+            try:
+                await LikeDAO.apply_batch(async_session=async_session, likes=likes, unlikes=unlikes)
+            except Exception:
+                for tweet_id, ops in batch.items():
+                    pending = self._pending.setdefault(tweet_id, {})
+                    for user_id, like in ops.items():
+                        if user_id not in pending:
+                            pending[user_id] = like
+                            self._size += 1
+                raise
+            finally:
+                self._inflight = {}
+            return size
+
+    async def run(self, session_maker: async_sessionmaker[AsyncSession], interval: float) -> None:
+        """
+        Периодически сбрасывать буфер, пока задача не будет отменена.
+
+        При отмене выполняется последний сброс, чтобы не потерять лайки при остановке.
+
+        :param session_maker: Фабрика асинхронных сессий.
+        :param interval: Интервал между сбросами в секундах.
+        """
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+                try:
+                    async with session_maker() as session:
+                        await self.flush(session)
+                except Exception as e:
+                    logger.error(f"Не удалось записать пачку лайков: {e!r}")
+        finally:
+            async with session_maker() as session:
+                await self.flush(session)
+
+
+like_buffer = LikeBuffer(max_size=settings.LIKES_BUFFER_MAX)
@@ -0,0 +1,97 @@
+from typing import Awaitable, Callable, Dict, Generic, Iterable, List, Optional, Set, TypeVar
+
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.dependencies import get_read_session, get_session
+from app.medias.models import Media
+from app.tweets.dao import LikeDAO, TweetMediaDAO
+from app.users.directory import directory
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class DataLoader(Generic[K, V]):
+    """
+    Пакетная загрузка с кэшем в пределах одного запроса.
+
+    Для ключей, которых еще нет в кэше, вызывается одна пакетная функция
+    (один запрос с IN), уже загруженные ключи повторно не запрашиваются.
+
+    Ключи, для которых пакетная функция ничего не вернула, получают значение
+    ``default()`` или, если фабрика не задана, не попадают в результат.
+    """
+
+    def __init__(
+        self, batch: Callable[[List[K]], Awaitable[Dict[K, V]]], default: Optional[Callable[[], V]] = None
+    ) -> None:
+        """
+        Создает загрузчик.
+
+        :param batch: Функция, загружающая значения для списка ключей.
+        :param default: Фабрика значения для ключей без данных.
+        """
+        self._batch = batch
+        self._default = default
+        self._cache: Dict[K, V] = {}
+        self._absent: Set[K] = set()
+
+    async def load_many(self, keys: Iterable[K]) -> Dict[K, V]:
+        """
+        Значения для ключей: недостающие загружаются одним пакетом.
+
+        :param keys: Ключи.
+        :return: Значение по ключу.
+        """
+        keys = list(dict.fromkeys(keys))
+        missing = [key for key in keys if key not in self._cache and key not in self._absent]
+        if missing:
+            loaded = await self._batch(missing)
+            for key in missing:
+                if key in loaded:
+                    self._cache[key] = loaded[key]
+                elif self._default is not None:
+                    self._cache[key] = self._default()
+                else:
+                    self._absent.add(key)
+        return {key: self._cache[key] for key in keys if key in self._cache}
+
+
+class FeedLoader:
+    """
+    Загрузчики связанных данных ленты на время одного запроса.
+
+    Вместо JOIN лайков и медиа к каждому твиту (декартово произведение строк)
+    каждая связь загружается одним запросом с IN по всем твитам ленты.
+    """
+
+    def __init__(self, async_session: AsyncSession, primary_session: Optional[AsyncSession] = None) -> None:
+        """
+        Создает загрузчики для сессии запроса.
+
+        :param async_session: Асинхронная сессия базы данных (может быть репликой).
+        :param primary_session: Сессия основной БД для промахов кэша имен, по умолчанию - async_session.
+        """
+        self.likers: DataLoader[int, List[int]] = DataLoader(
+            lambda ids: LikeDAO.likers(async_session=async_session, tweet_ids=ids), list
+        )
+        self.attachments: DataLoader[int, List[Media]] = DataLoader(
+            lambda ids: TweetMediaDAO.attachments(async_session=async_session, tweet_ids=ids), list
+        )
+        # Имена берутся из кэша процесса, промахи - с основной БД: кэш живет дольше отставания реплики
+        names_session = async_session if primary_session is None else primary_session
+        self.names: DataLoader[int, str] = DataLoader(lambda ids: directory.get_many(names_session, ids))
+
+
+async def get_feed_loader(
+    async_session_dep: AsyncSession = Depends(get_read_session), primary_session: AsyncSession = Depends(get_session)
+) -> FeedLoader:
+    """
+    Зависимость: загрузчики ленты, общие для всего запроса.
+
+    :param async_session_dep: Асинхронная сессия базы данных.
+    :param primary_session: Сессия основной БД.
+    :return: Загрузчики связанных данных ленты.
+    """
+    return FeedLoader(async_session_dep, primary_session)
@@ -1,7 +1,8 @@
-from sqlalchemy import Boolean, ForeignKey
+from sqlalchemy import DDL, Boolean, ForeignKey, Index, event, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from app.database import Base, int_pk
+from app.database import Base, deleted_at, int_pk
+from app.partitions import LIKES_PARTITIONS, hash_partitions_ddl
 from app.users.models import User
 
 
@@ -16,14 +17,26 @@ class Tweet(Base):
         user (Mapped[User]): Связь с моделью User, представляющая пользователя, который создал твит.
         likes (Mapped[list[Like]]): Связь с моделью Like, представляющая лайки на этот твит.
         tweets_media (Mapped[list[Media]]): Связь с моделью Media для хранения медиафайлов, связанных с твитом.
+        deleted_at (Mapped[Optional[datetime]]): Время мягкого удаления, None - твит виден.
+
+    Твиты вставляются по возрастанию created_at, поэтому для выборок по времени
+    используется компактный BRIN-индекс.
     """
 
+    __table_args__ = (
+        Index("ix_tweets_created_at_brin", "created_at", postgresql_using="brin"),
+        Index("ix_tweets_deleted_at", "deleted_at", postgresql_where=text("deleted_at IS NOT NULL")),
+    )
+
     id: Mapped[int_pk]
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     tweet_data: Mapped[str]
+    deleted_at: Mapped[deleted_at]
     user: Mapped["User"] = relationship("User", back_populates="tweets")
-    likes: Mapped[list["Like"]] = relationship("Like", back_populates="user_like", lazy="joined")
-    tweets_media = relationship("Media", secondary="tweetmedias", back_populates="tweets", lazy="joined")
+    # Связи не загружаются неявно: JOIN лайков и медиа размножает строки твита,
+    # для ленты они подгружаются пачками (app.tweets.loader.FeedLoader)
+    likes: Mapped[list["Like"]] = relationship("Like", back_populates="user_like", lazy="raise")
+    tweets_media = relationship("Media", secondary="tweetmedias", back_populates="tweets", lazy="raise")
 
     def __str__(self):
         return f"{self.__class__.__name__}( " f"пользователь={self.user_id!r}, " f"Твит ={self.tweet_data!r})"
@@ -39,7 +52,8 @@ class TweetMedia(Base):
     """
 
     tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True)
-    media_id: Mapped[int] = mapped_column(ForeignKey("medias.id", ondelete="CASCADE"), primary_key=True)
+    # media_id - второй столбец первичного ключа, для поиска твитов по медиа нужен отдельный индекс
+    media_id: Mapped[int] = mapped_column(ForeignKey("medias.id", ondelete="CASCADE"), primary_key=True, index=True)
 
 
 class Like(Base):
@@ -51,9 +65,18 @@ class Like(Base):
         tweet_id (Mapped[int]): Идентификатор твита, на который поставлен лайк.
         like (Mapped[bool]): Флаг, указывающий на наличие лайка (по умолчанию True).
         user_like (Mapped[Tweet]): Связь с моделью Tweet для получения информации о твите.
+
+    Таблица секционирована по хешу tweet_id (LIKES_PARTITIONS секций): лайки одного твита
+    лежат в одной секции, и запросы с условием на tweet_id читают только ее.
     """
 
+    __table_args__ = {"postgresql_partition_by": "HASH (tweet_id)"}
+
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True)
     like: Mapped[bool] = mapped_column(Boolean, default=True)
     user_like: Mapped["Tweet"] = relationship("Tweet", back_populates="likes")
+
+
+for _statement in hash_partitions_ddl("likes", LIKES_PARTITIONS):
+    event.listen(Like.__table__, "after_create", DDL(_statement))
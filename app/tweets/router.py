@@ -1,11 +1,19 @@
-from typing import Any
+from typing import Any, Dict, List, Optional, Sequence
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.dependencies import get_session, verify_api_key
+from app.config import settings
+from app.dependencies import get_read_session, get_session, verify_api_key
+from app.events import feed_events, sse_stream
+from app.medias.urls import media_url
+from app.rate_limit import rate_limit
+from app.tweets import trending
 from app.tweets.dao import LikeDAO, TweetDAO, TweetMediaDAO
-from app.tweets.models import Like, Tweet
+from app.tweets.like_buffer import like_buffer
+from app.tweets.loader import FeedLoader, get_feed_loader
+from app.tweets.models import Tweet
 from app.tweets.rb import RBCorrect, RBTweet, RBUncorrect
 from app.tweets.schemas import STweet
 from app.users.dao import UserDAO
@@ -14,7 +22,13 @@ from app.users.models import User
 router = APIRouter(prefix="/api", tags=["tweets"])
 
 
-@router.post("/tweets", status_code=201, summary="Добавить твит", response_model=RBTweet)
+@router.post(
+    "/tweets",
+    status_code=201,
+    summary="Добавить твит",
+    response_model=RBTweet,
+    dependencies=[Depends(rate_limit("write"))],
+)
 async def add_tweet(
     tweet_data: STweet, async_session_dep: AsyncSession = Depends(get_session), api_key: str = Depends(verify_api_key)
 ) -> RBTweet:
@@ -44,11 +58,17 @@ async def add_tweet(
     if media_ids:
         for id in media_ids:
             await TweetMediaDAO.add(async_session=async_session_dep, **{"tweet_id": add_new_tweet.id, "media_id": id})
+    await feed_events.publish({"type": "tweet_created", "tweet_id": add_new_tweet.id, "user_id": user_id.id})
     out: RBTweet = RBTweet(tweet_id=add_new_tweet.id)
     return out
 
 
-@router.delete("/tweets/{id}", summary="Удалить твит", response_model=RBCorrect | RBUncorrect)
+@router.delete(
+    "/tweets/{id}",
+    summary="Удалить твит",
+    response_model=RBCorrect | RBUncorrect,
+    dependencies=[Depends(rate_limit("write"))],
+)
 async def delete_tweet(
     id: int, async_session_dep: AsyncSession = Depends(get_session), api_key: str = Depends(verify_api_key)
 ) -> RBCorrect | RBUncorrect:
@@ -66,13 +86,20 @@ async def delete_tweet(
     user = await UserDAO.find_one_or_none(async_session=async_session_dep, api_key=api_key)
     check_tweet = await TweetDAO.find_one_or_none_by_id(async_session=async_session_dep, data_id=id)
     if check_tweet and user and check_tweet.user_id == user.id:
-        tweet = await TweetDAO.delete(async_session=async_session_dep, id=id)
+        # Твит сразу скрывается, лайки и привязки медиа вычищаются в фоне (app.reaper)
+        tweet = await TweetDAO.soft_delete(async_session=async_session_dep, id=id, user_id=user.id)
         if tweet:
+            await feed_events.publish({"type": "tweet_deleted", "tweet_id": id})
             return RBCorrect()
     return RBUncorrect()
 
 
-@router.post("/tweets/{id}/likes", summary="Поставить лайк на твит", response_model=RBCorrect | RBUncorrect)
+@router.post(
+    "/tweets/{id}/likes",
+    summary="Поставить лайк на твит",
+    response_model=RBCorrect | RBUncorrect,
+    dependencies=[Depends(rate_limit("like"))],
+)
 async def like_tweet(
     id: int, async_session_dep: AsyncSession = Depends(get_session), api_key: str = Depends(verify_api_key)
 ) -> RBCorrect | RBUncorrect:
@@ -84,22 +111,32 @@ async def like_tweet(
     :param async_session_dep: Асинхронная сессия базы данных.
     :param api_key: API ключ для аутентификации пользователя.
     :type api_key: str
-    :return: Результат операции лайка.
+    :return: Результат операции лайка. Повторный лайк тоже считается успешным.
     :rtype: RBCorrect | RBUncorrect
+    :raises HTTPException: 404, если твит не найден или удален.
     """
     user_id: User | None = await UserDAO.find_one_or_none(async_session=async_session_dep, **{"api_key": api_key})
     if user_id is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    tweet: Like = await LikeDAO.add(
+    if await TweetDAO.find_one_or_none_by_id(async_session=async_session_dep, data_id=id) is None:
+        raise HTTPException(status_code=404, detail="Твит не найден")
+    if settings.LIKES_WRITE_BEHIND:
+        if not await like_buffer.push_changed(async_session_dep, user_id.id, id, True):
+            return RBCorrect()
+    elif not await LikeDAO.add_or_ignore(
         async_session=async_session_dep, **{"user_id": user_id.id, "tweet_id": id, "like": True}
-    )
-    if tweet:
+    ):
         return RBCorrect()
-    else:
-        return RBUncorrect()
+    await feed_events.publish({"type": "like", "tweet_id": id, "user_id": user_id.id, "liked": True})
+    return RBCorrect()
 
 
-@router.delete("/tweets/{id}/likes", summary="Удалить лайк на твит", response_model=RBCorrect | RBUncorrect)
+@router.delete(
+    "/tweets/{id}/likes",
+    summary="Удалить лайк на твит",
+    response_model=RBCorrect | RBUncorrect,
+    dependencies=[Depends(rate_limit("like"))],
+)
 async def rollback_like_tweet(
     id: int, async_session_dep: AsyncSession = Depends(get_session), api_key: str = Depends(verify_api_key)
 ) -> RBCorrect | RBUncorrect:
@@ -111,54 +148,120 @@ async def rollback_like_tweet(
     :param async_session_dep: Асинхронная сессия базы данных.
     :param api_key: API ключ для аутентификации пользователя.
     :type api_key: str
-    :return: Результат операции удаления лайка.
+    :return: Результат операции удаления лайка. В режиме отложенной записи всегда успешен.
     :rtype: RBCorrect | RBUncorrect
     """
     user_id: User | None = await UserDAO.find_one_or_none(async_session=async_session_dep, **{"api_key": api_key})
     if user_id is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    tweet: int = await LikeDAO.delete(async_session=async_session_dep, user_id=user_id.id, tweet_id=id)
-    if tweet:
-        return RBCorrect()
-    else:
+    if settings.LIKES_WRITE_BEHIND:
+        if not await like_buffer.push_changed(async_session_dep, user_id.id, id, False):
+            return RBCorrect()
+    elif not await LikeDAO.delete(async_session=async_session_dep, user_id=user_id.id, tweet_id=id):
         return RBUncorrect()
+    await feed_events.publish({"type": "like", "tweet_id": id, "user_id": user_id.id, "liked": False})
+    return RBCorrect()
 
 
-@router.get("/tweets", summary="Получить ленту с твитами")
+@router.get("/tweets/stream", summary="Поток изменений ленты (SSE)", dependencies=[Depends(rate_limit("read"))])
+async def stream_tweets(request: Request, api_key: str = Depends(verify_api_key)) -> StreamingResponse:
+    """
+    Поток изменений ленты в формате Server-Sent Events.
+
+    Клиент один раз загружает ленту через GET /api/tweets, а затем получает
+    только изменения: tweet_created, tweet_deleted и like (liked: true/false).
+
+    :param request: Запрос, по нему проверяется, что клиент отключился.
+    :param api_key: API ключ для аутентификации пользователя.
+    :return: Бесконечный ответ text/event-stream.
+    """
+    return StreamingResponse(
+        sse_stream(feed_events, request.is_disconnected, settings.EVENTS_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx не должен буферизовать поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/tweets", summary="Получить ленту с твитами", dependencies=[Depends(rate_limit("read"))])
 async def get_user_tweets(
-    async_session_dep: AsyncSession = Depends(get_session), api_key: str = Depends(verify_api_key)
+    async_session_dep: AsyncSession = Depends(get_read_session),
+    api_key: str = Depends(verify_api_key),
+    loader: FeedLoader = Depends(get_feed_loader),
 ) -> dict[Any, Any]:
     """
     Получает ленту твитов.
 
+    Авторы, лайки и медиа загружаются пачками: по одному запросу с IN на каждую связь.
+
     :param async_session_dep: Асинхронная сессия базы данных.
     :param api_key: API ключ для аутентификации пользователя.
     :type api_key: str
+    :param loader: Загрузчики связанных данных ленты.
     :return: Словарь с результатом и списком твитов.
     :rtype: dict
     """
-    out = {"result": True, "tweets": []}
     tweets = await TweetDAO.find_all(async_session=async_session_dep)
-    if tweets is None:
-        tweets = []  # Если нет твитов, присваиваем пустой список
-    ra = sorted(tweets, key=lambda o: len(o.likes), reverse=True)
-    # print(user)
-    for tweet in ra:
-        tweet_info = {
+    rendered = await _render_tweets(tweets or [], loader)
+    rendered.sort(key=lambda tweet: len(tweet["likes"]), reverse=True)
+    return {"result": True, "tweets": rendered}
+
+
+@router.get("/tweets/trending", summary="Самые популярные твиты", dependencies=[Depends(rate_limit("read"))])
+async def get_trending_tweets(
+    author_id: Optional[int] = Query(None, description="Топ одного автора"),
+    async_session_dep: AsyncSession = Depends(get_read_session),
+    api_key: str = Depends(verify_api_key),
+    loader: FeedLoader = Depends(get_feed_loader),
+) -> dict[Any, Any]:
+    """
+    Получает топ популярных твитов: общий или одного автора.
+
+    Порядок берется из доски популярных твитов (app.tweets.trending), которая
+    обновляется на лайках, поэтому загружаются только K твитов из топа.
+
+    :param author_id: ID автора или None для общего топа.
+    :param async_session_dep: Асинхронная сессия базы данных.
+    :param api_key: API ключ для аутентификации пользователя.
+    :param loader: Загрузчики связанных данных ленты.
+    :return: Словарь с результатом и списком твитов в порядке рейтинга.
+    """
+    scores = dict(trending.board.top(author_id))
+    tweets = await TweetDAO.find_by_ids(async_session=async_session_dep, tweet_ids=scores)
+    rendered = await _render_tweets([tweets[tweet_id] for tweet_id in scores if tweet_id in tweets], loader)
+    for tweet_info in rendered:
+        tweet_info["score"] = scores[tweet_info["id"]]
+    return {"result": True, "tweets": rendered}
+
+
+async def _render_tweets(tweets: Sequence[Tweet], loader: FeedLoader) -> List[Dict[str, Any]]:
+    """
+    Твиты в формате ленты: авторы, лайки и медиа загружаются пачками, по одному запросу с IN на каждую связь.
+
+    :param tweets: Твиты.
+    :param loader: Загрузчики связанных данных ленты.
+    :return: Твиты в исходном порядке.
+    """
+    tweet_ids = [tweet.id for tweet in tweets]
+    likers = await loader.likers.load_many(tweet_ids)
+    if settings.LIKES_WRITE_BEHIND:
+        # Накладываем еще не записанные лайки, чтобы пользователь сразу видел свои действия
+        likers = {tweet_id: like_buffer.merge(tweet_id, user_ids) for tweet_id, user_ids in likers.items()}
+    attachments = await loader.attachments.load_many(tweet_ids)
+    names = await loader.names.load_many(
+        [tweet.user_id for tweet in tweets] + [user_id for user_ids in likers.values() for user_id in user_ids]
+    )
+    return [
+        {
             "id": tweet.id,
             "content": tweet.tweet_data,
-            "attachments": [el.media_data for el in tweet.tweets_media],
-            "author": {"id": tweet.user.id, "name": tweet.user.first_name},
-            "likes": [],
+            "attachments": [media_url(el) for el in attachments[tweet.id]],
+            "author": {"id": tweet.user_id, "name": names.get(tweet.user_id)},
+            "likes": [
+                {"user_id": like_user_id, "name": names[like_user_id]}
+                for like_user_id in likers[tweet.id]
+                if like_user_id in names
+            ],
         }
-
-        for like in tweet.likes:
-            user = await UserDAO.find_one_or_none(async_session=async_session_dep, **{"id": like.user_id})
-            if user is not None:
-                likes_info = {
-                    "user_id": like.user_id,
-                    "name": user.first_name,
-                }
-                tweet_info["likes"].append(likes_info)  # type: ignore
-        out["tweets"].append(tweet_info)  # type: ignore
-    return out
+        for tweet in tweets
+    ]
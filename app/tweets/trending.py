@@ -0,0 +1,222 @@
+import asyncio
+import heapq
+import time
+from collections import defaultdict
+from typing import Any, DefaultDict, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import logger, settings
+from app.tweets.dao import TweetDAO
+
+# Отсортированный по убыванию список (рейтинг, id твита) и момент полного пересчета
+Top = Tuple[float, List[Tuple[float, int]]]
+
+
+class TrendingBoard:
+    """
+    Топ-K популярных твитов: общий и по каждому автору.
+
+    Для каждого твита в памяти хранятся только число лайков, автор и время
+    создания. Топы поддерживаются инкрементально: лайк, отмена лайка и новый
+    твит правят готовый список за O(K), а полный пересчет (O(N log K))
+    нужен, только если твит из заполненного топа опустился ниже его последнего
+    места - тогда неизвестно, кто займет освободившееся место.
+
+    Рейтинг - число лайков или, если ``gravity > 0``, рейтинг с затуханием по
+    возрасту как в Hacker News: ``likes / (часы + 2) ** gravity``. С затуханием
+    порядок меняется со временем, поэтому топ пересчитывается не реже раза в
+    ``refresh`` секунд.
+
+    Attributes:
+        k (int): Размер топа.
+        gravity (float): Скорость затухания рейтинга, 0 - без затухания.
+        refresh (float): Как часто пересчитывать топ при затухании, секунды.
+    """
+
+    def __init__(self, k: int, gravity: float = 0.0, refresh: float = 60.0) -> None:
+        """
+        Создает пустую доску, данные загружает load().
+
+        :param k: Размер топа.
+        :param gravity: Скорость затухания рейтинга, 0 - без затухания.
+        :param refresh: Как часто пересчитывать топ при затухании, секунды.
+        """
+        self.k = k
+        self.gravity = gravity
+        self.refresh = refresh
+        self._likes: Dict[int, int] = {}
+        # id твита -> (id автора, время создания по time.time())
+        self._meta: Dict[int, Tuple[int, float]] = {}
+        self._by_author: DefaultDict[int, Set[int]] = defaultdict(set)
+        # None - общий топ, иначе топ автора
+        self._tops: Dict[Optional[int], Top] = {}
+        # События, пришедшие во время перезагрузки, None - перезагрузки нет
+        self._replay: Optional[List[Dict[str, Any]]] = None
+
+    def __len__(self) -> int:
+        """Количество твитов на доске."""
+        return len(self._meta)
+
+    def score(self, tweet_id: int, now: float) -> float:
+        """
+        Рейтинг твита.
+
+        :param tweet_id: ID твита.
+        :param now: Текущее время по time.time().
+        :return: Число лайков или рейтинг с затуханием.
+        """
+        likes = self._likes[tweet_id]
+        if not self.gravity:
+            return float(likes)
+        hours = max(0.0, now - self._meta[tweet_id][1]) / 3600
+        return likes / (hours + 2) ** self.gravity
+
+    def start_load(self) -> None:
+        """Начать перезагрузку: события до load() запоминаются и применяются к новым данным."""
+        self._replay = []
+
+    def cancel_load(self) -> None:
+        """Отменить перезагрузку, которая не удалась: запомненные события уже применены к доске."""
+        self._replay = None
+
+    def load(self, rows: Iterable[Tuple[int, int, float, int]]) -> None:
+        """
+        Заполнить доску заново.
+
+        Если перезагрузка начата start_load(), события, пришедшие с тех пор, как
+        начался запрос к БД, применяются заново: иначе снимок, прочитанный до них,
+        затер бы их до следующей перезагрузки.
+
+        :param rows: Строки (id твита, id автора, возраст в секундах, число лайков).
+        """
+        now = time.time()
+        self._likes, self._meta, self._by_author, self._tops = {}, {}, defaultdict(set), {}
+        for tweet_id, author_id, age, likes in rows:
+            self._likes[tweet_id] = likes
+            self._meta[tweet_id] = (author_id, now - age)
+            self._by_author[author_id].add(tweet_id)
+        replay, self._replay = self._replay or [], None
+        for event in replay:
+            self.apply(event)
+
+    def add_tweet(self, tweet_id: int, author_id: int, created_at: Optional[float] = None) -> None:
+        """
+        Добавить новый твит.
+
+        :param tweet_id: ID твита.
+        :param author_id: ID автора.
+        :param created_at: Время создания по time.time(), по умолчанию - сейчас.
+        """
+        if tweet_id in self._meta:
+            return
+        self._likes[tweet_id] = 0
+        self._meta[tweet_id] = (author_id, time.time() if created_at is None else created_at)
+        self._by_author[author_id].add(tweet_id)
+        self._patch(tweet_id, decreased=False)
+
+    def remove_tweet(self, tweet_id: int) -> None:
+        """
+        Убрать удаленный твит.
+
+        :param tweet_id: ID твита.
+        """
+        meta = self._meta.pop(tweet_id, None)
+        if meta is None:
+            return
+        self._likes.pop(tweet_id)
+        self._by_author[meta[0]].discard(tweet_id)
+        if not self._by_author[meta[0]]:
+            del self._by_author[meta[0]]
+        for scope in (None, meta[0]):
+            top = self._tops.get(scope)
+            if top is not None and any(entry_id == tweet_id for _, entry_id in top[1]):
+                del self._tops[scope]
+
+    def like(self, tweet_id: int, delta: int) -> None:
+        """
+        Изменить число лайков твита.
+
+        :param tweet_id: ID твита.
+        :param delta: +1 за лайк, -1 за отмену лайка.
+        """
+        if tweet_id not in self._likes:
+            return
+        self._likes[tweet_id] = max(0, self._likes[tweet_id] + delta)
+        self._patch(tweet_id, decreased=delta < 0)
+
+    def apply(self, event: Dict[str, Any]) -> None:
+        """
+        Применить событие ленты (app.events.feed_events).
+
+        :param event: Событие tweet_created, tweet_deleted или like.
+        """
+        if self._replay is not None:
+            self._replay.append(event)
+        if event["type"] == "tweet_created":
+            self.add_tweet(event["tweet_id"], event["user_id"])
+        elif event["type"] == "tweet_deleted":
+            self.remove_tweet(event["tweet_id"])
+        elif event["type"] == "like":
+            self.like(event["tweet_id"], 1 if event["liked"] else -1)
+
+    def _patch(self, tweet_id: int, decreased: bool) -> None:
+        """Поправить готовые топы после изменения рейтинга одного твита."""
+        now = time.time()
+        score = self.score(tweet_id, now)
+        for scope in (None, self._meta[tweet_id][0]):
+            top = self._tops.get(scope)
+            if top is None:
+                continue
+            built_at, entries = top
+            full = len(entries) >= self.k
+            inside = any(entry_id == tweet_id for _, entry_id in entries)
+            if inside and decreased and full and score < entries[-1][0]:
+                # Опустился ниже последнего места: замену знает только полный пересчет
+                del self._tops[scope]
+                continue
+            if not inside and full and score <= entries[-1][0]:
+                continue
+            entries = [entry for entry in entries if entry[1] != tweet_id]
+            entries.append((score, tweet_id))
+            entries.sort(reverse=True)
+            self._tops[scope] = (built_at, entries[: self.k])
+
+    def top(self, author_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Самые популярные твиты.
+
+        :param author_id: ID автора или None для общего топа.
+        :return: Не больше K пар (id твита, рейтинг) по убыванию рейтинга.
+        """
+        now = time.time()
+        top = self._tops.get(author_id)
+        if top is None or (self.gravity and now - top[0] > self.refresh):
+            candidates: Iterable[int] = self._meta if author_id is None else self._by_author.get(author_id, set())
+            entries = heapq.nlargest(self.k, ((self.score(tweet_id, now), tweet_id) for tweet_id in candidates))
+            top = self._tops[author_id] = (now, entries)
+        return [(tweet_id, score) for score, tweet_id in top[1]]
+
+
+async def run(session_maker: async_sessionmaker[AsyncSession], interval: float) -> None:
+    """
+    Загрузить доску из БД при запуске и перезагружать ее раз в ``interval`` секунд.
+
+    Перезагрузка исправляет расхождения, которые события не покрывают:
+    фоновую очистку и лайки, отброшенные при записи пачки.
+
+    :param session_maker: Фабрика асинхронных сессий.
+    :param interval: Интервал перезагрузки в секундах.
+    """
+    while True:
+        board.start_load()
+        try:
+            async with session_maker() as session:
+                board.load(await TweetDAO.popularity(async_session=session))
+        except Exception as e:
+            board.cancel_load()
+            logger.error(f"Не удалось загрузить популярные твиты: {e!r}")
+        await asyncio.sleep(interval)
+
+
+board = TrendingBoard(settings.TRENDING_K, settings.TRENDING_GRAVITY, settings.TRENDING_REFRESH_SECONDS)
@@ -1,11 +1,43 @@
-from typing import Any, Dict, Optional, Sequence, Type
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple, Type
 
-from sqlalchemy import select
+from sqlalchemy import (
+    ColumnElement,
+    Row,
+    Select,
+    and_,
+    delete as sqlalchemy_delete,
+    func,
+    literal,
+    or_,
+    select,
+    update as sqlalchemy_update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased
 
-from app.dao.base import BaseDAO
-from app.users.models import Follow, User
+from app.dao.base import BaseDAO, statement_timeout
+from app.dao.single_flight import single_flight
+from app.invalidation import invalidation, row_key
+from app.users.models import Follow, FollowCandidate, User
+
+# Пространство advisory-блокировок пересчета кандидатов; второй ключ - ID пользователя
+FOLLOW_CANDIDATES_LOCK_KEY = 2
+
+
+async def lock_candidates(session: AsyncSession, user_ids: Iterable[int]) -> None:
+    """
+    Заблокировать пересчет кандидатов через пользователей до конца транзакции.
+
+    Блокировки берутся по возрастанию ID, поэтому транзакции, которые
+    блокируют несколько пользователей, не ждут друг друга по кругу.
+
+    :param session: Асинхронная сессия с открытой транзакцией.
+    :param user_ids: ID пользователей.
+    """
+    for user_id in sorted(set(user_ids)):
+        await session.execute(select(func.pg_advisory_xact_lock(FOLLOW_CANDIDATES_LOCK_KEY, user_id)))
 
 
 class UserDAO(BaseDAO[User]):
@@ -17,50 +49,141 @@ class UserDAO(BaseDAO[User]):
 
     model: Type[User] = User
 
+    #: Колонки пользователя, которые отдаются в профиле.
+    profile_columns: Tuple[str, ...] = ("id", "first_name", "last_name")
+
+    @classmethod
+    def _follows_query(
+        cls, user_id: int, followers: bool, after_id: Optional[int] = None, limit: Optional[int] = None
+    ) -> Select[Any]:
+        """
+        Запрос подписчиков или подписок пользователя, упорядоченный по id.
+
+        :param user_id: ID пользователя.
+        :param followers: True - кто подписан на пользователя, False - на кого подписан он сам.
+        :param after_id: id последнего пользователя предыдущей страницы.
+        :param limit: Максимальное количество строк.
+        :return: Запрос SELECT.
+        """
+        if followers:
+            join_on, where = Follow.user_id == cls.model.id, Follow.follower_id == user_id
+        else:
+            join_on, where = Follow.follower_id == cls.model.id, Follow.user_id == user_id
+        query = (
+            select(*[getattr(cls.model, column) for column in cls.profile_columns])
+            .join(Follow, join_on)
+            .where(where, cls.model.deleted_at.is_(None))
+            .order_by(cls.model.id)
+        )
+        if after_id is not None:
+            query = query.where(cls.model.id > after_id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
     @classmethod
+    @statement_timeout
+    async def follows_page(
+        cls,
+        async_session: AsyncSession,
+        user_id: int,
+        followers: bool,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> Sequence[Row[Any]]:
+        """
+        Страница подписчиков или подписок пользователя (keyset-пагинация по id).
+
+        :param async_session: Асинхронная сессия.
+        :param user_id: ID пользователя.
+        :param followers: True - кто подписан на пользователя, False - на кого подписан он сам.
+        :param after_id: id последнего пользователя предыдущей страницы.
+        :param limit: Размер страницы.
+        :return: Список строк с колонками профиля.
+        """
+        async with async_session as session:
+            result = await session.execute(cls._follows_query(user_id, followers, after_id, limit))
+            return result.all()
+
+    @classmethod
+    @single_flight
+    @statement_timeout
     async def user_info(
         cls,
         async_session: AsyncSession,
         api_key: Optional[str] = None,
         user_id: Optional[int] = None,
+        preview: Optional[int] = None,
     ) -> Dict[str, Any]:
         """
         Получаю подписчиков и подписки в удобном формате.
 
+        Выбираются только колонки профиля, без загрузки всех пользователей
+        и связанных моделей Follow. Количество подписчиков и подписок считается
+        через COUNT по индексам таблицы follows, а сами списки ограничены
+        ``preview`` первыми записями - полные списки отдаются постранично.
+
         :param async_session: Асинхронная сессия.
         :param api_key: Ключ доступа.
         :param user_id: ID пользователя.
+        :param preview: Сколько подписчиков и подписок вернуть в профиле.
         :return: Информация о пользователе и его подписках.
         """
+        out: Dict[str, Any] = {"result": False}
+        if api_key is None and user_id is None:
+            return out
+        # Счетчики читаются только из индексов follows, без обращения к users: подписки
+        # удаленных пользователей вычищает app.reaper, до этого они еще учитываются
+        followers_count = (
+            select(func.count())
+            .select_from(Follow)
+            .where(Follow.follower_id == cls.model.id)
+            .scalar_subquery()
+            .label("followers_count")
+        )
+        following_count = (
+            select(func.count())
+            .select_from(Follow)
+            .where(Follow.user_id == cls.model.id)
+            .scalar_subquery()
+            .label("following_count")
+        )
         async with async_session as session:
-            out: Dict[str, Any] = {"result": True}
-            out_keys = ("id", "first_name", "last_name")
-            query = select(cls.model).options(
-                selectinload(cls.model.followers),
-                selectinload(cls.model.following),
+            query = cls._visible(
+                select(
+                    *[getattr(cls.model, column) for column in cls.profile_columns], followers_count, following_count
+                )
             )
-            result = await session.execute(query)
-            all_users: Sequence[User] = result.scalars().all()
-            if all_users:
-
-                for user in all_users:
-                    if user.api_key == api_key or user.id == user_id:
-                        out["user"] = {k: v for k, v in user.to_dict().items() if k in out_keys}
-                        out["user"]["followers"] = [
-                            {k: v for k, v in user_f.to_dict().items() if k in out_keys}
-                            for user_f in user.followers_users
-                        ]
-                        out["user"]["following"] = [
-                            {k: v for k, v in user_f.to_dict().items() if k in out_keys}
-                            for user_f in user.following_users
-                        ]
-                        break
-
-            if out.get("user"):
-                return out
-            else:
-                out["result"] = False
+            if api_key is not None:
+                query = query.where(cls.model.api_key == api_key)
+            if user_id is not None:
+                query = query.where(cls.model.id == user_id)
+            user = (await session.execute(query)).one_or_none()
+            if user is None:
                 return out
+            followers = (await session.execute(cls._follows_query(user.id, True, limit=preview))).all()
+            following = (await session.execute(cls._follows_query(user.id, False, limit=preview))).all()
+        out["result"] = True
+        out["user"] = user._asdict()
+        out["user"]["followers"] = [row._asdict() for row in followers]
+        out["user"]["following"] = [row._asdict() for row in following]
+        return out
+
+    @classmethod
+    @statement_timeout
+    async def names(cls, async_session: AsyncSession, user_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        Имена нескольких пользователей одним запросом с IN.
+
+        Удаленные пользователи в результат не попадают.
+
+        :param async_session: Асинхронная сессия.
+        :param user_ids: ID пользователей.
+        :return: Имя по ID пользователя.
+        """
+        query = cls._visible(select(cls.model.id, cls.model.first_name).where(cls.model.id.in_(list(user_ids))))
+        async with async_session as session:
+            return {user_id: name for user_id, name in (await session.execute(query)).all()}
 
     # @classmethod
     # async def get_all_tweets(cls, async_session: async_sessionmaker[AsyncSession], api_key: str) -> Optional[User]:
@@ -86,3 +209,224 @@ class FollowDAO(BaseDAO[Follow]):
     """
 
     model: type[Follow] = Follow  # Добавьте типизацию для модели Follow
+
+    @classmethod
+    async def follow(cls, async_session: AsyncSession, user_id: int, follower_id: int) -> bool:
+        """
+        Подписать пользователя и обновить кандидатов для рекомендаций в той же транзакции.
+
+        Повторная подписка не считается ошибкой: вставка выполняется через
+        ON CONFLICT DO NOTHING, и кандидаты пересчитываются только для новой подписки.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param user_id: ID пользователя, который подписывается.
+        :param follower_id: ID пользователя, на которого подписываются.
+        :return: True, если подписка добавлена, False - если она уже была.
+        """
+        async with async_session as session:
+            async with session.begin():
+                query = (
+                    insert(cls.model)
+                    .values(user_id=user_id, follower_id=follower_id)
+                    .on_conflict_do_nothing()
+                    .returning(cls.model.user_id)
+                )
+                keys = [row_key((user_id, follower_id))]
+                try:
+                    result = await session.execute(query)
+                    inserted = result.first() is not None
+                    if inserted:
+                        await FollowCandidateDAO.shift(session, user_id, follower_id, 1)
+                        await invalidation.notify(session, cls.model.__tablename__, keys)
+                    await session.commit()
+                except SQLAlchemyError as e:
+                    await session.rollback()
+                    raise e
+        if inserted:
+            cls._invalidate(keys)
+        return inserted
+
+    @classmethod
+    async def unfollow(cls, async_session: AsyncSession, user_id: int, follower_id: int) -> int:
+        """
+        Отписать пользователя и обновить кандидатов для рекомендаций в той же транзакции.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param user_id: ID пользователя, который отписывается.
+        :param follower_id: ID пользователя, от которого отписываются.
+        :return: Количество удаленных строк.
+        """
+        async with async_session as session:
+            async with session.begin():
+                query = sqlalchemy_delete(cls.model).filter_by(user_id=user_id, follower_id=follower_id)
+                keys = [row_key((user_id, follower_id))]
+                try:
+                    result = await session.execute(query)
+                    if result.rowcount:
+                        await FollowCandidateDAO.shift(session, user_id, follower_id, -1)
+                        await invalidation.notify(session, cls.model.__tablename__, keys)
+                    await session.commit()
+                except SQLAlchemyError as e:
+                    await session.rollback()
+                    raise e
+        if result.rowcount:
+            cls._invalidate(keys)
+        return result.rowcount
+
+    @classmethod
+    async def purge_follows(
+        cls, session: AsyncSession, *criteria: ColumnElement[bool], limit: int
+    ) -> Sequence[Row[Any]]:
+        """
+        Удалить не больше ``limit`` подписок и вычесть их пути из кандидатов.
+
+        В отличие от purge_batch подписки удаляются по одной, как при отписке,
+        и кандидаты пересчитываются после каждой: путь X -> D -> C через две
+        удаляемые подписки вычитается ровно один раз. Выполняется внутри
+        транзакции вызывающего кода.
+
+        :param session: Асинхронная сессия с открытой транзакцией.
+        :param criteria: Условия WHERE.
+        :param limit: Размер пачки.
+        :return: Удаленные подписки (user_id, follower_id).
+        """
+        edges = (
+            await session.execute(select(cls.model.user_id, cls.model.follower_id).where(*criteria).limit(limit))
+        ).all()
+        await lock_candidates(session, (user_id for edge in edges for user_id in edge))
+        purged = []
+        for edge in edges:
+            result = await session.execute(
+                sqlalchemy_delete(cls.model)
+                .filter_by(user_id=edge.user_id, follower_id=edge.follower_id)
+                .execution_options(synchronize_session=False)
+            )
+            # Подписку могли успеть удалить отпиской: ее пути уже вычтены
+            if result.rowcount:
+                await FollowCandidateDAO.shift(session, edge.user_id, edge.follower_id, -1)
+                purged.append(edge)
+        return purged
+
+
+class FollowCandidateDAO(BaseDAO[FollowCandidate]):
+    """
+    Класс для доступа к данным в БД.
+
+    Работает с таблицей FollowCandidate
+    """
+
+    model: type[FollowCandidate] = FollowCandidate
+
+    @classmethod
+    async def shift(cls, session: AsyncSession, user_id: int, follower_id: int, delta: int) -> None:
+        """
+        Инкрементально пересчитать кандидатов после подписки или отписки.
+
+        Когда A подписывается на B (delta=1), у A появляются пути A -> B -> C
+        ко всем, на кого подписан B, а у подписчиков X пользователя A - пути X -> A -> B.
+        При отписке (delta=-1) веса этих путей вычитаются, и кандидаты
+        с нулевым весом удаляются. Выполняется внутри транзакции вызывающего кода.
+
+        Подписки A -> B и B -> C, добавленные одновременно, не видят незакоммиченную
+        строку друг друга, и путь A -> B -> C не был бы учтен ни одной из них.
+        Поэтому пересчет берет advisory-блокировку на обоих пользователей подписки
+        до конца транзакции: подписки с общим пользователем пересчитываются по
+        очереди, и вторая видит уже закоммиченную первую.
+
+        :param session: Асинхронная сессия с открытой транзакцией.
+        :param user_id: ID пользователя, который подписался или отписался (A).
+        :param follower_id: ID пользователя, на которого подписались или от которого отписались (B).
+        :param delta: 1 для подписки, -1 для отписки.
+        """
+        await lock_candidates(session, (user_id, follower_id))
+        # Те, на кого подписан B: новые кандидаты для A
+        b_following = select(Follow.follower_id).where(Follow.user_id == follower_id, Follow.follower_id != user_id)
+        # Те, кто подписан на A: для них B становится кандидатом
+        a_followers = select(Follow.user_id).where(Follow.follower_id == user_id, Follow.user_id != follower_id)
+        if delta > 0:
+            for source in (
+                b_following.with_only_columns(literal(user_id), Follow.follower_id, literal(delta)),
+                a_followers.with_only_columns(Follow.user_id, literal(follower_id), literal(delta)),
+            ):
+                query = insert(cls.model).from_select(["user_id", "candidate_id", "score"], source)
+                query = query.on_conflict_do_update(
+                    index_elements=[cls.model.user_id, cls.model.candidate_id],
+                    set_={"score": cls.model.score + query.excluded.score},
+                )
+                await session.execute(query)
+            return
+        affected = or_(
+            and_(cls.model.user_id == user_id, cls.model.candidate_id.in_(b_following)),
+            and_(cls.model.candidate_id == follower_id, cls.model.user_id.in_(a_followers)),
+        )
+        await session.execute(
+            sqlalchemy_update(cls.model)
+            .where(affected)
+            .values(score=cls.model.score + delta)
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            sqlalchemy_delete(cls.model)
+            .where(affected, cls.model.score <= 0)
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    async def rebuild(cls, async_session: AsyncSession) -> int:
+        """
+        Полностью пересчитать таблицу кандидатов.
+
+        Это произведение разреженной матрицы смежности подписок на саму себя,
+        выполненное в БД одним соединением follows с follows и группировкой.
+        Нужно после массовой загрузки подписок в обход FollowDAO.follow.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :return: Количество найденных кандидатов.
+        """
+        first, second = aliased(Follow), aliased(Follow)
+        paths = (
+            select(first.user_id, second.follower_id, func.count())
+            .join(second, second.user_id == first.follower_id)
+            .where(second.follower_id != first.user_id)
+            .group_by(first.user_id, second.follower_id)
+        )
+        async with async_session as session:
+            async with session.begin():
+                try:
+                    await session.execute(sqlalchemy_delete(cls.model))
+                    result = await session.execute(
+                        insert(cls.model).from_select(["user_id", "candidate_id", "score"], paths)
+                    )
+                    await session.commit()
+                except SQLAlchemyError as e:
+                    await session.rollback()
+                    raise e
+                return result.rowcount
+
+    @classmethod
+    @statement_timeout
+    async def recommendations(cls, async_session: AsyncSession, user_id: int, limit: int) -> Sequence[Row[Any]]:
+        """
+        Лучшие кандидаты для подписки, на которых пользователь еще не подписан.
+
+        :param async_session: Асинхронная сессия базы данных.
+        :param user_id: ID пользователя.
+        :param limit: Количество рекомендаций.
+        :return: Строки с колонками профиля кандидата и его весом.
+        """
+        already_following = select(Follow.follower_id).where(Follow.user_id == user_id)
+        query = (
+            select(*[getattr(User, column) for column in UserDAO.profile_columns], cls.model.score)
+            .join(User, User.id == cls.model.candidate_id)
+            .where(
+                cls.model.user_id == user_id,
+                cls.model.candidate_id != user_id,
+                cls.model.candidate_id.not_in(already_following),
+                User.deleted_at.is_(None),
+            )
+            .order_by(cls.model.score.desc(), cls.model.candidate_id)
+            .limit(limit)
+        )
+        async with async_session as session:
+            result = await session.execute(query)
+            return result.all()
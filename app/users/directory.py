@@ -0,0 +1,93 @@
+import sys
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.invalidation import ALL, invalidation
+from app.users.dao import UserDAO
+
+
+class UserDirectory:
+    """
+    Кэш имен пользователей (id -> first_name) на весь процесс.
+
+    Промахи загружаются одним запросом с IN. Строки имен интернируются:
+    одинаковые имена (а их в ленте большинство) хранятся в памяти один раз.
+    Размер ограничен ``max_entries``, при переполнении вытесняются давно не
+    запрашиваемые записи (LRU). Удаленные пользователи кэшируются как
+    отсутствующие, чтобы не запрашивать их на каждом рендере ленты.
+
+    Записи сбрасываются шиной инвалидации (app.invalidation) при изменении
+    строки users: обновление профиля, удаление, в том числе в других воркерах.
+    Если инвалидация пришла, пока шел запрос промахов, результат запроса
+    в кэш не попадает. Промахи нужно загружать с основной БД: отстающая
+    реплика после инвалидации вернула бы старое имя, и оно осталось бы
+    в кэше до следующей записи.
+
+    Attributes:
+        max_entries (int): Максимальное количество записей.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        """
+        Создает пустой кэш.
+
+        :param max_entries: Максимальное количество записей.
+        """
+        self.max_entries = max_entries
+        self._names: OrderedDict[int, Optional[str]] = OrderedDict()
+        self._version = 0
+
+    def __len__(self) -> int:
+        """Количество записей в кэше."""
+        return len(self._names)
+
+    async def get_many(self, async_session: AsyncSession, user_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        Имена пользователей: из кэша, промахи - одним запросом.
+
+        :param async_session: Сессия основной базы данных (не реплики).
+        :param user_ids: ID пользователей.
+        :return: Имя по ID, удаленные и несуществующие пользователи пропускаются.
+        """
+        out: Dict[int, str] = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            if user_id in self._names:
+                self._names.move_to_end(user_id)
+                name = self._names[user_id]
+                if name is not None:
+                    out[user_id] = name
+            else:
+                missing.append(user_id)
+        if not missing:
+            return out
+        version = self._version
+        loaded = await UserDAO.names(async_session=async_session, user_ids=missing)
+        for user_id in missing:
+            name = loaded.get(user_id)
+            if name is not None:
+                out[user_id] = name = sys.intern(name)
+            if version == self._version:
+                self._names[user_id] = name
+        while len(self._names) > self.max_entries:
+            self._names.popitem(last=False)
+        return out
+
+    def invalidate(self, key: str) -> None:
+        """
+        Сбросить запись пользователя или весь кэш.
+
+        :param key: ID пользователя строкой или ``*``.
+        """
+        self._version += 1
+        if key == ALL:
+            self._names.clear()
+        else:
+            self._names.pop(int(key), None)
+
+
+directory = UserDirectory(settings.USER_DIRECTORY_MAX)
+invalidation.subscribe(UserDAO.model.__tablename__, directory.invalidate)
@@ -1,8 +1,8 @@
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index, text
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from app.database import Base, int_pk, str_uniq
+from app.database import Base, deleted_at, int_pk, str_uniq
 
 
 class Follow(Base):
@@ -17,13 +17,14 @@ class Follow(Base):
     """
 
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False, primary_key=True)
+    # user_id - первый столбец первичного ключа, для выборок по follower_id нужен отдельный индекс
     follower_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="CASCADE"), nullable=False, primary_key=True
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False, primary_key=True, index=True
     )
 
-    user: Mapped[list["User"]] = relationship("User", foreign_keys=[user_id], back_populates="following", lazy="joined")
+    user: Mapped[list["User"]] = relationship("User", foreign_keys=[user_id], back_populates="following", lazy="raise")
     follower: Mapped[list["User"]] = relationship(
-        "User", foreign_keys=[follower_id], back_populates="followers", lazy="joined"
+        "User", foreign_keys=[follower_id], back_populates="followers", lazy="raise"
     )
 
     def __str__(self) -> str:
@@ -45,12 +46,17 @@ class User(Base):
         following_users (association_proxy): Упрощенный доступ к пользователям, на которых подписан данный пользователь.
         following (Mapped[List[Follow]]): Связь с моделью Follow для пользователей, на которых подписан данный пользователь.
         tweets (Mapped[List['Tweet']]): Связь с моделью Tweet для твитов пользователя.
+        deleted_at (Mapped[Optional[datetime]]): Время мягкого удаления, None - пользователь активен.
     """
 
+    # Частичный индекс: фоновая очистка ищет только удаленных пользователей
+    __table_args__ = (Index("ix_users_deleted_at", "deleted_at", postgresql_where=text("deleted_at IS NOT NULL")),)
+
     id: Mapped[int_pk]
     first_name: Mapped[str] = mapped_column(nullable=False)
     last_name: Mapped[str] = mapped_column(nullable=False)
     api_key: Mapped[str_uniq]
+    deleted_at: Mapped[deleted_at]
 
     # Кто подписан на меня
     followers: Mapped[list[Follow]] = relationship(
@@ -76,3 +82,31 @@ class User(Base):
             f"last_name={self.last_name!r}, "
             f"api_key={self.api_key!r})"
         )
+
+
+class FollowCandidate(Base):
+    """
+    Модель таблицы кандидатов для рекомендаций "на кого подписаться".
+
+    Кандидаты - друзья друзей: если пользователь подписан на B, а B подписан на C,
+    то C - кандидат для пользователя. score - количество таких путей через разных B.
+    Таблица поддерживается инкрементально при подписке и отписке.
+
+    Attributes:
+        user_id (Mapped[int]): ID пользователя, которому рекомендуется кандидат.
+        candidate_id (Mapped[int]): ID рекомендуемого пользователя.
+        score (Mapped[int]): Количество общих подписок, через которые найден кандидат.
+    """
+
+    __table_args__ = (Index("ix_followcandidates_user_id_score", "user_id", "score"),)
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    candidate_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, index=True)
+    score: Mapped[int] = mapped_column(default=0)
+
+    def __str__(self) -> str:
+        """Возвращает строковое представление объекта FollowCandidate."""
+        return (
+            f"{self.__class__.__name__}(Пользователь={self.user_id!r}, "
+            f"Кандидат={self.candidate_id!r}, Вес={self.score!r})"
+        )
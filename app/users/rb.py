@@ -93,13 +93,17 @@ class RBUser(BaseModel):
         id (int): Уникальный идентификатор пользователя.
         first_name (str): Имя пользователя.
         last_name (str): Фамилия пользователя.
-        followers (List[RBFollower]): Список подписчиков пользователя.
-        following (List[RBFollowing]): Список людей, на которых подписан пользователь.
+        followers_count (int): Количество подписчиков пользователя.
+        following_count (int): Количество людей, на которых подписан пользователь.
+        followers (List[RBFollower]): Первые подписчики пользователя, полный список - /api/users/{id}/followers.
+        following (List[RBFollowing]): Первые подписки пользователя, полный список - /api/users/{id}/following.
     """
 
     id: int
     first_name: str
     last_name: str
+    followers_count: int
+    following_count: int
     followers: List[RBFollower]
     following: List[RBFollowing]
 
@@ -115,3 +119,33 @@ class RBMe(BaseModel):
 
     result: bool
     user: RBUser
+
+
+class RBRecommendation(BaseModel):
+    """
+    Модель для представления рекомендованного пользователя.
+
+    Attributes:
+        id (int): Уникальный идентификатор пользователя.
+        first_name (str): Имя пользователя.
+        last_name (str): Фамилия пользователя.
+        score (int): Количество общих подписок, через которые найден пользователь.
+    """
+
+    id: int
+    first_name: str
+    last_name: str
+    score: int
+
+
+class RBRecommendations(BaseModel):
+    """
+    Модель для ответа со списком рекомендаций "на кого подписаться".
+
+    Attributes:
+        result (bool): Результат запроса.
+        users (List[RBRecommendation]): Рекомендованные пользователи по убыванию веса.
+    """
+
+    result: bool = True
+    users: List[RBRecommendation]
@@ -1,31 +1,86 @@
-from typing import Any, Dict, List, Union
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.config import logger
-from app.dependencies import get_session, verify_api_key
-from app.users.dao import FollowDAO, UserDAO
+from app.config import logger, settings
+from app.dependencies import get_read_session, get_session, verify_api_key
+from app.rate_limit import rate_limit
+from app.users.dao import FollowCandidateDAO, FollowDAO, UserDAO
 from app.users.models import User
-from app.users.rb import RBCorrect, RBMe, RBUncorrect, RBUsersAdd, RBUsersUpdate
+from app.users.rb import (
+    RBCorrect,
+    RBFollower,
+    RBFollowing,
+    RBMe,
+    RBRecommendations,
+    RBUncorrect,
+    RBUsersAdd,
+    RBUsersUpdate,
+)
 from app.users.schemas import SUserAdd
 
 router = APIRouter(prefix="/api", tags=["users"])
 
 
-@router.get("/all_users", summary="Получить всех пользователей с их токенами")
-async def get_all_users(async_session_dep=Depends(get_session)) -> list[SUserAdd]:
+@router.get(
+    "/all_users",
+    summary="Получить всех пользователей с их токенами",
+    response_model=list[SUserAdd],
+    dependencies=[Depends(rate_limit("read"))],
+)
+async def get_all_users(
+    response: Response,
+    async_session_dep=Depends(get_read_session),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Размер страницы."),
+    after_id: Optional[int] = Query(None, description="id последнего пользователя предыдущей страницы."),
+    stream: bool = Query(False, description="Отдать всех пользователей потоком в формате NDJSON."),
+) -> Union[List[SUserAdd], StreamingResponse]:
     """
     Получение списка всех пользователей с их токенами.
 
+    Без параметров возвращает всех пользователей. С ``limit`` работает keyset-пагинация:
+    id последнего пользователя страницы передается в заголовке ``X-Next-After-Id``
+    и используется как ``after_id`` для следующего запроса.
+    С ``stream=true`` пользователи отдаются построчно в формате NDJSON через
+    серверный курсор, так что выгрузка не держит всю таблицу в памяти.
+
+    :param response: Ответ, в который добавляется курсор следующей страницы.
     :param async_session_dep: Асинхронная сессия базы данных.
-    :return: Список пользователей.
+    :param limit: Размер страницы.
+    :param after_id: id последнего пользователя предыдущей страницы.
+    :param stream: Отдать пользователей потоком NDJSON.
+    :return: Список пользователей или потоковый ответ.
+    """
+    columns = tuple(SUserAdd.model_fields)
+    if stream:
+        return StreamingResponse(_users_ndjson(async_session_dep, columns), media_type="application/x-ndjson")
+    res = await UserDAO.find_rows(async_session=async_session_dep, columns=columns, after_id=after_id, limit=limit)
+    if limit is not None and len(res) == limit:
+        response.headers["X-Next-After-Id"] = str(res[-1].id)
+    return [SUserAdd.model_validate(row) for row in res]
+
+
+async def _users_ndjson(async_session: AsyncSession, columns: Tuple[str, ...]) -> AsyncIterator[bytes]:
+    """
+    Построчная сериализация пользователей в NDJSON.
+
+    :param async_session: Асинхронная сессия базы данных.
+    :param columns: Колонки, которые попадают в ответ.
+    :return: Асинхронный итератор строк NDJSON.
     """
-    res = await UserDAO.find_all(async_session=async_session_dep)
-    return [SUserAdd(**user.to_dict()) for user in res] if res else []
+    async for row in UserDAO.stream_rows(async_session=async_session, columns=columns):
+        yield json.dumps(row._asdict(), ensure_ascii=False).encode() + b"\n"
 
 
-@router.post("/users", status_code=201, summary="Получить токен для пользователя и добавляет его в БД")
+@router.post(
+    "/users",
+    status_code=201,
+    summary="Получить токен для пользователя и добавляет его в БД",
+    dependencies=[Depends(rate_limit("write"))],
+)
 async def create_user(
     async_session_dep: AsyncSession = Depends(get_session), request_body: RBUsersAdd = Depends()
 ) -> SUserAdd:
@@ -41,7 +96,7 @@ async def create_user(
     return SUserAdd(**res.to_dict())
 
 
-@router.get("/users", summary="Залогинить пользователя по токену")
+@router.get("/users", summary="Залогинить пользователя по токену", dependencies=[Depends(rate_limit("read"))])
 async def login_users(
     async_session_dep: AsyncSession = Depends(get_session), api_key: str = Depends(verify_api_key)
 ) -> SUserAdd:
@@ -59,7 +114,9 @@ async def login_users(
 
 
 #
-@router.put("/users", status_code=201, summary="Обновить данные пользователя")
+@router.put(
+    "/users", status_code=201, summary="Обновить данные пользователя", dependencies=[Depends(rate_limit("write"))]
+)
 async def update_users(
     async_session_dep: AsyncSession = Depends(get_session),
     api_key: str = Depends(verify_api_key),
@@ -73,33 +130,44 @@ async def update_users(
     :param request_body: Данные для обновления пользователя.
     :return: Обновленные данные пользователя или сообщение об ошибке.
     """
-    res = await UserDAO.update(
-        async_session=async_session_dep, **request_body.model_dump(exclude_none=True), filter_by={"api_key": api_key}
+    res = await UserDAO.update_rows(
+        async_session=async_session_dep,
+        filter_by={"api_key": api_key},
+        returning=tuple(SUserAdd.model_fields),
+        **request_body.model_dump(exclude_none=True),
     )
 
     if not res:
         raise HTTPException(status_code=404, detail="Пользователь не найден.")
-    return [SUserAdd(**user.to_dict()) for user in res]
+    return [SUserAdd(**user) for user in res]
 
 
-@router.delete("/users", summary="Удалить пользователя по токену")
+@router.delete("/users", summary="Удалить пользователя по токену", dependencies=[Depends(rate_limit("write"))])
 async def delete_users(
     async_session_dep: AsyncSession = Depends(get_session), api_key: str = Depends(verify_api_key)
 ) -> Dict[str, int]:
     """
     Удаление пользователя по токену API.
 
+    Пользователь помечается удаленным и сразу пропадает из API,
+    его твиты, лайки и подписки вычищаются в фоне (app.reaper).
+
     :param async_session_dep: Асинхронная сессия базы данных.
     :param api_key: Токен API пользователя.
     :return: Количество удаленных строк.
     """
-    res = await UserDAO.delete(async_session=async_session_dep, api_key=api_key)
+    res = await UserDAO.soft_delete(async_session=async_session_dep, api_key=api_key)
     if res == 0:
         raise HTTPException(status_code=404, detail="Пользователь не найден.")
     return {"удалено строк": res}
 
 
-@router.post("/users/{id}/follow", status_code=201, summary="Подписаться на пользователя по id")
+@router.post(
+    "/users/{id}/follow",
+    status_code=201,
+    summary="Подписаться на пользователя по id",
+    dependencies=[Depends(rate_limit("write"))],
+)
 async def follow_user(
     id: int, async_session_dep: AsyncSession = Depends(get_session), api_key: str = Depends(verify_api_key)
 ) -> RBCorrect:
@@ -110,16 +178,18 @@ async def follow_user(
     :param async_session_dep: Асинхронная сессия базы данных.
     :param api_key: Токен API текущего пользователя.
 
-    :return: Успешный ответ о подписке.
+    :return: Успешный ответ о подписке, в том числе если подписка уже была.
     """
     user: User | None = await UserDAO.find_one_or_none(async_session=async_session_dep, **{"api_key": api_key})
     if user is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    await FollowDAO.add(async_session=async_session_dep, **{"user_id": user.id, "follower_id": id})
+    await FollowDAO.follow(async_session=async_session_dep, user_id=user.id, follower_id=id)
     return RBCorrect()
 
 
-@router.delete("/users/{id}/follow", summary="Отписаться от пользователя по id")
+@router.delete(
+    "/users/{id}/follow", summary="Отписаться от пользователя по id", dependencies=[Depends(rate_limit("write"))]
+)
 async def un_follow_user(
     id: int, async_session_dep: AsyncSession = Depends(get_session), api_key: str = Depends(verify_api_key)
 ) -> Union[RBCorrect, RBUncorrect]:
@@ -135,7 +205,7 @@ async def un_follow_user(
     user: User | None = await UserDAO.find_one_or_none(async_session=async_session_dep, **{"api_key": api_key})
     if user is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    res = await FollowDAO.delete(async_session=async_session_dep, user_id=user.id, follower_id=id)
+    res = await FollowDAO.unfollow(async_session=async_session_dep, user_id=user.id, follower_id=id)
     if res:
         return RBCorrect()
     else:
@@ -143,9 +213,11 @@ async def un_follow_user(
         return RBUncorrect()
 
 
-@router.get("/users/me", summary="Пользователь получает информацию о своем профиле")
+@router.get(
+    "/users/me", summary="Пользователь получает информацию о своем профиле", dependencies=[Depends(rate_limit("read"))]
+)
 async def get_me(
-    async_session_dep: AsyncSession = Depends(get_session), api_key: str = Depends(verify_api_key)
+    async_session_dep: AsyncSession = Depends(get_read_session), api_key: str = Depends(verify_api_key)
 ) -> RBMe | RBUncorrect:
     """
     Получение информации о текущем пользователе.
@@ -155,16 +227,49 @@ async def get_me(
 
     :return: Информация о пользователе или сообщение об ошибке.
     """
-    res = await UserDAO.user_info(async_session=async_session_dep, api_key=api_key)
-    if res:
+    res = await UserDAO.user_info(
+        async_session=async_session_dep, api_key=api_key, preview=settings.PROFILE_FOLLOWS_PREVIEW
+    )
+    if res.get("result"):
         return RBMe(**res)
     else:
         raise HTTPException(status_code=404, detail="Нет такого пользователя")
 
 
-@router.get("/users/{id}", summary="Пользователь получает информацию о профиле другого пользователя")
+@router.get(
+    "/users/me/recommendations", summary="Рекомендации, на кого подписаться", dependencies=[Depends(rate_limit("read"))]
+)
+async def get_recommendations(
+    async_session_dep: AsyncSession = Depends(get_read_session),
+    api_key: str = Depends(verify_api_key),
+    limit: int = Query(20, ge=1, le=100, description="Количество рекомендаций."),
+) -> RBRecommendations:
+    """
+    Получение рекомендаций "друзья друзей" для текущего пользователя.
+
+    Рекомендации читаются из заранее посчитанной таблицы кандидатов,
+    которая обновляется при подписке и отписке.
+
+    :param async_session_dep: Асинхронная сессия базы данных.
+    :param api_key: Токен API текущего пользователя.
+    :param limit: Количество рекомендаций.
+
+    :return: Список рекомендованных пользователей.
+    """
+    user: User | None = await UserDAO.find_one_or_none(async_session=async_session_dep, **{"api_key": api_key})
+    if user is None:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    res = await FollowCandidateDAO.recommendations(async_session=async_session_dep, user_id=user.id, limit=limit)
+    return RBRecommendations(users=[row._asdict() for row in res])
+
+
+@router.get(
+    "/users/{id}",
+    summary="Пользователь получает информацию о профиле другого пользователя",
+    dependencies=[Depends(rate_limit("read"))],
+)
 async def get_user_by_id(
-    id: int, async_session_dep: AsyncSession = Depends(get_session), api_key: str = Depends(verify_api_key)
+    id: int, async_session_dep: AsyncSession = Depends(get_read_session), api_key: str = Depends(verify_api_key)
 ) -> RBMe | RBUncorrect:
     """
     Получение информации о другом пользователе по его ID.
@@ -175,8 +280,74 @@ async def get_user_by_id(
 
     :return: Информация о пользователе или сообщение об ошибке.
     """
-    res = await UserDAO.user_info(async_session=async_session_dep, user_id=id)
+    res = await UserDAO.user_info(async_session=async_session_dep, user_id=id, preview=settings.PROFILE_FOLLOWS_PREVIEW)
     if res.get("result"):
         return RBMe(**res)
     else:
         raise HTTPException(status_code=404, detail="Нет такого пользователя")
+
+
+@router.get(
+    "/users/{id}/followers",
+    summary="Постраничный список подписчиков пользователя",
+    dependencies=[Depends(rate_limit("read"))],
+)
+async def get_user_followers(
+    id: int,
+    response: Response,
+    async_session_dep: AsyncSession = Depends(get_read_session),
+    api_key: str = Depends(verify_api_key),
+    limit: int = Query(50, ge=1, le=1000, description="Размер страницы."),
+    after_id: Optional[int] = Query(None, description="id последнего подписчика предыдущей страницы."),
+) -> List[RBFollower]:
+    """
+    Получение подписчиков пользователя с keyset-пагинацией.
+
+    :param id: ID пользователя.
+    :param response: Ответ, в который добавляется курсор следующей страницы.
+    :param async_session_dep: Асинхронная сессия базы данных.
+    :param api_key: Токен API текущего пользователя.
+    :param limit: Размер страницы.
+    :param after_id: id последнего подписчика предыдущей страницы.
+
+    :return: Страница подписчиков.
+    """
+    res = await UserDAO.follows_page(
+        async_session=async_session_dep, user_id=id, followers=True, after_id=after_id, limit=limit
+    )
+    if len(res) == limit:
+        response.headers["X-Next-After-Id"] = str(res[-1].id)
+    return [RBFollower.model_validate(row, from_attributes=True) for row in res]
+
+
+@router.get(
+    "/users/{id}/following",
+    summary="Постраничный список подписок пользователя",
+    dependencies=[Depends(rate_limit("read"))],
+)
+async def get_user_following(
+    id: int,
+    response: Response,
+    async_session_dep: AsyncSession = Depends(get_read_session),
+    api_key: str = Depends(verify_api_key),
+    limit: int = Query(50, ge=1, le=1000, description="Размер страницы."),
+    after_id: Optional[int] = Query(None, description="id последней подписки предыдущей страницы."),
+) -> List[RBFollowing]:
+    """
+    Получение пользователей, на которых подписан пользователь, с keyset-пагинацией.
+
+    :param id: ID пользователя.
+    :param response: Ответ, в который добавляется курсор следующей страницы.
+    :param async_session_dep: Асинхронная сессия базы данных.
+    :param api_key: Токен API текущего пользователя.
+    :param limit: Размер страницы.
+    :param after_id: id последней подписки предыдущей страницы.
+
+    :return: Страница подписок.
+    """
+    res = await UserDAO.follows_page(
+        async_session=async_session_dep, user_id=id, followers=False, after_id=after_id, limit=limit
+    )
+    if len(res) == limit:
+        response.headers["X-Next-After-Id"] = str(res[-1].id)
+    return [RBFollowing.model_validate(row, from_attributes=True) for row in res]
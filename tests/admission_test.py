@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import admission as admission_module
+from app.admission import AdmissionController, priority_of
+from app.config import logger, settings
+from app.database import TEST_DATABASE_URL, TimedQueuePool, pool_wait_listeners
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_admission_controller():
+    """Проверка очереди допуска: приоритеты, таймауты и отказ дорогим чтениям при ожидании пула."""
+    controller = AdmissionController(1, 10, {"high": 1.0, "normal": 1.0, "low": 0.0}, pool_wait_limit=0.05)
+    assert priority_of("POST", "/api/tweets/5/likes") == "high"
+    assert priority_of("GET", "/api/tweets") == "low"
+    assert priority_of("GET", "/api/users/me") == "normal"
+    assert priority_of("GET", "/api/tweets/stream") is None
+    assert await controller.admit("normal") is None
+    # Места нет: дорогое чтение отклоняется сразу, остальные ждут
+    assert await controller.admit("low") == "in_flight"
+    normal = asyncio.ensure_future(controller.admit("normal"))
+    high = asyncio.ensure_future(controller.admit("high"))
+    await asyncio.sleep(0)
+    assert controller.queued == 2
+    # Освободившееся место достается высшему приоритету, хотя он пришел позже
+    controller.release()
+    assert await high is None
+    assert not normal.done()
+    controller.release()
+    assert await normal is None
+    controller.release()
+    assert controller.in_flight == 0
+    # Не дождавшийся места запрос отклоняется
+    controller.queue_timeouts["normal"] = 0.05
+    assert await controller.admit("normal") is None
+    assert await controller.admit("normal") == "queue_timeout"
+    assert controller.queued == 0
+    controller.release()
+    # Пул перегружен: дорогие чтения отклоняются даже при свободных местах, пока среднее не затухнет
+    for _ in range(10):
+        controller.observe_pool_wait(1.0)
+    assert await controller.admit("low") == "pool_wait"
+    assert await controller.admit("high") is None
+    controller.release()
+    assert controller.in_flight == 0
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_admission_release_at_deadline(monkeypatch):
+    """Проверка, что место, отданное в момент таймаута ожидания, не теряется."""
+    controller = AdmissionController(1, 10, {"normal": 1.0}, pool_wait_limit=1.0)
+    assert await controller.admit("normal") is None
+
+    async def wait_for(waiter, timeout):
+        # Место освобождается в том же шаге цикла, в котором срабатывает таймаут
+        controller.release()
+        raise asyncio.TimeoutError
+
+    monkeypatch.setattr(asyncio, "wait_for", wait_for)
+    assert await controller.admit("normal") is None
+    assert controller.in_flight == 1
+    controller.release()
+    assert controller.in_flight == 0
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_admission_route(async_client, test_db, monkeypatch):
+    """Проверка, что при перегрузке лента получает 503 с Retry-After, а лайки и авторизация ждут места."""
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    controller = admission_module.admission
+    monkeypatch.setattr(controller, "max_in_flight", 1)
+    monkeypatch.setitem(controller.queue_timeouts, "low", 0.0)
+
+    def shed() -> float:
+        return REGISTRY.get_sample_value("admission_shed_total", {"priority": "low", "reason": "in_flight"}) or 0.0
+
+    before = shed()
+    assert await controller.admit("normal") is None
+    res = await async_client.get("/api/tweets", headers={"api-key": "test"})
+    assert res.status_code == 503
+    assert res.headers["retry-after"] == str(settings.ADMISSION_RETRY_AFTER)
+    assert res.json()["error_type"] == "Overloaded"
+    assert shed() == before + 1
+    # Авторизация ждет в очереди и проходит, как только место освободится
+    login = asyncio.ensure_future(async_client.get("/api/users", headers={"api-key": "test"}))
+    await asyncio.sleep(0.05)
+    assert not login.done()
+    controller.release()
+    assert (await login).status_code == 200
+    assert controller.in_flight == 0
+    assert (await async_client.get("/api/tweets", headers={"api-key": "test"})).status_code == 200
+    assert controller.in_flight == 0
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_pool_wait_measurement():
+    """Проверка, что ожиданием пула считается только очередь за занятым соединением, а не подключение."""
+    waits = []
+    pool_wait_listeners.append(waits.append)
+    engine = create_async_engine(TEST_DATABASE_URL, pool_size=1, max_overflow=0, poolclass=TimedQueuePool)
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+            async def second() -> None:
+                async with engine.connect() as other:
+                    await other.execute(text("SELECT 1"))
+
+            task = asyncio.ensure_future(second())
+            await asyncio.sleep(0.2)
+        await task
+    finally:
+        pool_wait_listeners.remove(waits.append)
+        await engine.dispose()
+    # Первое соединение открывалось, а не ждалось; второе ждало, пока первое вернут в пул
+    assert waits[0] < 0.05
+    assert max(waits) >= 0.15
+    logger.info("OK")
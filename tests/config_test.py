@@ -3,7 +3,8 @@ from unittest.mock import patch
 
 import pytest
 
-from app.config import get_settings, logger
+from app.config import get_settings, logger, settings
+from app.server import available_cpus, workers_count
 
 
 def test_config(config):
@@ -41,3 +42,12 @@ def test_invalid_settings():
         with pytest.raises(RuntimeError):
             get_settings()  # Вызов функции для получения настроек
     logger.info("ОК")
+
+
+def test_server_workers(monkeypatch):
+    """Проверка количества воркеров продакшн-сервера."""
+    monkeypatch.setattr(settings, "SERVER_WORKERS", 3)
+    assert workers_count() == 3
+    monkeypatch.setattr(settings, "SERVER_WORKERS", 0)
+    assert workers_count() == available_cpus() >= 1
+    logger.info("ОК")
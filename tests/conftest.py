@@ -7,7 +7,7 @@ from httpx import ASGITransport, AsyncClient
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.config import get_settings, logger
+from app.config import get_settings, logger, settings
 from app.data_generate import (
     MediaFactory,
     TweetFactory,
@@ -41,6 +41,14 @@ async def get_session_override() -> AsyncGenerator[AsyncSession, None]:
 
 # Переопределение зависимости get_session в приложении FastAPI
 app.dependency_overrides[get_session] = get_session_override
+# Тесты шлют много запросов с одним api-key, лимиты включаются только в тестах лимитов
+settings.RATE_LIMIT_ENABLED = False
+# Снимки ответов тоже включаются только в своем тесте: тестовые данные пишутся и в обход DAO
+settings.SNAPSHOT_API_KEYS = []
+# Контроль допуска проверяется в своем тесте: в остальных ожидание пула не должно отклонять запросы
+settings.ADMISSION_ENABLED = False
+# Тестовые данные пишутся в обход DAO и не меняют версию данных: готовые результаты чтений не переиспользуются
+settings.SINGLE_FLIGHT_WINDOW_MS = 0
 
 
 # @pytest.fixture(scope="session")
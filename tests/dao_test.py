@@ -1,9 +1,18 @@
+import asyncio
+from typing import List
+
 import pytest
+from sqlalchemy import event, text
 from sqlalchemy.exc import SQLAlchemyError
 
-from app.config import logger
+from app.config import logger, settings
+from app.dao.single_flight import flights
 from app.data_generate import UserFactory
-from app.users.dao import UserDAO
+from app.database import test_engine
+from app.events import PgListener
+from app.invalidation import ALL, CHANNEL, InvalidationBus, invalidation
+from app.partitions import LIKES_PARTITIONS, ensure_partitions
+from app.users.dao import FollowDAO, UserDAO
 
 
 @pytest.mark.asyncio(loop_scope="session")
@@ -14,6 +23,19 @@ async def test_base_dao_find_all(test_db):
     logger.info("ОК")
 
 
+@pytest.mark.asyncio(loop_scope="session")
+async def test_base_dao_find_rows(test_db):
+    """Проверка получения выбранных колонок без экземпляров модели."""
+    users = await UserDAO.find_all(async_session=test_db)
+    rows = await UserDAO.find_rows(async_session=test_db, columns=("id", "api_key"))
+    assert len(rows) == len(users)
+    assert rows[0]._fields == ("id", "api_key")
+    assert {row.api_key for row in rows} == {user.api_key for user in users}
+    one = await UserDAO.find_rows(async_session=test_db, columns=("first_name",), id=1)
+    assert len(one) == 1
+    logger.info("ОК")
+
+
 @pytest.mark.parametrize("data_id, expected", [(num + 1, num + 1) for num in range(10)])
 @pytest.mark.asyncio(loop_scope="session")
 async def test_base_dao_find_one_or_none_by_id(test_db, data_id, expected):
@@ -120,3 +142,139 @@ async def test_base_dao_delete(test_db):
     # follows = generate_follow(10)
     # add_users = [await UserDAO.add(async_session=test_db, **user.to_dict()) for user in users]
     # add_follows = [await FollowDAO.add(async_session=test_db, **follow.to_dict()) for follow in follows]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_base_dao_add_or_ignore(test_db):
+    """Проверка идемпотентной вставки без IntegrityError на дубликате."""
+    await FollowDAO.delete(async_session=test_db, user_id=2, follower_id=9)
+    assert await FollowDAO.add_or_ignore(async_session=test_db, user_id=2, follower_id=9) is True
+    assert await FollowDAO.add_or_ignore(async_session=test_db, user_id=2, follower_id=9) is False
+    with pytest.raises(SQLAlchemyError):
+        await FollowDAO.add_or_ignore(async_session=test_db, user_id=2, follower_id=100000)
+    assert await FollowDAO.delete(async_session=test_db, user_id=2, follower_id=9) == 1
+    logger.info("ОК")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_likes_partitions(test_db):
+    """Проверка, что лайки секционированы по tweet_id и запрос по твиту читает одну секцию."""
+    async with test_engine.begin() as conn:
+        await ensure_partitions(conn)
+        res = await conn.execute(
+            text("SELECT count(*) FROM pg_inherits WHERE inhparent = 'likes'::regclass"),
+        )
+        assert res.scalar_one() == LIKES_PARTITIONS
+        plan = await conn.execute(text("EXPLAIN SELECT * FROM likes WHERE tweet_id = 5"))
+        scanned = [line for (line,) in plan.all() if "likes_p" in line]
+        assert len(scanned) == 1
+    logger.info("ОК")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_invalidation_bus(test_db):
+    """Проверка, что записи DAO сбрасывают кэши своего воркера сразу, а других - через LISTEN/NOTIFY."""
+    local: List[str] = []
+    remote: List[str] = []
+    received = asyncio.Event()
+    # Другой воркер: своя шина и свое соединение LISTEN
+    other = InvalidationBus()
+    other.subscribe("users", lambda key: (remote.append(key), received.set()))
+    listener = PgListener(settings.get_test_db_url().replace("postgresql+asyncpg://", "postgresql://"))
+    listener.listen(CHANNEL, other.dispatch_payload)
+    listener.on_connect(other.flush)
+    invalidation.subscribe("users", local.append)
+    task = asyncio.create_task(listener.run())
+    try:
+        await asyncio.wait_for(listener.connected.wait(), 5)
+        assert remote == [ALL]
+        received.clear()
+        user = await UserDAO.add(async_session=test_db, **{**UserFactory().to_dict(), "api_key": "invalidation"})
+        await UserDAO.update(async_session=test_db, filter_by={"id": user.id}, first_name="Кэш")
+        await UserDAO.delete(async_session=test_db, id=user.id)
+        assert local == [str(user.id)] * 3
+        while len(remote) < 4:
+            received.clear()
+            await asyncio.wait_for(received.wait(), 5)
+        assert remote == [ALL] + [str(user.id)] * 3
+    finally:
+        invalidation.unsubscribe("users", local.append)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_base_dao_update_rows(test_db):
+    """Проверка обновления без экземпляров модели и пакетного обновления по первичному ключу."""
+    users = [
+        await UserDAO.add(async_session=test_db, **{**UserFactory().to_dict(), "api_key": f"bulk_{i}"})
+        for i in range(3)
+    ]
+    rows = await UserDAO.update_rows(
+        async_session=test_db, filter_by={"api_key": "bulk_0"}, returning=("first_name",), last_name="Лин"
+    )
+    assert rows == [{"first_name": users[0].first_name}]
+    assert (await UserDAO.find_one_or_none_by_id(async_session=test_db, data_id=users[0].id)).last_name == "Лин"
+    assert await UserDAO.update_rows(async_session=test_db, filter_by={"api_key": "bulk_missing"}, last_name="x") == []
+    updated = await UserDAO.bulk_update(
+        async_session=test_db, rows=[{"id": user.id, "first_name": f"Пакет {i}"} for i, user in enumerate(users)]
+    )
+    assert updated == 3
+    for i, user in enumerate(users):
+        assert (await UserDAO.find_one_or_none_by_id(async_session=test_db, data_id=user.id)).first_name == f"Пакет {i}"
+    assert await UserDAO.bulk_update(async_session=test_db, rows=[]) == 0
+    for user in users:
+        await UserDAO.delete(async_session=test_db, id=user.id)
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_single_flight(test_db, monkeypatch):
+    """Проверка, что одинаковые одновременные чтения выполняются одним запросом, а запись сбрасывает результат."""
+    user = await UserDAO.add(async_session=test_db, **{**UserFactory().to_dict(), "api_key": "single_flight"})
+    statements: List[str] = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        await UserDAO.user_info(async_session=test_db, user_id=user.id, preview=10)
+        queries = len(statements)
+        results = await asyncio.gather(
+            *(UserDAO.user_info(async_session=test_db, user_id=user.id, preview=10) for _ in range(5))
+        )
+        assert all(result is results[0] for result in results)
+        assert results[0]["user"]["id"] == user.id
+        assert len(statements) == 2 * queries
+        assert len(flights) == 0
+        # Окно повторного использования: тот же результат без запроса, пока версия данных не изменилась
+        monkeypatch.setattr(settings, "SINGLE_FLIGHT_WINDOW_MS", 10_000)
+        first = await UserDAO.user_info(async_session=test_db, user_id=user.id, preview=10)
+        assert await UserDAO.user_info(async_session=test_db, user_id=user.id, preview=10) is first
+        assert len(statements) == 3 * queries
+        await UserDAO.update(async_session=test_db, filter_by={"id": user.id}, first_name="Обновлен")
+        fresh = await UserDAO.user_info(async_session=test_db, user_id=user.id, preview=10)
+        assert fresh["user"]["first_name"] == "Обновлен"
+        # Все ждущие ушли: общий запрос отменяется
+        monkeypatch.setattr(settings, "SINGLE_FLIGHT_WINDOW_MS", 0)
+        waiters = [
+            asyncio.ensure_future(UserDAO.user_info(async_session=test_db, user_id=user.id, preview=5))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        assert len(flights) == 1
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        for _ in range(50):
+            if not flights:
+                break
+            await asyncio.sleep(0.01)
+        assert len(flights) == 0
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", count)
+        await UserDAO.delete(async_session=test_db, id=user.id)
+    logger.info("OK")
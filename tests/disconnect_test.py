@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError
+from starlette.requests import Request
+
+from app.config import logger, settings
+from app.dao.base import statement_timeout
+from app.database import async_test_session
+from app.disconnect import CancelOnDisconnectMiddleware
+from app.exceptions.exceptions_methods import db_timeout_exception_handler
+from app.users.dao import UserDAO
+
+
+class SleepDAO(UserDAO):
+    """DAO с заведомо медленным запросом."""
+
+    @classmethod
+    @statement_timeout
+    async def sleep(cls, async_session, seconds):
+        """Запрос, который выполняется ``seconds`` секунд."""
+        async with async_session as session:
+            return (await session.execute(select(func.pg_sleep(seconds)))).all()
+
+
+async def running_sleeps() -> int:
+    """Количество выполняющихся сейчас запросов pg_sleep в тестовой БД."""
+    async with async_test_session() as session:
+        query = text(
+            "SELECT count(*) FROM pg_stat_activity "
+            "WHERE state = 'active' AND query LIKE '%pg_sleep%' AND pid <> pg_backend_pid()"
+        )
+        return (await session.execute(query)).scalar_one()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_statement_timeout(monkeypatch):
+    """Проверка, что медленный запрос метода DAO прерывает Postgres, а лимит не остается на соединении."""
+    monkeypatch.setattr(settings, "DB_STATEMENT_TIMEOUTS_MS", {"SleepDAO.sleep": 100})
+    async with async_test_session() as session:
+        default = (await session.execute(text("SHOW statement_timeout"))).scalar_one()
+    started = time.monotonic()
+    with pytest.raises(DBAPIError) as exc_info:
+        await SleepDAO.sleep(async_session=async_test_session(), seconds=5)
+    assert time.monotonic() - started < 2
+    response = await db_timeout_exception_handler(
+        Request({"type": "http", "method": "GET", "path": "/api/tweets", "query_string": b"", "headers": []}),
+        exc_info.value,
+    )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    # Лимит задан через SET LOCAL и закончился вместе с транзакцией
+    async with async_test_session() as session:
+        assert (await session.execute(text("SHOW statement_timeout"))).scalar_one() == default
+    monkeypatch.setattr(settings, "DB_STATEMENT_TIMEOUTS_MS", {"SleepDAO.sleep": 0})
+    monkeypatch.setattr(settings, "DB_STATEMENT_TIMEOUT_MS", 0)
+    assert await SleepDAO.sleep(async_session=async_test_session(), seconds=0.2) == [(None,)]
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_cancel_on_disconnect():
+    """Проверка, что отключение клиента отменяет GET-запрос и его запрос к БД, но не готовый ответ."""
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def slow_app(scope, receive, send):
+        await SleepDAO.sleep(async_session=async_test_session(), seconds=10)
+
+    async def leaving_client():
+        yield {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(0.3)
+        yield {"type": "http.disconnect"}
+
+    messages = leaving_client()
+    scope = {"type": "http", "method": "GET", "path": "/api/tweets"}
+    started = time.monotonic()
+    await CancelOnDisconnectMiddleware(slow_app)(scope, messages.__anext__, send)
+    assert time.monotonic() - started < 2
+    assert sent == []
+    # asyncpg отправил запрос отмены: запрос не продолжает выполняться в Postgres
+    for _ in range(20):
+        if not await running_sleeps():
+            break
+        await asyncio.sleep(0.1)
+    assert await running_sleeps() == 0
+
+    # Клиент ушел после получения ответа: дообработка запроса не прерывается
+    responded = asyncio.Event()
+    finished = []
+
+    async def fast_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+        responded.set()
+        await asyncio.sleep(0.1)
+        finished.append(True)
+
+    async def satisfied_client():
+        yield {"type": "http.request", "body": b"", "more_body": False}
+        await responded.wait()
+        yield {"type": "http.disconnect"}
+
+    messages = satisfied_client()
+    await CancelOnDisconnectMiddleware(fast_app)(scope, messages.__anext__, send)
+    assert finished == [True]
+    assert sent[-1]["body"] == b"ok"
+    logger.info("OK")
@@ -1,10 +1,22 @@
+import hashlib
 import os.path
+import struct
+from datetime import timedelta
 
 import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import func, update
 
-from app.config import logger
+from app.config import logger, settings
 from app.data_generate import UserFactory
+from app.database import async_test_session
 from app.medias.dao import MediaDAO
+from app.medias.gc import collect_once
+from app.medias.models import Media
+from app.medias.router import media_pool
+from app.medias.upload_limit import UploadLimitMiddleware
+from app.medias.urls import media_url, sign
+from app.medias.validation import MediaTooLargeError, MediaValidationError, validate_image
 
 
 @pytest.mark.asyncio(loop_scope="session")
@@ -30,10 +42,149 @@ async def test_upload_image(async_client, test_db):
         assert correct.status_code == 201
     #
     media_name = await MediaDAO.find_one_or_none_by_id(async_session=test_db, data_id=correct.json()["media_id"])
-    # file_path=media_name.to_dict()['media_data']
-    if os.path.split(os.getcwd())[1] == "tests":
-        file_path = os.path.join("..", "app" + media_name.to_dict()["media_data"])
-    elif os.path.split(os.getcwd())[1] == "kill_twitter":
-        file_path = os.path.join("app" + media_name.to_dict()["media_data"])
+    file_path = Media.file_path(media_name.media_data)
+    assert os.path.exists(file_path)
+    # Загрузка не отдается статикой без подписи, ни по адресу из БД, ни из директории images
+    assert (await async_client.get(media_name.media_data)).status_code == 404
+    assert (await async_client.get(f"/static/images/{os.path.basename(file_path)}")).status_code == 404
     os.remove(file_path)
     logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_media_gc(async_client, test_db):
+    """Проверка, что сборщик мусора удаляет старые медиа без твитов вместе с файлом и не трогает новые."""
+    user = UserFactory()
+    await async_client.post("/api/users", params=user.to_dict())
+    ids = []
+    for _ in range(2):
+        with open(os.path.join(os.path.dirname(__file__), "1.jpg"), "rb") as file:
+            res = await async_client.post(
+                "/api/medias", headers={"api-key": user.api_key}, files={"file": ("1.jpg", file)}
+            )
+        ids.append(res.json()["media_id"])
+    old, fresh = [await MediaDAO.find_one_or_none_by_id(async_session=test_db, data_id=media_id) for media_id in ids]
+    old_path, fresh_path = Media.file_path(old.media_data), Media.file_path(fresh.media_data)
+    async with async_test_session() as session:
+        await session.execute(update(Media).where(Media.id == old.id).values(created_at=func.now() - timedelta(days=2)))
+        await session.commit()
+    before = REGISTRY.get_sample_value("media_gc_reclaimed_bytes_total")
+
+    async with async_test_session() as session:
+        deleted, reclaimed = await collect_once(session, grace_seconds=86400, batch_size=100)
+    assert deleted == 1
+    assert reclaimed == os.path.getsize(os.path.join(os.path.dirname(__file__), "1.jpg"))
+    assert REGISTRY.get_sample_value("media_gc_reclaimed_bytes_total") - before == reclaimed
+    assert not os.path.exists(old_path)
+    assert os.path.exists(fresh_path)
+    assert await MediaDAO.find_one_or_none_by_id(async_session=test_db, data_id=old.id) is None
+    os.remove(fresh_path)
+    logger.info("OK")
+
+
+def jpeg(width: int, height: int) -> bytes:
+    """Минимальный JPEG: сегмент EXIF, заголовок кадра SOF0 и пустой скан."""
+    exif = b"Exif\x00\x00" + b"GPS" * 10
+    sof = b"\x08" + struct.pack(">HH", height, width) + b"\x01\x01\x11\x00"
+    sos = b"\x01\x01\x00\x00\x3f\x00"
+    segments = [(0xE1, exif), (0xC0, sof), (0xDA, sos)]
+    body = b"".join(bytes([0xFF, marker]) + struct.pack(">H", len(data) + 2) + data for marker, data in segments)
+    return b"\xff\xd8" + body + b"\x00\x00\xff\xd9"
+
+
+def test_validate_image():
+    """Проверка определения формата по содержимому, лимитов размеров и удаления EXIF."""
+    kind, clean = validate_image(jpeg(640, 480), max_side=1000, max_pixels=10**6)
+    assert kind == "jpg"
+    assert b"Exif" not in clean and b"GPS" not in clean
+    assert clean.startswith(b"\xff\xd8") and clean.endswith(b"\xff\xd9")
+    with pytest.raises(MediaTooLargeError):
+        validate_image(jpeg(60000, 60000), max_side=8192, max_pixels=10**6)
+    with pytest.raises(MediaTooLargeError):
+        validate_image(jpeg(2000, 2000), max_side=8192, max_pixels=10**6)
+    with pytest.raises(MediaValidationError):
+        validate_image(b"<?php echo 1; ?>", max_side=1000, max_pixels=10**6)
+    with pytest.raises(MediaValidationError):
+        validate_image(jpeg(640, 480)[:30], max_side=1000, max_pixels=10**6)
+    chunks = [(b"IHDR", struct.pack(">II", 3, 2) + b"\x08\x02\x00\x00\x00"), (b"eXIf", b"GPS!"), (b"IEND", b"")]
+    png = b"\x89PNG\r\n\x1a\n" + b"".join(
+        struct.pack(">I", len(data)) + chunk + data + b"\x00" * 4 for chunk, data in chunks
+    )
+    kind, clean = validate_image(png, max_side=1000, max_pixels=10**6)
+    assert kind == "png" and b"eXIf" not in clean and b"IEND" in clean
+    kind, clean = validate_image(b"GIF89a" + struct.pack("<HH", 10, 20) + b"\x00" * 10, max_side=20, max_pixels=10**6)
+    assert kind == "gif"
+    with open(os.path.join(os.path.dirname(__file__), "1.jpg"), "rb") as file:
+        kind, _ = validate_image(file.read(), max_side=480, max_pixels=480 * 271)
+    assert kind == "webp"
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_upload_rejects(async_client, test_db, monkeypatch):
+    """Проверка, что не-изображения и огромные изображения отклоняются, а при заполненной очереди отдается 429."""
+    headers = {"api-key": "test"}
+    res = await async_client.post("/api/medias", headers=headers, files={"file": ("x.jpg", b"MZ\x90\x00 not an image")})
+    assert res.status_code == 415
+    res = await async_client.post("/api/medias", headers=headers, files={"file": ("x.jpg", jpeg(65000, 65000))})
+    assert res.status_code == 413
+    res = await async_client.post("/api/medias", headers=headers, files={"file": ("x.jpg", jpeg(640, 480))})
+    assert res.status_code == 201
+    media = await MediaDAO.find_one_or_none_by_id(async_session=test_db, data_id=res.json()["media_id"])
+    assert media.media_data.endswith(".jpg")
+    with open(Media.file_path(media.media_data), "rb") as file:
+        assert b"Exif" not in file.read()
+    os.remove(Media.file_path(media.media_data))
+    # Тело больше лимита отклоняется по Content-Length, не дойдя до разбора multipart
+    sent = []
+
+    async def app(scope, receive, send):
+        raise AssertionError("тело не должно читаться")
+
+    async def receive():
+        raise AssertionError("тело не должно читаться")
+
+    async def send(message):
+        sent.append(message)
+
+    length = str(settings.MEDIA_MAX_BYTES * 2).encode()
+    scope = {"type": "http", "method": "POST", "path": "/api/medias", "headers": [(b"content-length", length)]}
+    await UploadLimitMiddleware(app)(scope, receive, send)
+    assert sent[0]["status"] == 413
+    monkeypatch.setattr(media_pool, "queue_size", -media_pool.workers)
+    res = await async_client.post("/api/medias", headers=headers, files={"file": ("x.jpg", jpeg(640, 480))})
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "1"
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_signed_media_url(async_client, test_db, monkeypatch):
+    """Проверка подписанного URL медиафайла: кэширование навсегда, проверка подписи и X-Accel-Redirect."""
+    headers = {"api-key": "test"}
+    res = await async_client.post("/api/medias", headers=headers, files={"file": ("x.jpg", jpeg(64, 48))})
+    media = await MediaDAO.find_one_or_none_by_id(async_session=test_db, data_id=res.json()["media_id"])
+    res = await async_client.post(
+        "/api/tweets", headers=headers, json={"tweet_data": "фото", "tweet_media_ids": [media.id]}
+    )
+    feed = await async_client.get("/api/tweets", headers=headers)
+    url = media_url(media)
+    assert url.startswith(f"/api/medias/{media.id}/{media.content_hash}.jpg?sig=")
+    assert [tweet["attachments"] for tweet in feed.json()["tweets"] if tweet["id"] == res.json()["tweet_id"]] == [[url]]
+
+    res = await async_client.get(url)
+    assert res.status_code == 200
+    assert res.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert res.headers["content-type"] == "image/jpeg"
+    assert hashlib.sha256(res.content).hexdigest() == media.content_hash
+    assert (await async_client.get(url[:-1] + ("0" if url[-1] != "0" else "1"))).status_code == 403
+    other = f"{media.id}/{'0' * 64}.jpg"
+    assert (await async_client.get(f"/api/medias/{other}?sig={sign(other)}")).status_code == 404
+
+    monkeypatch.setattr(settings, "MEDIA_X_ACCEL_REDIRECT", True)
+    res = await async_client.get(url)
+    assert res.status_code == 200
+    assert res.headers["X-Accel-Redirect"] == "/protected/images/" + os.path.basename(media.media_data)
+    assert res.content == b""
+    os.remove(Media.file_path(media.media_data))
+    logger.info("OK")
@@ -0,0 +1,159 @@
+import asyncio
+import math
+from typing import Dict
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from app import rate_limit
+from app.config import logger, settings
+from app.main import app
+from app.rate_limit import MemoryBackend, RespBackend, RespClient
+
+
+async def fake_redis(store: Dict[str, str], delay: float = 0.0) -> asyncio.AbstractServer:
+    """Локальный сервер RESP с командами GET и SET вместо Redis, отвечающий с задержкой ``delay`` секунд."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while line := await reader.readline():
+            args = []
+            for _ in range(int(line[1:])):
+                size = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(size + 2))[:-2].decode())
+            await asyncio.sleep(delay)
+            if args[0] == "GET":
+                value = store.get(args[1])
+                writer.write(b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value.encode()))
+            elif args[0] == "SET":
+                store[args[1]] = args[2]
+                store[f"{args[1]}:px"] = args[4]
+                writer.write(b"+OK\r\n")
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_memory_backend():
+    """Проверка корзины токенов в памяти: всплеск, ожидание и вытеснение простаивающих ключей."""
+    backend = MemoryBackend(max_keys=2)
+    assert [await backend.take("a", rate=1, burst=3) for _ in range(3)] == [0, 0, 0]
+    wait = await backend.take("a", rate=1, burst=3)
+    assert 0 < wait <= 1
+    # Полная корзина не хранится, сверх max_keys вытесняются самые старые ключи
+    assert await backend.take("b", rate=1000, burst=1) == 0
+    await asyncio.sleep(0.01)
+    await backend.take("c", rate=1, burst=3)
+    await backend.take("d", rate=1, burst=3)
+    assert len(backend) == 2
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_resp_backend():
+    """Проверка корзины токенов на сервере RESP: общее состояние и время жизни ключа."""
+    store: Dict[str, str] = {}
+    server = await fake_redis(store)
+    port = server.sockets[0].getsockname()[1]
+    backend = RespBackend(RespClient(f"redis://127.0.0.1:{port}/0"))
+    assert await backend.take("write:key", rate=0.5, burst=2) == 0
+    assert await backend.take("write:key", rate=0.5, burst=2) == 0
+    assert await backend.take("write:key", rate=0.5, burst=2) > 1
+    assert float(store["rate_limit:write:key"].split(":")[0]) < 1
+    assert 0 < int(store["rate_limit:write:key:px"]) <= 4000
+    await backend.client.close()
+    server.close()
+    await server.wait_closed()
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_resp_client_cancel():
+    """Проверка, что отмененная или зависшая команда не оставляет чужой ответ в соединении."""
+    store = {"key-A": "val-of-key-A", "key-B": "val-of-key-B"}
+    server = await fake_redis(store, delay=0.2)
+    port = server.sockets[0].getsockname()[1]
+    client = RespClient(f"redis://127.0.0.1:{port}/0", timeout=1.0)
+    task = asyncio.ensure_future(client.execute("GET", "key-A"))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert await client.execute("GET", "key-B") == "val-of-key-B"
+    assert await client.execute("SET", "key-C", "1", "PX", 100) == "OK"
+    assert await client.execute("GET", "key-A") == "val-of-key-A"
+    # Сервер отвечает дольше таймаута: команда падает, а не держит очередь
+    client.timeout = 0.05
+    with pytest.raises(asyncio.TimeoutError):
+        await client.execute("GET", "key-A")
+    client.timeout = 1.0
+    assert await client.execute("GET", "key-B") == "val-of-key-B"
+    await client.close()
+    server.close()
+    await server.wait_closed()
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_rate_limit_route(async_client, monkeypatch):
+    """Проверка, что превышение лимита отдает 429 с Retry-After, а лимиты разных ключей независимы."""
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setitem(settings.RATE_LIMITS, "read", (0.1, 2))
+    monkeypatch.setattr(rate_limit, "backend", MemoryBackend())
+    for _ in range(2):
+        res = await async_client.get("/api/users/me", headers={"api-key": "test"})
+        assert res.status_code == 200
+    res = await async_client.get("/api/users/me", headers={"api-key": "test"})
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "10"
+    res = await async_client.get("/api/users/1", headers={"api-key": "test"})
+    assert res.status_code == 429
+    res = await async_client.get("/api/users/me", headers={"api-key": "test2"})
+    assert res.status_code != 429
+    # Случайный ключ в каждом запросе не дает новой корзины: срабатывает лимит IP
+    backend = MemoryBackend()
+    monkeypatch.setattr(rate_limit, "backend", backend)
+    statuses = [
+        (await async_client.get("/api/users/me", headers={"api-key": f"random-{i}"})).status_code for i in range(12)
+    ]
+    burst = math.ceil(2 * settings.RATE_LIMIT_IP_FACTOR)
+    assert 429 not in statuses[:burst]
+    assert set(statuses[burst:]) == {429}
+    assert len(backend) == burst + 1
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_rate_limit_forwarded_for(test_db, monkeypatch):
+    """Проверка, что поддельный X-Forwarded-For не дает новой корзины IP, а от доверенного прокси учитывается."""
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setitem(settings.RATE_LIMITS, "read", (0.1, 2))
+    backend = MemoryBackend()
+    monkeypatch.setattr(rate_limit, "backend", backend)
+    # Как в app/server.py: uvicorn верит X-Forwarded-For только прокси из SERVER_FORWARDED_ALLOW_IPS
+    proxied = ProxyHeadersMiddleware(app, trusted_hosts=settings.SERVER_FORWARDED_ALLOW_IPS)
+    burst = math.ceil(2 * settings.RATE_LIMIT_IP_FACTOR)
+    transport = ASGITransport(app=proxied, client=("203.0.113.7", 40000))
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        statuses = [
+            (
+                await client.get(
+                    "/api/users/me", headers={"api-key": f"random-{i}", "X-Forwarded-For": f"198.51.100.{i}"}
+                )
+            ).status_code
+            for i in range(burst + 2)
+        ]
+    assert 429 not in statuses[:burst]
+    assert set(statuses[burst:]) == {429}
+    assert [key for key in backend._buckets if ":ip:" in key] == ["read:ip:203.0.113.7"]
+    # Запрос через nginx: IP клиента берется из заголовка доверенного прокси
+    transport = ASGITransport(app=proxied, client=("127.0.0.1", 40000))
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        res = await client.get("/api/users/me", headers={"api-key": "test", "X-Forwarded-For": "198.51.100.1"})
+    assert res.status_code != 429
+    assert "read:ip:198.51.100.1" in backend._buckets
+    logger.info("OK")
@@ -0,0 +1,74 @@
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import func, select
+
+from app.config import logger
+from app.data_generate import UserFactory
+from app.database import async_test_session
+from app.medias.models import Media
+from app.reaper import reap_once
+from app.tweets.models import Like, Tweet, TweetMedia
+from app.users.dao import FollowCandidateDAO, FollowDAO, UserDAO
+from app.users.models import Follow, FollowCandidate, User
+
+
+async def count(query) -> int:
+    """Количество строк в запросе без фильтра мягкого удаления."""
+    async with async_test_session() as session:
+        return (await session.execute(select(func.count()).select_from(query.subquery()))).scalar_one()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_soft_delete_and_reap(async_client, test_db):
+    """Проверка, что удаленный пользователь сразу скрыт, а его данные вычищаются в фоне пачками."""
+    user = UserFactory(api_key=uuid4().hex)
+    res = await async_client.post("/api/users", params=user.to_dict())
+    assert res.status_code == 201
+    headers = {"api-key": user.api_key}
+    created = await UserDAO.find_one_or_none(async_session=test_db, api_key=user.api_key)
+    async with async_test_session() as session:
+        media = Media(media_data="/static/images/reaper_test.jpg")
+        session.add(media)
+        await session.commit()
+    tweet_ids = []
+    for _ in range(3):
+        res = await async_client.post(
+            "/api/tweets", headers=headers, json={"tweet_data": "пока", "tweet_media_ids": []}
+        )
+        tweet_ids.append(res.json()["tweet_id"])
+    await async_client.post("/api/tweets", headers=headers, json={"tweet_data": "фото", "tweet_media_ids": [media.id]})
+    await async_client.post(f"/api/tweets/{tweet_ids[0]}/likes", headers={"api-key": "test"})
+    await async_client.post("/api/users/1/follow", headers=headers)
+    # Путь 2 -> удаленный -> 1 дает пользователю 2 кандидата, который должен уйти вместе с подписками
+    await FollowDAO.follow(async_session=async_test_session(), user_id=2, follower_id=created.id)
+    await FollowCandidateDAO.rebuild(async_session=test_db)
+
+    res = await async_client.delete("/api/users", headers=headers)
+    assert res.status_code == 200
+    assert res.json() == {"удалено строк": 1}
+    # Пользователь и его твиты пропадают сразу, строки в БД еще на месте
+    res = await async_client.get(f"/api/users/{created.id}", headers={"api-key": "test"})
+    assert res.status_code == 404
+    feed = await async_client.get("/api/tweets", headers={"api-key": "test"})
+    assert not [tweet for tweet in feed.json()["tweets"] if tweet["author"]["id"] == created.id]
+    assert await count(select(Tweet).where(Tweet.user_id == created.id)) == 4
+
+    for _ in range(20):
+        async with async_test_session() as session:
+            stats = await reap_once(session, batch_size=2)
+        if not any(stats.values()):
+            break
+    assert await count(select(User).where(User.id == created.id)) == 0
+    assert await count(select(Tweet).where(Tweet.user_id == created.id)) == 0
+    assert await count(select(Like).where(Like.tweet_id.in_(tweet_ids))) == 0
+    assert await count(select(Follow).where(Follow.user_id == created.id)) == 0
+    assert await count(select(TweetMedia).where(TweetMedia.media_id == media.id)) == 0
+    assert await count(select(Media).where(Media.id == media.id)) == 0
+    candidates = select(FollowCandidate.candidate_id, FollowCandidate.score).where(FollowCandidate.user_id == 2)
+    async with async_test_session() as session:
+        incremental = set((await session.execute(candidates)).all())
+    await FollowCandidateDAO.rebuild(async_session=test_db)
+    async with async_test_session() as session:
+        assert incremental == set((await session.execute(candidates)).all())
+    logger.info("OK")
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from app.config import logger, settings
+from app.invalidation import invalidation
+from app.snapshots import SnapshotStore, snapshots
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_snapshots(async_client, test_db, monkeypatch):
+    """Проверка, что повторный GET отдается из снимка, а любая запись делает снимки устаревшими."""
+    monkeypatch.setattr(settings, "SNAPSHOT_API_KEYS", ["test"])
+    headers = {"api-key": "test", "accept-encoding": "gzip"}
+    first = await async_client.get("/api/tweets", headers=headers)
+    assert "x-snapshot" not in first.headers
+    second = await async_client.get("/api/tweets", headers=headers)
+    assert second.headers["x-snapshot"] == "hit"
+    assert second.headers["content-encoding"] == "gzip"
+    assert second.json() == first.json()
+    plain = await async_client.get("/api/tweets", headers={"api-key": "test", "accept-encoding": "identity"})
+    assert plain.headers["x-snapshot"] == "hit"
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == first.json()
+    # Запись через API: следующий GET строится заново и видит новый твит
+    res = await async_client.post(
+        "/api/tweets", headers={"api-key": "test"}, json={"tweet_data": "снимок", "tweet_media_ids": []}
+    )
+    tweet_id = res.json()["tweet_id"]
+    third = await async_client.get("/api/tweets", headers=headers)
+    assert "x-snapshot" not in third.headers
+    assert tweet_id in {tweet["id"] for tweet in third.json()["tweets"]}
+    # Изменение из другого воркера приходит через шину инвалидации
+    assert (await async_client.get("/api/tweets", headers=headers)).headers["x-snapshot"] == "hit"
+    invalidation.dispatch_payload("tweets:1")
+    assert "x-snapshot" not in (await async_client.get("/api/tweets", headers=headers)).headers
+    # Ключи вне списка и ошибки не кэшируются
+    size = len(snapshots)
+    for _ in range(2):
+        other = await async_client.get("/api/tweets", headers={"api-key": "test2"})
+        assert "x-snapshot" not in other.headers
+    assert len(snapshots) == size
+    logger.info("OK")
+
+
+def test_snapshot_ttl():
+    """Проверка, что при чтении с реплик снимок устаревает по времени, даже если версия данных не менялась."""
+    store = SnapshotStore(max_entries=2, max_bytes=1024, ttl=0.05)
+    key = ("/api/tweets", b"", "test")
+    store.put(key, 1, 200, [], b"{}")
+    assert store.get(key, 1).body == b"{}"
+    time.sleep(0.06)
+    assert store.get(key, 1) is None
+    assert len(store) == 0
+    logger.info("OK")
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+from typing import Dict
+
+from app.config import logger
+
+# Бюджет на импорт app.main в миллисекундах (кумулятивное время по python -X importtime)
+IMPORT_BUDGET_MS = 2000
+# Модули для разработки, которые не должны загружаться вместе с приложением
+DEV_ONLY_MODULES = ("app.data_generate", "factory", "faker", "jinja2", "migrations_script", "uvicorn")
+
+project_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def import_times() -> Dict[str, int]:
+    """
+    Импортирует app.main в отдельном процессе и собирает время импорта модулей.
+
+    :return: Кумулятивное время импорта каждого модуля в микросекундах.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=project_root,
+        env={**os.environ, "PYTHONPATH": project_root},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    out = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                out[name.strip()] = int(cumulative)
+    return out
+
+
+def test_import_time_budget():
+    """Проверка, что импорт приложения укладывается в бюджет и не тянет модули для разработки."""
+    runs = [import_times() for _ in range(3)]
+    best_ms = min(run["app.main"] for run in runs) / 1000
+    logger.info(f"Импорт app.main: {best_ms:.0f} мс")
+    assert best_ms < IMPORT_BUDGET_MS
+    loaded = set(runs[0])
+    assert [module for module in DEV_ONLY_MODULES if module in loaded] == []
+    logger.info("ОК")
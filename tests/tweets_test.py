@@ -1,7 +1,18 @@
+import asyncio
+
 import pytest
+from sqlalchemy.exc import InvalidRequestError
 
-from app.config import logger
+from app.config import logger, settings
 from app.data_generate import TweetFactory
+from app.database import test_engine
+from app.events import EventBus, PgListener, feed_events, sse_stream
+from app.tweets import trending
+from app.tweets.dao import LikeDAO, TweetDAO
+from app.tweets.like_buffer import like_buffer
+from app.tweets.loader import DataLoader, FeedLoader
+from app.tweets.trending import TrendingBoard
+from app.users.dao import UserDAO
 
 
 @pytest.mark.asyncio(loop_scope="session")
@@ -78,10 +89,22 @@ async def test_like_tweet(async_client, test_db):
     res3 = await async_client.post(f"/api/tweets/{new_tweet.json()['tweet_id']}/likes", headers={"api-key": "test"})
     assert res3.status_code == 200
     assert res3.json()["result"] is True
+    # повторный лайк идемпотентен
+    res_repeat = await async_client.post(
+        f"/api/tweets/{new_tweet.json()['tweet_id']}/likes", headers={"api-key": "test"}
+    )
+    assert res_repeat.status_code == 200
+    assert res_repeat.json()["result"] is True
     res4 = await async_client.post("/api/tweets/10000/likes", headers={"api-key": "test"})
-    assert res4.status_code == 409
+    assert res4.status_code == 404
     assert res4.json()["result"] is False
-    await async_client.delete(f"/tweets/{tweet.id}")
+    # Удаленный твит лайкнуть нельзя ни сразу, ни через буфер отложенной записи
+    tweet_id = new_tweet.json()["tweet_id"]
+    await async_client.delete(f"/api/tweets/{tweet_id}", headers={"api-key": "test"})
+    assert (await async_client.post(f"/api/tweets/{tweet_id}/likes", headers={"api-key": "test"})).status_code == 404
+    assert await LikeDAO.add_or_ignore(async_session=test_db, user_id=2, tweet_id=tweet_id, like=True) is False
+    await LikeDAO.apply_batch(async_session=test_db, likes=[(2, tweet_id)], unlikes=[])
+    assert await LikeDAO.find_one_or_none(async_session=test_db, user_id=2, tweet_id=tweet_id) is None
     logger.info("OK")
 
 
@@ -125,3 +148,209 @@ async def test_get_user_tweets(async_client, test_db):
     assert res3.status_code == 200
     assert res3.json()["result"] is True
     logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_like_write_behind(async_client, test_db, monkeypatch):
+    """Тест отложенной записи лайков: слияние, чтение своих записей и сброс пачкой."""
+    monkeypatch.setattr(settings, "LIKES_WRITE_BEHIND", True)
+    headers = {"api-key": "test"}
+    tweet = TweetFactory()
+    new_tweet = await async_client.post("/api/tweets", headers=headers, json={"tweet_data": tweet.tweet_data})
+    tweet_id = new_tweet.json()["tweet_id"]
+    res = await async_client.post(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    assert res.json()["result"] is True
+    assert await LikeDAO.find_one_or_none(async_session=test_db, user_id=1, tweet_id=tweet_id) is None
+    feed = (await async_client.get("/api/tweets", headers=headers)).json()["tweets"]
+    assert [like["user_id"] for like in next(t for t in feed if t["id"] == tweet_id)["likes"]] == [1]
+    assert await like_buffer.flush(test_db) == 1
+    assert await LikeDAO.find_one_or_none(async_session=test_db, user_id=1, tweet_id=tweet_id) is not None
+    # События ленты публикуются, только если состояние пары меняется
+    events = []
+    feed_events.add_listener(events.append)
+    try:
+        await async_client.post(f"/api/tweets/{tweet_id}/likes", headers=headers)
+        await async_client.delete(f"/api/tweets/{tweet_id}/likes", headers=headers)
+        await async_client.delete(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    finally:
+        feed_events.remove_listener(events.append)
+    assert [event["liked"] for event in events if event["type"] == "like"] == [False]
+    await async_client.post(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    # лайк и отмена сливаются в одну операцию
+    like_buffer.push(2, tweet_id, True)
+    like_buffer.push(2, tweet_id, False)
+    await async_client.delete(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    like_buffer.push(3, 10000, True)
+    assert len(like_buffer) == 3
+    assert like_buffer.merge(tweet_id, [1]) == []
+    await like_buffer.flush(test_db)
+    assert len(like_buffer) == 0
+    assert await LikeDAO.find_all(async_session=test_db, tweet_id=tweet_id) == []
+    await async_client.delete(f"/api/tweets/{tweet_id}", headers=headers)
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_feed_loader(test_db):
+    """Проверка, что связи ленты грузятся пачками с кэшем, а неявная загрузка связей запрещена."""
+    calls = []
+
+    async def batch(keys):
+        calls.append(keys)
+        return {key: key * 10 for key in keys if key != 3}
+
+    loader = DataLoader(batch)
+    assert await loader.load_many([1, 2, 3, 2]) == {1: 10, 2: 20}
+    assert await loader.load_many([2, 3, 4]) == {2: 20, 4: 40}
+    assert calls == [[1, 2, 3], [4]]
+
+    tweets = await TweetDAO.find_all(async_session=test_db)
+    with pytest.raises(InvalidRequestError):
+        tweets[0].likes
+    feed = FeedLoader(test_db)
+    ids = [tweet.id for tweet in tweets]
+    likers = await feed.likers.load_many(ids)
+    likes = await LikeDAO.find_all(async_session=test_db)
+    assert sum(map(len, likers.values())) == len([like for like in likes if like.tweet_id in set(ids)])
+    attachments = await feed.attachments.load_many(ids)
+    assert set(attachments) == set(ids)
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_feed_events(async_client, test_db):
+    """Проверка, что создание, лайк и удаление твита публикуются в шину событий ленты."""
+    headers = {"api-key": "test"}
+    with feed_events.subscribe() as queue:
+        res = await async_client.post(
+            "/api/tweets", headers=headers, json={"tweet_data": "живой", "tweet_media_ids": []}
+        )
+        tweet_id = res.json()["tweet_id"]
+        await async_client.post(f"/api/tweets/{tweet_id}/likes", headers=headers)
+        await async_client.delete(f"/api/tweets/{tweet_id}/likes", headers=headers)
+        await async_client.delete(f"/api/tweets/{tweet_id}", headers=headers)
+        events = [queue.get_nowait() for _ in range(queue.qsize())]
+    assert [(event["type"], event.get("liked")) for event in events] == [
+        ("tweet_created", None),
+        ("like", True),
+        ("like", False),
+        ("tweet_deleted", None),
+    ]
+    assert {event["tweet_id"] for event in events} == {tweet_id}
+    assert len(feed_events) == 0
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_sse_stream():
+    """Проверка формата потока SSE, пустых сообщений и отключения медленного клиента."""
+    bus = EventBus("test_events", queue_size=2)
+    disconnected = False
+
+    async def is_disconnected() -> bool:
+        return disconnected
+
+    stream = sse_stream(bus, is_disconnected, heartbeat=0.01)
+    assert await anext(stream) == b"retry: 3000\n\n"
+    assert await anext(stream) == b": ping\n\n"
+    bus.dispatch({"type": "like", "tweet_id": 1})
+    assert await anext(stream) == b'event: like\ndata: {"type": "like", "tweet_id": 1}\n\n'
+    # Переполнение очереди: клиент отключается и после переподключения перечитает ленту
+    for i in range(3):
+        bus.dispatch({"type": "like", "tweet_id": i})
+    assert len(bus) == 0
+    with pytest.raises(StopAsyncIteration):
+        await anext(stream)
+    with bus.subscribe():
+        stream = sse_stream(bus, is_disconnected, heartbeat=1)
+        await anext(stream)
+        disconnected = True
+        with pytest.raises(StopAsyncIteration):
+            await anext(stream)
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_feed_events_pg_notify():
+    """Проверка рассылки событий между воркерами через Postgres LISTEN/NOTIFY."""
+    bus = EventBus("test_feed_events", queue_size=10)
+    bus.engine = test_engine
+    listener = PgListener(settings.get_test_db_url().replace("postgresql+asyncpg://", "postgresql://"))
+    listener.listen(bus.channel, bus.dispatch_payload)
+    task = asyncio.create_task(listener.run())
+    try:
+        await asyncio.wait_for(listener.connected.wait(), 5)
+        with bus.subscribe() as queue:
+            await bus.publish({"type": "tweet_deleted", "tweet_id": 42})
+            assert await asyncio.wait_for(queue.get(), 5) == {"type": "tweet_deleted", "tweet_id": 42}
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    assert not listener.connected.is_set()
+    logger.info("OK")
+
+
+def test_trending_board():
+    """Проверка инкрементального топа популярных твитов и рейтинга с затуханием."""
+    board = TrendingBoard(k=2)
+    board.load([(1, 10, 0, 5), (2, 10, 0, 3), (3, 20, 0, 1)])
+    assert board.top() == [(1, 5.0), (2, 3.0)]
+    assert board.top(20) == [(3, 1.0)]
+    # Твит вне топа обгоняет последнее место
+    for _ in range(3):
+        board.like(3, 1)
+    assert board.top() == [(1, 5.0), (3, 4.0)]
+    # Твит опускается ниже последнего места - топ пересчитывается
+    for _ in range(4):
+        board.like(1, -1)
+    assert board.top() == [(3, 4.0), (2, 3.0)]
+    board.apply({"type": "tweet_created", "tweet_id": 4, "user_id": 10})
+    board.apply({"type": "like", "tweet_id": 4, "liked": True})
+    assert board.top(10) == [(2, 3.0), (4, 1.0)]
+    board.apply({"type": "tweet_deleted", "tweet_id": 2})
+    assert board.top(10) == [(4, 1.0), (1, 1.0)]
+    assert len(board) == 3
+    # С затуханием свежий твит выше старого с тем же числом лайков
+    decayed = TrendingBoard(k=2, gravity=1.8)
+    decayed.load([(1, 10, 48 * 3600, 10), (2, 10, 0, 10)])
+    assert [tweet_id for tweet_id, _ in decayed.top()] == [2, 1]
+    # Лайк во время запроса к БД не теряется: снимок его не видел, событие применяется заново
+    board.start_load()
+    board.apply({"type": "like", "tweet_id": 4, "liked": True})
+    board.load([(1, 10, 0, 1), (4, 10, 0, 1)])
+    assert board.top(10) == [(4, 2.0), (1, 1.0)]
+    board.apply({"type": "like", "tweet_id": 1, "liked": True})
+    board.load([(1, 10, 0, 1)])
+    assert board.top() == [(1, 1.0)]
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_trending_tweets(async_client, test_db, monkeypatch):
+    """Проверка эндпоинта популярных твитов: загрузка из БД и обновление по лайкам."""
+    board = TrendingBoard(k=3)
+    monkeypatch.setattr(trending, "board", board)
+    board.load(await TweetDAO.popularity(async_session=test_db))
+    feed_events.add_listener(board.apply)
+    try:
+        res = await async_client.post(
+            "/api/tweets", headers={"api-key": "test"}, json={"tweet_data": "в топ", "tweet_media_ids": []}
+        )
+        tweet_id = res.json()["tweet_id"]
+        for user_id in range(2, 40):
+            user = await UserDAO.find_one_or_none_by_id(async_session=test_db, data_id=user_id)
+            if user is not None:
+                await async_client.post(f"/api/tweets/{tweet_id}/likes", headers={"api-key": user.api_key})
+    finally:
+        feed_events.remove_listener(board.apply)
+    res = await async_client.get("/api/tweets/trending", headers={"api-key": "test"})
+    assert res.status_code == 200
+    tweets = res.json()["tweets"]
+    assert tweets[0]["id"] == tweet_id
+    assert len(tweets) == 3
+    assert [tweet["score"] for tweet in tweets] == sorted((tweet["score"] for tweet in tweets), reverse=True)
+    assert tweets[0]["score"] == len(tweets[0]["likes"])
+    res = await async_client.get("/api/tweets/trending", headers={"api-key": "test"}, params={"author_id": 1})
+    assert {tweet["author"]["id"] for tweet in res.json()["tweets"]} == {1}
+    logger.info("OK")
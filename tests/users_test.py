@@ -1,8 +1,18 @@
+import asyncio
+import json
+import time
+from http.cookies import SimpleCookie
+
 import pytest
+from fastapi import Response
 
+from app import dependencies
 from app.config import logger
 from app.data_generate import UserFactory
-from app.users.dao import UserDAO
+from app.database import async_test_session
+from app.reaper import reap_once
+from app.users.dao import FollowCandidateDAO, FollowDAO, UserDAO
+from app.users.directory import UserDirectory, directory
 
 
 @pytest.mark.asyncio(loop_scope="session")
@@ -27,6 +37,24 @@ async def test_all_users(async_client, test_db):
     logger.info("OK")
 
 
+@pytest.mark.asyncio(loop_scope="session")
+async def test_all_users_paginated(async_client, test_db):
+    """Проверка keyset-пагинации и потоковой выгрузки пользователей."""
+    users_db = await UserDAO.find_rows(async_session=test_db, columns=("id", "api_key"))
+    page1 = await async_client.get("/api/all_users", params={"limit": 10})
+    assert page1.status_code == 200
+    assert [user["id"] for user in page1.json()] == [user.id for user in users_db[:10]]
+    after_id = page1.headers["X-Next-After-Id"]
+    page2 = await async_client.get("/api/all_users", params={"limit": 10, "after_id": after_id})
+    assert [user["id"] for user in page2.json()] == [user.id for user in users_db[10:20]]
+    stream = await async_client.get("/api/all_users", params={"stream": True})
+    assert stream.status_code == 200
+    assert stream.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in stream.text.splitlines()]
+    assert [user["api_key"] for user in lines] == [user.api_key for user in users_db]
+    logger.info("OK")
+
+
 @pytest.mark.asyncio(loop_scope="session")
 async def test_create_user(async_client):
     """Проверка создания пользователя."""
@@ -110,10 +138,10 @@ async def test_follow_user(async_client):
     res = await async_client.post("/api/users/5/follow", headers={"api-key": user.api_key})
     assert res.status_code == 201
     assert res.json() == {"result": True}
-    # #повтор
+    # повтор идемпотентен
     res2 = await async_client.post("/api/users/5/follow", headers={"api-key": user.api_key})
-    assert res2.status_code == 409
-    assert res2.json()["result"] is False
+    assert res2.status_code == 201
+    assert res2.json() == {"result": True}
     await async_client.delete("/api/users", headers={"api-key": user.api_key})
     logger.info("OK")
 
@@ -156,3 +184,140 @@ async def test_get_user_by_id(async_client, test_db):
     assert res2.status_code == 404
     assert res2.json()["result"] is False
     logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_user_followers_pages(async_client, test_db):
+    """Проверка счетчиков профиля и постраничных списков подписчиков и подписок."""
+    # Счетчики учитывают подписки удаленных пользователей, пока их не вычистит фоновая очистка
+    while any((await reap_once(async_test_session(), batch_size=1000)).values()):
+        pass
+    user = await UserDAO.find_one_or_none_by_id(async_session=test_db, data_id=4)
+    headers = {"api-key": user.api_key}
+    profile = (await async_client.get("/api/users/5", headers=headers)).json()["user"]
+    followers = (await async_client.get("/api/users/5/followers", headers=headers, params={"limit": 1000})).json()
+    following = (await async_client.get("/api/users/5/following", headers=headers, params={"limit": 1000})).json()
+    assert profile["followers_count"] == len(followers)
+    assert profile["following_count"] == len(following)
+    assert profile["followers"] == followers[: len(profile["followers"])]
+    if len(followers) > 1:
+        page = await async_client.get("/api/users/5/followers", headers=headers, params={"limit": 1})
+        assert page.json() == followers[:1]
+        next_page = await async_client.get(
+            "/api/users/5/followers",
+            headers=headers,
+            params={"limit": 1, "after_id": page.headers["X-Next-After-Id"]},
+        )
+        assert next_page.json() == followers[1:2]
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_recommendations(async_client, test_db):
+    """Проверка, что инкрементальный пересчет кандидатов совпадает с полным."""
+
+    async def candidates():
+        rows = await FollowCandidateDAO.find_rows(async_session=test_db, columns=("user_id", "candidate_id", "score"))
+        return {tuple(row) for row in rows}
+
+    await FollowCandidateDAO.rebuild(async_session=test_db)
+    user = await UserDAO.find_one_or_none_by_id(async_session=test_db, data_id=3)
+    headers = {"api-key": user.api_key}
+    for target in (7, 8):
+        await async_client.delete(f"/api/users/{target}/follow", headers=headers)
+        await async_client.post(f"/api/users/{target}/follow", headers=headers)
+    incremental = await candidates()
+    await FollowCandidateDAO.rebuild(async_session=test_db)
+    assert incremental == await candidates()
+    res = await async_client.get("/api/users/me/recommendations", headers=headers)
+    assert res.status_code == 200
+    users = res.json()["users"]
+    assert [user["score"] for user in users] == sorted((user["score"] for user in users), reverse=True)
+    assert {7, 8}.isdisjoint(user["id"] for user in users)
+    for target in (7, 8):
+        await async_client.delete(f"/api/users/{target}/follow", headers=headers)
+    incremental = await candidates()
+    await FollowCandidateDAO.rebuild(async_session=test_db)
+    assert incremental == await candidates()
+    # Одновременные подписки цепочкой A -> B -> C -> D не теряют пути друг друга
+    chain = [(90, 91), (91, 92), (92, 93)]
+    for user_id, follower_id in chain:
+        await FollowDAO.unfollow(async_session=async_test_session(), user_id=user_id, follower_id=follower_id)
+    await FollowCandidateDAO.rebuild(async_session=test_db)
+    await asyncio.gather(
+        *(
+            FollowDAO.follow(async_session=async_test_session(), user_id=user_id, follower_id=follower_id)
+            for user_id, follower_id in chain
+        )
+    )
+    incremental = await candidates()
+    await FollowCandidateDAO.rebuild(async_session=test_db)
+    assert incremental == await candidates()
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_read_replica_routing(async_client, test_db, monkeypatch):
+    """Проверка, что чтения уходят на реплику, а после записи пользователь читает с основной БД."""
+    monkeypatch.setattr(dependencies, "replica_sessions", [async_test_session])
+    monkeypatch.setattr(dependencies, "primary_pins", {})
+    user = await UserDAO.find_one_or_none_by_id(async_session=test_db, data_id=4)
+    res = await async_client.get("/api/users/me", headers={"api-key": user.api_key})
+    assert res.status_code == 200
+    assert res.json()["result"] is True
+
+    reads = dependencies.get_read_session(primary_session=test_db, api_key=user.api_key, pinned_until=None)
+    assert await reads.__anext__() is not test_db
+    await reads.aclose()
+    dependencies.pin_to_primary(user.api_key)
+    assert dependencies.is_pinned_to_primary(user.api_key)
+    assert not dependencies.is_pinned_to_primary("other")
+    reads = dependencies.get_read_session(primary_session=test_db, api_key=user.api_key, pinned_until=None)
+    assert await reads.__anext__() is test_db
+    await reads.aclose()
+    # Другой воркер закрепления в памяти не видит, но получает cookie, поставленную при записи
+    monkeypatch.setattr(dependencies, "primary_pins", {})
+    response = Response()
+    dependencies.pin_cookie(response)
+    cookie = SimpleCookie(response.headers["set-cookie"])[dependencies.PIN_COOKIE].value
+    assert dependencies.is_pinned_to_primary(user.api_key, cookie)
+    assert not dependencies.is_pinned_to_primary(user.api_key, None)
+    assert not dependencies.is_pinned_to_primary(user.api_key, str(time.time() + 3600))
+    assert not dependencies.is_pinned_to_primary(user.api_key, "garbage")
+    logger.info("OK")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_user_directory(async_client, test_db, monkeypatch):
+    """Проверка кэша имен: промахи одним запросом, лимит размера и сброс при обновлении профиля."""
+    calls = []
+    names = UserDAO.names
+
+    async def counted(async_session, user_ids):
+        calls.append(list(user_ids))
+        return await names(async_session=async_session, user_ids=user_ids)
+
+    monkeypatch.setattr(UserDAO, "names", counted)
+    cache = UserDirectory(max_entries=3)
+    first = await cache.get_many(test_db, [2, 3, 10**9])
+    assert calls == [[2, 3, 10**9]]
+    assert first == await names(async_session=test_db, user_ids=[2, 3])
+    assert await cache.get_many(test_db, [3, 2, 10**9]) == first
+    assert len(calls) == 1
+    await cache.get_many(test_db, [4])
+    assert len(cache) == 3
+    assert calls[-1] == [4]
+    # Вытеснен давнее всех запрошенный пользователь 3
+    await cache.get_many(test_db, [2, 3])
+    assert calls[-1] == [3]
+
+    # Обновление профиля через API сбрасывает запись в общем кэше
+    user = UserFactory()
+    await async_client.post("/api/users", params=user.to_dict())
+    created = await UserDAO.find_one_or_none(async_session=test_db, api_key=user.api_key)
+    assert await directory.get_many(test_db, [created.id]) == {created.id: created.first_name}
+    await async_client.put("/api/users", headers={"api-key": user.api_key}, params={"first_name": "Переименован"})
+    assert await directory.get_many(test_db, [created.id]) == {created.id: "Переименован"}
+    await async_client.delete("/api/users", headers={"api-key": user.api_key})
+    assert await directory.get_many(test_db, [created.id]) == {}
+    logger.info("OK")